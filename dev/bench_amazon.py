@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+# Micro-benchmarks for Amazon export ingestion. Run from the repo root:
+#   python dev/bench_amazon.py [num_rows]
+
+import io
+import sys
+import timeit
+
+from dateutil import parser
+
+from monarchmoneyamazontagger import amazon
+from monarchmoneyamazontagger.mockdata import order_history_csv, order_history_row
+
+
+def make_rows(num_rows):
+    # Roughly mimic a real export: a few items per order, a few orders per
+    # shipment timestamp.
+    rows = []
+    for i in range(num_rows):
+        order = i // 3
+        rows.append(
+            order_history_row(
+                **{
+                    "Order ID": f"111-{order:07d}-0000000",
+                    "Order Date": f"2023-{order % 12 + 1:02d}-{order % 28 + 1:02d}T19:21:{order % 60:02d}Z",
+                    "Ship Date": f"2023-{order % 12 + 1:02d}-{order % 28 + 1:02d}T23:01:{order % 60:02d}Z",
+                }
+            )
+        )
+    return rows
+
+
+def per_row_usec(fn, num_rows, repeat=3):
+    best = min(timeit.repeat(fn, number=1, repeat=repeat))
+    return best * 1e6 / num_rows
+
+
+def bench_dates(rows):
+    date_strs = [d for r in rows for d in (r["Order Date"], r["Ship Date"])]
+
+    def dateutil_parse():
+        for d in date_strs:
+            parser.parse(d)
+
+    def amazon_parse():
+        amazon._parse_amazon_timestamp.cache_clear()
+        for d in date_strs:
+            amazon.parse_amazon_date(d)
+
+    print("Date parsing (per row, order + ship date):")
+    print(f"  dateutil:          {per_row_usec(dateutil_parse, len(rows)):8.2f} us")
+    print(f"  parse_amazon_date: {per_row_usec(amazon_parse, len(rows)):8.2f} us")
+
+
+def bench_parse_csv(rows):
+    csv_bytes = order_history_csv(rows)
+
+    def parse():
+        amazon._parse_amazon_timestamp.cache_clear()
+        for _ in amazon.Item.parse_from_csv(io.BytesIO(csv_bytes)):
+            pass
+
+    print("Item.parse_from_csv (per row):")
+    print(f"  total:             {per_row_usec(parse, len(rows)):8.2f} us")
+
+
+def main():
+    num_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rows = make_rows(num_rows)
+    print(f"{num_rows} rows")
+    bench_dates(rows)
+    bench_parse_csv(rows)
+
+
+if __name__ == "__main__":
+    main()
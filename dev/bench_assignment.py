@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+# Benchmark for assignment.min_cost_matching. Run from the repo root:
+#   python dev/bench_assignment.py [num_nodes]
+
+import sys
+import time
+
+from monarchmoneyamazontagger.assignment import min_cost_matching
+
+
+def subscription_edges(num_nodes):
+    # Like a long history of a monthly subscription at the same price: each
+    # payment can pay for the next few shipments, but the cheapest choice of
+    # each is taken by the one before. All of it is one connected component.
+    return [
+        (left, right, right - left)
+        for left in range(num_nodes)
+        for right in range(left + 1, min(left + 4, num_nodes))
+    ]
+
+
+def main():
+    num_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    edges = subscription_edges(num_nodes)
+    start = time.perf_counter()
+    pairs = min_cost_matching(edges)
+    seconds = time.perf_counter() - start
+    print(f"{num_nodes} nodes, {len(edges)} edges: {len(pairs)} pairs")
+    print(f"  min_cost_matching: {seconds:8.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,7 @@ import oathtool
 import time
 from typing import Any, Dict, Optional, List
 
-from aiohttp import ClientSession
+from aiohttp import ClientSession, TCPConnector
 from aiohttp.client import DEFAULT_TIMEOUT
 import asyncio
 from gql import gql, Client
@@ -17,6 +17,7 @@ from graphql import DocumentNode
 AUTH_HEADER_KEY = "authorization"
 CSRF_KEY = "csrftoken"
 DEFAULT_RECORD_LIMIT = 100
+DEFAULT_CONNECTION_LIMIT = 8
 ERRORS_KEY = "error_code"
 SESSION_DIR = ".mm"
 SESSION_FILE = f"{SESSION_DIR}/mm_session.pickle"
@@ -52,6 +53,7 @@ class MonarchMoney(object):
         session_file: str = SESSION_FILE,
         timeout: int = 10,
         token: Optional[str] = None,
+        connection_limit: int = DEFAULT_CONNECTION_LIMIT,
     ) -> None:
         self._headers = {
             "Client-Platform": "web",
@@ -62,6 +64,35 @@ class MonarchMoney(object):
         self._session_file = session_file
         self._token = token
         self._timeout = timeout
+        self._connection_limit = connection_limit
+
+        # The GraphQL session shared by all calls (see _get_graphql_session).
+        self._gql_client: Optional[Client] = None
+        self._gql_session = None
+        self._gql_loop = None
+        self._gql_headers = None
+        self._gql_lock = None
+
+    async def __aenter__(self) -> "MonarchMoney":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """
+        Closes the pooled connections to Monarch Money. Later calls reconnect.
+        """
+        client = self._gql_client
+        loop = self._gql_loop
+        self._gql_client = None
+        self._gql_session = None
+        self._gql_loop = None
+        self._gql_headers = None
+        self._gql_lock = None
+        # Connections of another (finished) event loop cannot be closed here.
+        if client is not None and loop is asyncio.get_running_loop():
+            await client.close_async()
 
     @property
     def timeout(self) -> int:
@@ -667,6 +698,7 @@ class MonarchMoney(object):
         is_recurring: Optional[bool] = None,
         imported_from_mint: Optional[bool] = None,
         synced_from_institution: Optional[bool] = None,
+        transaction_fields: Optional[str] = None,
     ) -> Dict[str, Any]:
         """
         Gets transaction data from the account.
@@ -686,77 +718,94 @@ class MonarchMoney(object):
         :param is_recurring: a bool to filter for whether the transactions are recurring.
         :param imported_from_mint: a bool to filter for whether the transactions were imported from mint.
         :param synced_from_institution: a bool to filter for whether the transactions were synced from an institution.
-        """
-
-        query = gql(
+        :param transaction_fields: a GraphQL fragment named TransactionFields on Transaction, selecting the fields to return
+            instead of the default TransactionOverviewFields. The transaction rules are then not returned either.
+        """
+
+        if transaction_fields is not None:
+            query = gql(
+                """
+              query GetTransactionsList($offset: Int, $limit: Int, $filters: TransactionFilterInput, $orderBy: TransactionOrdering) {
+                allTransactions(filters: $filters) {
+                  totalCount
+                  results(offset: $offset, limit: $limit, orderBy: $orderBy) {
+                    ...TransactionFields
+                  }
+                }
+              }
             """
-          query GetTransactionsList($offset: Int, $limit: Int, $filters: TransactionFilterInput, $orderBy: TransactionOrdering) {
-            allTransactions(filters: $filters) {
-              totalCount
-              results(offset: $offset, limit: $limit, orderBy: $orderBy) {
+                + transaction_fields
+            )
+        else:
+            query = gql(
+                """
+              query GetTransactionsList($offset: Int, $limit: Int, $filters: TransactionFilterInput, $orderBy: TransactionOrdering) {
+                allTransactions(filters: $filters) {
+                  totalCount
+                  results(offset: $offset, limit: $limit, orderBy: $orderBy) {
+                    id
+                    ...TransactionOverviewFields
+                    __typename
+                  }
+                  __typename
+                }
+                transactionRules {
+                  id
+                  __typename
+                }
+              }
+    
+              fragment TransactionOverviewFields on Transaction {
                 id
-                ...TransactionOverviewFields
+                amount
+                pending
+                date
+                hideFromReports
+                plaidName
+                notes
+                isRecurring
+                reviewStatus
+                needsReview
+                attachments {
+                  id
+                  extension
+                  filename
+                  originalAssetUrl
+                  publicId
+                  sizeBytes
+                  __typename
+                }
+                isSplitTransaction
+                createdAt
+                updatedAt
+                category {
+                  id
+                  name
+                  icon
+                  __typename
+                }
+                merchant {
+                  name
+                  id
+                  transactionsCount
+                  __typename
+                }
+                account {
+                  id
+                  displayName
+                  __typename
+                }
+                tags {
+                  id
+                  name
+                  color
+                  order
+                  __typename
+                }
                 __typename
               }
-              __typename
-            }
-            transactionRules {
-              id
-              __typename
-            }
-          }
-    
-          fragment TransactionOverviewFields on Transaction {
-            id
-            amount
-            pending
-            date
-            hideFromReports
-            plaidName
-            notes
-            isRecurring
-            reviewStatus
-            needsReview
-            attachments {
-              id
-              extension
-              filename
-              originalAssetUrl
-              publicId
-              sizeBytes
-              __typename
-            }
-            isSplitTransaction
-            createdAt
-            updatedAt
-            category {
-              id
-              name
-              icon
-              __typename
-            }
-            merchant {
-              name
-              id
-              transactionsCount
-              __typename
-            }
-            account {
-              id
-              displayName
-              __typename
-            }
-            tags {
-              id
-              name
-              color
-              order
-              __typename
-            }
-            __typename
-          }
-        """
-        )
+            """
+            )
 
         variables = {
             "offset": offset,
@@ -1690,7 +1739,8 @@ class MonarchMoney(object):
         """
         Makes a GraphQL call to Monarch Money's API.
         """
-        return await self._get_graphql_client().execute_async(
+        session = await self._get_graphql_session()
+        return await session.execute(
             document=graphql_query, operation_name=operation, variable_values=variables
         )
 
@@ -1776,6 +1826,31 @@ class MonarchMoney(object):
                 self.set_token(response["token"])
                 self._headers["Authorization"] = f"Token {self._token}"
 
+    async def _get_graphql_session(self):
+        """
+        Returns the GraphQL session for this event loop, connecting if needed.
+
+        The session keeps up to connection_limit connections alive, so calls
+        after the first skip the TCP and TLS handshakes. A new session is made
+        after a login (new auth headers) or when running in another event loop.
+        """
+        loop = asyncio.get_running_loop()
+        if self._gql_loop is not loop:
+            await self.close()
+            self._gql_loop = loop
+            self._gql_lock = asyncio.Lock()
+        async with self._gql_lock:
+            if self._gql_session is not None and self._gql_headers != self._headers:
+                await self._gql_client.close_async()
+                self._gql_client = None
+                self._gql_session = None
+            if self._gql_session is None:
+                client = self._get_graphql_client()
+                self._gql_session = await client.connect_async(reconnecting=False)
+                self._gql_client = client
+                self._gql_headers = dict(self._headers)
+            return self._gql_session
+
     def _get_graphql_client(self) -> Client:
         """
         Creates a correctly configured GraphQL client for connecting to Monarch Money.
@@ -1786,8 +1861,11 @@ class MonarchMoney(object):
             )
         transport = AIOHTTPTransport(
             url=MonarchMoneyEndpoints.getGraphQL(),
-            headers=self._headers,
+            headers=dict(self._headers),
             timeout=self._timeout,
+            client_session_args={
+                "connector": TCPConnector(limit=self._connection_limit)
+            },
         )
         return Client(
             transport=transport,
@@ -3,11 +3,13 @@ import csv
 from datetime import datetime, timezone
 from typing import List, Optional
 from dateutil import parser
+import functools
 import io
 import logging
 from pprint import pformat
 import re
 import string
+import sys
 
 from monarchmoneyamazontagger import category
 from monarchmoneyamazontagger.micro_usd import MicroUSD, CENT_MICRO_USD, MICRO_USD_EPS
@@ -19,6 +21,11 @@ logger = logging.getLogger(__name__)
 PRINTABLE = set(string.printable)
 
 
+# Bump whenever Item's fields or parsing change; this invalidates any Items
+# cached by amazon_export.ExportCache.
+ITEM_SCHEMA_VERSION = 3
+
+
 ORDER_HISTORY_CSV_PATTERN = re.compile(
     r"Retail.OrderHistory.\d+/Retail.OrderHistory.\d+.csv"
 )
@@ -74,40 +81,114 @@ MULTI_SPLIT_BY_AND = set(
 )
 
 
+class _CountingReader(io.RawIOBase):
+    """Reads from stream, counting the bytes read so far."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.stream.read(len(buffer))
+        buffer[: len(data)] = data
+        self.bytes_read += len(data)
+        return len(data)
+
+
+def _stream_size(stream) -> int:
+    """Returns the number of bytes left in stream, or 0 if unknown."""
+    if not stream.seekable():
+        return 0
+    pos = stream.tell()
+    size = stream.seek(0, io.SEEK_END)
+    stream.seek(pos)
+    return size - pos
+
+
 def parse_from_csv_common(
-    cls, csv_file, progress_label="Parse from CSV", progress_factory=no_progress_factory
+    cls,
+    csv_file,
+    progress_label="Parse from CSV",
+    progress_factory=no_progress_factory,
+    row_filter=None,
+    total_bytes=None,
 ):
-    # contents = csv_file.read().decode()
-    contents = csv_file.read().decode("utf-8")
-    # Strip a leading FEFF if present.
-    if contents[0:1] == "\ufeff":
-        contents = contents[2:]
-
-    num_records = sum(1 for c in contents if c == "\n") - 1
-    result = []
-    if not num_records:
-        return result
-
-    progress = progress_factory(progress_label, num_records)
-    reader = csv.DictReader(io.StringIO(contents))
+    """Yields a cls for each row in csv_file, a binary file object.
+
+    The file is decoded and parsed incrementally, so memory use does not grow
+    with the size of the export. Rows rejected by row_filter.accepts_row are
+    skipped without being converted. Progress is in bytes read, out of
+    total_bytes (e.g. ZipInfo.file_size) or else the size of a seekable file.
+    """
+    if total_bytes is None:
+        total_bytes = _stream_size(csv_file)
+    counting_file = _CountingReader(csv_file)
+    # utf-8-sig strips a leading BOM (FEFF) if present.
+    text = io.TextIOWrapper(counting_file, encoding="utf-8-sig", newline="")
+    reader = csv.DictReader(text)
+    if not reader.fieldnames:
+        return
     # Convert input fieldnames into pythonic names. Feels somewhat naughty but works:
     reader.fieldnames = [
         fn.replace('"', "").replace(" ", "_").replace("&", "and").lower()
         for fn in reader.fieldnames
     ]
+
+    progress = progress_factory(progress_label, total_bytes)
+    reported_bytes = 0
     for csv_dict in reader:
-        result.append(cls(**csv_dict))
-        progress.next()
+        if not row_filter or row_filter.accepts_row(csv_dict):
+            yield cls(**csv_dict)
+        consumed_bytes = counting_file.bytes_read
+        if consumed_bytes > reported_bytes:
+            progress.next(consumed_bytes - reported_bytes)
+            reported_bytes = consumed_bytes
     progress.finish()
-    return result
 
 
 def parse_amazon_date(date_str: str) -> datetime | None:
     if not date_str or date_str == "Not Available":
         return None
+    return _parse_amazon_timestamp(date_str)
+
+
+# Items from the same order/shipment share timestamps, so memoize them.
+@functools.lru_cache(maxsize=1 << 16)
+def _parse_amazon_timestamp(date_str: str) -> datetime:
+    # Fast path for the fixed format used by the export: 2023-12-31T00:21:42Z
+    if (
+        len(date_str) == 20
+        and date_str[4] == "-"
+        and date_str[7] == "-"
+        and date_str[10] == "T"
+        and date_str[13] == ":"
+        and date_str[16] == ":"
+        and date_str[19] == "Z"
+    ):
+        try:
+            return datetime(
+                int(date_str[0:4]),
+                int(date_str[5:7]),
+                int(date_str[8:10]),
+                int(date_str[11:13]),
+                int(date_str[14:16]),
+                int(date_str[17:19]),
+                tzinfo=timezone.utc,
+            )
+        except ValueError:
+            pass
     return parser.parse(date_str)
 
 
+def parse_amazon_dates(dates_str: str) -> List[datetime]:
+    """Parses a multi-value date column, dropping any 'Not Available' values."""
+    dates = [parse_amazon_date(d) for d in dates_str.split(MULTI_VALUE_SPLIT)]
+    return [d for d in dates if d]
+
+
 def get_invoice_url(order_id: str) -> str:
     return (
         "https://www.amazon.com/gp/css/summary/print.html?ie=UTF8&"
@@ -119,6 +200,40 @@ def datetime_list_to_dates_str(dates: List[datetime]) -> str:
     return ", ".join([d.strftime("%Y-%m-%d") for d in dates])
 
 
+# Counts the changes to Items held by Charges. An Item can be in several
+# Charges at once (e.g. its own, and a merged one), so a change made through
+# one Charge must invalidate the aggregates of all of them.
+_items_generation = 0
+
+
+def items_changed():
+    """Invalidates the aggregates of every Charge.
+
+    Charge methods that change the items they hold call this; so must any
+    other code that changes an Item after it was put in a Charge.
+    """
+    global _items_generation
+    _items_generation += 1
+
+
+def _charge_aggregate(method):
+    """Caches a Charge aggregate of its items, until the items change (see
+    items_changed and Charge.set_items)."""
+    name = method.__name__
+
+    @functools.wraps(method)
+    def cached(self):
+        if self._generation != _items_generation:
+            self._aggregates.clear()
+            self._generation = _items_generation
+        aggregates = self._aggregates
+        if name not in aggregates:
+            aggregates[name] = method(self)
+        return aggregates[name]
+
+    return cached
+
+
 class Charge:
     """A Charge represents a set of items corresponding to one payment.
 
@@ -138,6 +253,8 @@ class Charge:
 
     def __init__(self, items):
         self.items = items
+        self._aggregates = {}
+        self._generation = _items_generation
 
     # def subtotal(self):
     #     return sum([i.amount_charged for i in self.items])
@@ -146,6 +263,7 @@ class Charge:
     # def sum_subtotals(charges):
     #     return sum([o.subtotal for o in charges])
 
+    @_charge_aggregate
     def has_hidden_shipping_fee(self):
         # Colorado - https://tax.colorado.gov/retail-delivery-fee
         # "Effective July 1, 2022, Colorado imposes a retail delivery fee on
@@ -172,6 +290,7 @@ class Charge:
     def hidden_shipping_fee_note(self) -> str:
         return "CO Retail Delivery Fee"
 
+    @_charge_aggregate
     def total_by_items(self):
         return (
             Item.sum_totals(self.items)
@@ -189,6 +308,8 @@ class Charge:
         # Make a new list (to prevent retaining the given list).
         self.items = []
         self.items.extend(items)
+        # Only self.items changed, not the items themselves.
+        self._aggregates.clear()
         self.items_matched = True
         for i in items:
             if assert_unmatched:
@@ -196,6 +317,7 @@ class Charge:
             i.matched = True
             i.charge = self
 
+    @_charge_aggregate
     def total_quantity(self):
         return sum([i.quantity for i in self.items])
 
@@ -214,8 +336,9 @@ class Charge:
     def ship_address(self):
         return self.items[0].shipping_address
 
+    @_charge_aggregate
     def payment_instrument_types(self):
-        return set([pit for i in self.items for pit in i.payment_instrument_type])
+        return frozenset([pit for i in self.items for pit in i.payment_instrument_type])
 
     def order_dates(self):
         return [date for items in self.items for date in items.order_date]
@@ -229,31 +352,43 @@ class Charge:
     def unique_ship_dates(self):
         return list(set([d.date() for d in self.ship_dates()]))
 
+    @_charge_aggregate
     def subtotal(self):
         return Item.sum_subtotals(self.items)
 
+    @_charge_aggregate
     def tax(self):
         return Item.sum_subtotals_tax(self.items)
 
+    @_charge_aggregate
     def total(self):
         """This should be = subtotal + tax."""
         return Item.sum_totals(self.items)
 
+    @_charge_aggregate
     def shipping_charge(self):
         return sum([i.shipping_charge for i in self.items])
 
+    @_charge_aggregate
     def total_discounts(self):
         return sum([i.total_discounts for i in self.items])
 
+    @_charge_aggregate
     def total_owed(self):
         """This should be = total + shipping_charge + total_discounts."""
         return sum([i.total_owed for i in self.items])
 
     def tracking_numbers(self):
-        return list(set([items.tracking for items in self.items]))
+        return list(
+            set([t for i in self.items for t in i.carrier_name_and_tracking_number])
+        )
 
+    @_charge_aggregate
     def transact_date(self):
-        """The latest ship date in local time zone."""
+        """The latest ship date in local time zone.
+
+        Cached, like the other aggregates: the time zone conversion is costly.
+        """
         dates = [d for i in self.items if i.ship_date for d in i.ship_date]
         if not dates:
             return None
@@ -265,6 +400,7 @@ class Charge:
         #
         #     return self.items[0].ship_date[0].astimezone().date()
 
+    @_charge_aggregate
     def transact_amount(self) -> MicroUSD:
         if self.has_hidden_shipping_fee():
             return -(self.total_owed() + self.hidden_shipping_fee()).round_to_cent()
@@ -278,6 +414,7 @@ class Charge:
         #     print(self)
         #     print(trans)
 
+    @_charge_aggregate
     def get_notes(self):
         note = (
             f"Amazon order id: {self.order_id()}\n"
@@ -325,6 +462,8 @@ class Charge:
                 self.items.append(adjustment)
                 adjustments += 1
 
+        if adjustments:
+            items_changed()
         return adjustments > 0
 
     def attribute_itemized_diff_to_shipping_error(self):
@@ -343,6 +482,8 @@ class Charge:
             if item_diff == i.shipping_charge:
                 i.shipping_charge = 0
                 adjustments += 1
+        if adjustments:
+            items_changed()
         return adjustments > 0
 
     def attribute_itemized_diff_to_item_fractional_tax(self):
@@ -359,6 +500,7 @@ class Charge:
             per_item_tax_adjustment = itemized_diff / self.total_quantity()
             for i in self.items:
                 i.unit_price_tax += per_item_tax_adjustment
+            items_changed()
             return True
         return False
 
@@ -465,6 +607,53 @@ def parse_optional(value: str) -> Optional[str]:
     return value
 
 
+def intern_optional(value: Optional[str]) -> Optional[str]:
+    """Interns value, a string that repeats across many rows."""
+    return sys.intern(value) if value is not None else None
+
+
+def parse_purchase_order_number(value: str) -> Optional[str]:
+    return None if value == "Not Applicable" else parse_optional(value)
+
+
+def parse_payment_instrument_types(value: str) -> List[str]:
+    return [sys.intern(pit) for pit in value.split(MULTI_VALUE_SPLIT)]
+
+
+def parse_multi_value(value: str) -> List[str]:
+    return value.split(MULTI_VALUE_SPLIT)
+
+
+class _LazyField:
+    """An Item field kept as its raw CSV string until first accessed.
+
+    The raw value lives in the "_<name>" slot; a bit in Item._undecoded
+    records whether it still needs decoding.
+    """
+
+    def __init__(self, decode):
+        self.decode = decode
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.slot = owner.__dict__[f"_{name}"]
+        self.bit = 1 << owner._LAZY_FIELDS.index(name)
+
+    def __get__(self, item, owner=None):
+        if item is None:
+            return self
+        value = self.slot.__get__(item, owner)
+        if item._undecoded & self.bit:
+            value = self.decode(value)
+            self.slot.__set__(item, value)
+            item._undecoded &= ~self.bit
+        return value
+
+    def __set__(self, item, value):
+        self.slot.__set__(item, value)
+        item._undecoded &= ~self.bit
+
+
 class Item:
     """A charge comprises of one or more Items with one or more quantity.
 
@@ -476,6 +665,56 @@ class Item:
     total_owed = shipment_item_total + shipping_charge + total_discounts
     """
 
+    # Fields not needed for matching. These are decoded on first access, as
+    # most Items never become part of an update.
+    _LAZY_FIELDS = (
+        "purchase_order_number",
+        "payment_instrument_type",
+        "carrier_name_and_tracking_number",
+        "gift_message",
+        "gift_sender_name",
+        "gift_recipient_contact_details",
+    )
+
+    # Items are held by the thousands; slots avoid a per-instance __dict__.
+    __slots__ = (
+        "website",
+        "order_id",
+        "order_date",
+        "_purchase_order_number",
+        "currency",
+        "unit_price",
+        "unit_price_tax",
+        "shipping_charge",
+        "total_discounts",
+        "total_owed",
+        "shipment_item_subtotal",
+        "shipment_item_subtotal_tax",
+        "asin",
+        "product_condition",
+        "quantity",
+        "_payment_instrument_type",
+        "order_status",
+        "shipment_status",
+        "ship_date",
+        "shipping_option",
+        "shipping_address",
+        "billing_address",
+        "_carrier_name_and_tracking_number",
+        "product_name",
+        "_gift_message",
+        "_gift_sender_name",
+        "_gift_recipient_contact_details",
+        # Bitmask of _LAZY_FIELDS still holding their raw CSV value.
+        "_undecoded",
+        # Not from the CSV export:
+        "matched",
+        "charge",
+        "category",
+        # Counts identical earlier rows of the order (see ledger.number_repeats).
+        "repeat",
+    )
+
     # Fields in order as they appear in CSV export
 
     website: str
@@ -506,6 +745,17 @@ class Item:
     gift_sender_name: Optional[str]
     gift_recipient_contact_details: Optional[str]
 
+    matched: bool
+    charge: Optional[Charge]
+    category: Optional[str]
+
+    purchase_order_number = _LazyField(parse_purchase_order_number)
+    payment_instrument_type = _LazyField(parse_payment_instrument_types)
+    carrier_name_and_tracking_number = _LazyField(parse_multi_value)
+    gift_message = _LazyField(parse_optional)
+    gift_sender_name = _LazyField(parse_optional)
+    gift_recipient_contact_details = _LazyField(parse_optional)
+
     def __init__(
         self,
         website,
@@ -536,19 +786,18 @@ class Item:
         gift_sender_name,
         gift_recipient_contact_details,
     ):
-        self.website = website
+        self._undecoded = (1 << len(self._LAZY_FIELDS)) - 1
+        self._purchase_order_number = purchase_order_number
+        self._payment_instrument_type = payment_instrument_type
+        self._carrier_name_and_tracking_number = carrier_name_and_tracking_number
+        self._gift_message = gift_message
+        self._gift_sender_name = gift_sender_name
+        self._gift_recipient_contact_details = gift_recipient_contact_details
+
+        self.website = sys.intern(website)
         self.order_id = order_id
-        self.order_date = [
-            parse_amazon_date(d)
-            for d in order_date.split(MULTI_VALUE_SPLIT)
-            if parse_amazon_date(d)
-        ]  # type: ignore
-        self.purchase_order_number = (
-            None
-            if purchase_order_number == "Not Applicable"
-            else parse_optional(purchase_order_number)
-        )
-        self.currency = currency
+        self.order_date = parse_amazon_dates(order_date)
+        self.currency = sys.intern(currency)
         self.unit_price = MicroUSD.parse(unit_price)
         self.unit_price_tax = MicroUSD.parse(unit_price_tax)
         self.shipping_charge = MicroUSD.parse(shipping_charge)
@@ -567,34 +816,35 @@ class Item:
             else None
         )
         self.asin = asin
-        self.product_condition = product_condition
+        self.product_condition = sys.intern(product_condition)
         self.quantity = int(quantity)
-        self.payment_instrument_type = payment_instrument_type.split(MULTI_VALUE_SPLIT)
-        self.order_status = order_status
-        self.shipment_status = parse_optional(shipment_status)
-        self.ship_date = []
-        for d in ship_date.split(MULTI_VALUE_SPLIT):
-            d = parse_optional(d)
-            if d:
-                parsed_date = parse_amazon_date(d)
-                self.ship_date.append(parsed_date)
-        self.shipping_option = shipping_option
-        self.shipping_address = shipping_address
-        self.billing_address = billing_address
-        self.carrier_name_and_tracking_number = carrier_name_and_tracking_number.split(
-            MULTI_VALUE_SPLIT
-        )
+        self.order_status = sys.intern(order_status)
+        self.shipment_status = intern_optional(parse_optional(shipment_status))
+        self.ship_date = parse_amazon_dates(ship_date)
+        self.shipping_option = sys.intern(shipping_option)
+        self.shipping_address = sys.intern(shipping_address)
+        self.billing_address = sys.intern(billing_address)
         self.product_name = product_name
-        self.gift_message = parse_optional(gift_message)
-        self.gift_sender_name = parse_optional(gift_sender_name)
-        self.gift_recipient_contact_details = parse_optional(
-            gift_recipient_contact_details
-        )
+        self.matched = False
+        self.charge = None
+        self.category = None
+        self.repeat = 0
 
     @classmethod
-    def parse_from_csv(cls, csv_file, progress_factory=no_progress_factory):
+    def parse_from_csv(
+        cls,
+        csv_file,
+        progress_factory=no_progress_factory,
+        item_filter=None,
+        total_bytes=None,
+    ):
         return parse_from_csv_common(
-            cls, csv_file, "Parsing Amazon Items", progress_factory
+            cls,
+            csv_file,
+            "Parsing Amazon Items",
+            progress_factory,
+            item_filter,
+            total_bytes,
         )
 
     @staticmethod
@@ -656,9 +906,33 @@ class Item:
     def get_title(self, target_length=100) -> str:
         return get_title(self, target_length)
 
+    def decode_all(self) -> None:
+        """Decodes any fields not yet accessed (see _LAZY_FIELDS)."""
+        for name in self._LAZY_FIELDS:
+            getattr(self, name)
+
     def is_cancelled(self) -> bool:
         return self.order_status == "Cancelled"
 
+    def latest_date(self) -> Optional[datetime]:
+        """The last ship date, or the order date if not yet shipped."""
+        dates = self.ship_date or self.order_date
+        return max(dates) if dates else None
+
+    def row_identity(self) -> tuple:
+        """Identifies the same CSV row across different (overlapping) exports."""
+        return (
+            self.order_id,
+            self.asin,
+            tuple(self.ship_date),
+            self.quantity,
+            self.unit_price.micro_usd,
+            self.unit_price_tax.micro_usd,
+            self.shipping_charge.micro_usd,
+            self.total_discounts.micro_usd,
+            self.total_owed.micro_usd,
+        )
+
     def __repr__(self):
         return (
             f"{self.quantity} of Item: "
@@ -677,6 +951,59 @@ class Item:
         )
 
 
+class ItemFilter:
+    """Selects the Items worth matching.
+
+    Only items that were charged are kept: from "Closed" orders, with a
+    non-zero quantity. If since and/or until are given, only items whose
+    latest activity (see Item.latest_date) falls within them are kept; items
+    without any date are always kept.
+
+    accepts_row evaluates the same predicates on a raw CSV row, so rejected
+    rows never become Items.
+    """
+
+    def __init__(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ):
+        self.since = since
+        self.until = until
+
+    def without_dates(self) -> "ItemFilter":
+        return ItemFilter()
+
+    def accepts_row(self, row: dict) -> bool:
+        if row["order_status"] != "Closed" or int(row["quantity"]) <= 0:
+            return False
+        if self.since is None and self.until is None:
+            return True
+        dates = parse_amazon_dates(row["ship_date"]) or parse_amazon_dates(
+            row["order_date"]
+        )
+        return self._accepts_date(max(dates) if dates else None)
+
+    def accepts(self, item: Item) -> bool:
+        return (
+            item.order_status == "Closed"
+            and item.quantity > 0
+            and self._accepts_date(item.latest_date())
+        )
+
+    def _accepts_date(self, date: Optional[datetime]) -> bool:
+        if date is None:
+            return True
+        if date.tzinfo is None:
+            # Parsed from an unusual format; taken as local time.
+            date = date.astimezone()
+        if self.since is not None and date < self.since:
+            return False
+        if self.until is not None and date > self.until:
+            return False
+        return True
+
+
 # class Refund:
 #     matched = False
 #     trans_id = None
@@ -0,0 +1,280 @@
+from collections import defaultdict
+from concurrent.futures import as_completed
+from datetime import datetime, timedelta
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+from typing import List, Optional, Tuple
+import zipfile
+
+from monarchmoneyamazontagger import amazon
+from monarchmoneyamazontagger.my_progress import no_progress_factory
+from monarchmoneyamazontagger.worker_pool import WorkerPool
+
+logger = logging.getLogger(__name__)
+
+# A (export zip path, order history CSV name within the zip) pair.
+Member = Tuple[str, str]
+
+
+class ExportParseError(Exception):
+    """An order history CSV within an Amazon export could not be parsed."""
+
+    def __init__(self, export_path: str, member: str, message: str):
+        super().__init__(export_path, member, message)
+        self.export_path = export_path
+        self.member = member
+        self.message = message
+
+    def __str__(self):
+        return f"{os.path.basename(self.export_path)}/{self.member}: {self.message}"
+
+
+class ExportCache:
+    """An on-disk cache of parsed Items, keyed by the content of a CSV member.
+
+    Entries are stamped with amazon.ITEM_SCHEMA_VERSION; entries written by a
+    different version are ignored (and overwritten).
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+
+    def get(self, digest: str) -> Optional[List[amazon.Item]]:
+        path = self._path(digest)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as cache_in:
+                entry = pickle.load(cache_in)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable Amazon export cache entry: {e}")
+            return None
+        if entry.get("version") != amazon.ITEM_SCHEMA_VERSION:
+            return None
+        return entry["items"]
+
+    def put(self, digest: str, items: List[amazon.Item]) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry = {"version": amazon.ITEM_SCHEMA_VERSION, "items": items}
+        # Write then rename, so readers never see a partial entry.
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as cache_out:
+                pickle.dump(entry, cache_out, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(digest))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, f"{digest}.pickle")
+
+
+def member_digest(zip_file: zipfile.ZipFile, member: str) -> str:
+    """Returns the sha256 of the (uncompressed) contents of member."""
+    digest = hashlib.sha256()
+    with zip_file.open(member) as member_file:
+        for chunk in iter(lambda: member_file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def find_order_history_csvs(export_path: str) -> List[str]:
+    with zipfile.ZipFile(export_path) as zip_file:
+        return [f for f in zip_file.namelist() if amazon.is_order_history_csv(f)]
+
+
+def parse_member(
+    export_path: str,
+    member: str,
+    progress_factory=no_progress_factory,
+    cache: Optional[ExportCache] = None,
+    item_filter: Optional[amazon.ItemFilter] = None,
+) -> List[amazon.Item]:
+    """Parses one order history CSV from an export zip.
+
+    Only Items accepted by item_filter are returned, if given. When a cache is
+    given, previously parsed members are loaded from it instead; cache entries
+    ignore the date window of item_filter, so they can be reused by runs with
+    a different window. Any error is re-raised as an ExportParseError naming
+    the member.
+    """
+    try:
+        with zipfile.ZipFile(export_path) as zip_file:
+            if not cache:
+                with zip_file.open(member) as csv_file:
+                    return list(
+                        amazon.Item.parse_from_csv(
+                            csv_file,
+                            progress_factory,
+                            item_filter,
+                            zip_file.getinfo(member).file_size,
+                        )
+                    )
+
+            digest = member_digest(zip_file, member)
+            cache_filter = None
+            if item_filter:
+                cache_filter = item_filter.without_dates()
+                digest += "-filtered"
+            items = cache.get(digest)
+            if items is None:
+                with zip_file.open(member) as csv_file:
+                    items = list(
+                        amazon.Item.parse_from_csv(
+                            csv_file,
+                            progress_factory,
+                            cache_filter,
+                            zip_file.getinfo(member).file_size,
+                        )
+                    )
+                cache.put(digest, items)
+            if item_filter:
+                items = [i for i in items if item_filter.accepts(i)]
+            return items
+    except Exception as e:
+        raise ExportParseError(export_path, member, f"{type(e).__name__}: {e}")
+
+
+def parse_members(
+    members: List[Member],
+    num_workers=None,
+    progress_factory=no_progress_factory,
+    cache: Optional[ExportCache] = None,
+    item_filter: Optional[amazon.ItemFilter] = None,
+    pool: Optional[WorkerPool] = None,
+) -> List[List[amazon.Item]]:
+    """Parses all members, in parallel when there is more than one.
+
+    Uses the processes of pool, or (without one) of a new pool of up to
+    num_workers. Returns the Items of each member, in the order of members
+    regardless of which worker finishes first.
+    """
+    if pool is None:
+        num_workers = min(num_workers or os.cpu_count() or 1, len(members))
+        with WorkerPool(num_workers) as pool:
+            return parse_members(
+                members, None, progress_factory, cache, item_filter, pool
+            )
+    if pool.workers_for(len(members)) <= 1:
+        return [
+            parse_member(export_path, member, progress_factory, cache, item_filter)
+            for export_path, member in members
+        ]
+
+    sizes = [_compressed_size(export_path, member) for export_path, member in members]
+    progress = progress_factory("Parsing Amazon Items", sum(sizes))
+    results = [None] * len(members)
+    future_to_index = {
+        pool.executor().submit(
+            parse_member,
+            export_path,
+            member,
+            no_progress_factory,
+            cache,
+            item_filter,
+        ): index
+        for index, (export_path, member) in enumerate(members)
+    }
+    try:
+        for future in as_completed(future_to_index):
+            index = future_to_index[future]
+            results[index] = future.result()
+            progress.next(sizes[index])
+    except BaseException:
+        for future in future_to_index:
+            future.cancel()
+        raise
+    progress.finish()
+    return results
+
+
+def merge_exports(
+    members: List[Member], member_items: List[List[amazon.Item]]
+) -> Tuple[List[amazon.Item], int]:
+    """Merges the Items of several, possibly overlapping, exports.
+
+    A row present in more than one export (see Item.row_identity) is only
+    kept from the newest export containing it: the one with the latest order
+    date, or the later argument on a tie. Repeats of a row within a single
+    export are kept as-is.
+
+    Returns the merged Items and the number of duplicate rows dropped.
+    """
+    export_items = defaultdict(list)
+    for (export_path, _), items in zip(members, member_items):
+        export_items[export_path].extend(items)
+    if len(export_items) <= 1:
+        return [i for items in member_items for i in items], 0
+
+    exports = list(export_items.items())
+
+    def freshness(export_index):
+        _, items = exports[export_index]
+        latest = max((d for i in items for d in i.order_date), default=None)
+        return (latest is not None, latest or datetime.min, export_index)
+
+    # Later (fresher) exports overwrite the owner of each identity.
+    identity_to_export = {}
+    for export_index in sorted(range(len(exports)), key=freshness):
+        export_path, items = exports[export_index]
+        for item in items:
+            identity_to_export[item.row_identity()] = export_path
+
+    merged = [
+        item
+        for export_path, items in export_items.items()
+        for item in items
+        if identity_to_export[item.row_identity()] == export_path
+    ]
+    return merged, sum(len(items) for items in export_items.values()) - len(merged)
+
+
+def load_high_water_mark(state_path: str) -> Optional[datetime]:
+    """Returns the latest Item activity seen by the last successful run."""
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path, "r") as state_in:
+        state = json.load(state_in)
+    high_water_mark = state.get("amazon_high_water_mark")
+    return datetime.fromisoformat(high_water_mark) if high_water_mark else None
+
+
+def save_high_water_mark(state_path: str, items: List[amazon.Item]) -> None:
+    """Records the latest activity of items, after a successful run."""
+    # Ship dates parsed from an unusual format may be naive (local time).
+    latest = max(
+        (i.latest_date().astimezone() for i in items if i.latest_date()),
+        default=None,
+    )
+    if not latest:
+        return
+    state = {}
+    if os.path.exists(state_path):
+        with open(state_path, "r") as state_in:
+            state = json.load(state_in)
+    state["amazon_high_water_mark"] = latest.isoformat()
+    os.makedirs(os.path.dirname(state_path) or ".", exist_ok=True)
+    with open(state_path, "w") as state_out:
+        json.dump(state, state_out)
+
+
+def since_high_water_mark(state_path: str, margin_days: int) -> Optional[datetime]:
+    """Returns the start of the window of Items not yet seen by a prior run.
+
+    The margin keeps charges that shipped shortly before the last run, whose
+    payment may not have posted yet at that time.
+    """
+    high_water_mark = load_high_water_mark(state_path)
+    if not high_water_mark:
+        return None
+    return high_water_mark - timedelta(days=margin_days)
+
+
+def _compressed_size(export_path: str, member: str) -> int:
+    with zipfile.ZipFile(export_path) as zip_file:
+        return zip_file.getinfo(member).compress_size
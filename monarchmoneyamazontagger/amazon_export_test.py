@@ -0,0 +1,226 @@
+from datetime import datetime, timezone
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+import zipfile
+
+from monarchmoneyamazontagger import amazon
+from monarchmoneyamazontagger import amazon_export
+from monarchmoneyamazontagger.mockdata import order_history_csv, order_history_row
+
+
+def write_export(dir_name, zip_name, members):
+    """Writes an export zip with members: a dict of CSV name -> order ids."""
+    path = os.path.join(dir_name, zip_name)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        for name, order_ids in members.items():
+            rows = [order_history_row(**{"Order ID": oid}) for oid in order_ids]
+            zip_file.writestr(name, order_history_csv(rows))
+    return path
+
+
+class ParseMembers(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.export_a = write_export(
+            self.tmp_dir.name,
+            "a.zip",
+            {
+                "Retail.OrderHistory.1/Retail.OrderHistory.1.csv": ["A1", "A2"],
+                "Retail.OrderHistory.2/Retail.OrderHistory.2.csv": ["A3"],
+                "Retail.CartItems.1/Retail.CartItems.1.csv": [],
+            },
+        )
+        self.export_b = write_export(
+            self.tmp_dir.name,
+            "b.zip",
+            {"Retail.OrderHistory.1/Retail.OrderHistory.1.csv": ["B1", "B2", "B3"]},
+        )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def members(self):
+        return [
+            (path, csv)
+            for path in (self.export_a, self.export_b)
+            for csv in amazon_export.find_order_history_csvs(path)
+        ]
+
+    def test_find_order_history_csvs(self):
+        self.assertEqual(
+            amazon_export.find_order_history_csvs(self.export_a),
+            [
+                "Retail.OrderHistory.1/Retail.OrderHistory.1.csv",
+                "Retail.OrderHistory.2/Retail.OrderHistory.2.csv",
+            ],
+        )
+
+    def test_parallel_matches_sequential_order(self):
+        expected = ["A1", "A2", "A3", "B1", "B2", "B3"]
+        for num_workers in (1, 2, 3):
+            member_items = amazon_export.parse_members(self.members(), num_workers)
+            self.assertEqual(
+                [i.order_id for items in member_items for i in items], expected
+            )
+
+    def test_error_names_member(self):
+        bad_export = os.path.join(self.tmp_dir.name, "bad.zip")
+        with zipfile.ZipFile(bad_export, "w") as zip_file:
+            zip_file.writestr(
+                "Retail.OrderHistory.3/Retail.OrderHistory.3.csv",
+                order_history_csv([order_history_row(**{"Quantity": "two"})]),
+            )
+        members = self.members() + [
+            (bad_export, "Retail.OrderHistory.3/Retail.OrderHistory.3.csv")
+        ]
+        for num_workers in (1, 2):
+            with self.assertRaises(amazon_export.ExportParseError) as cm:
+                amazon_export.parse_members(members, num_workers)
+            self.assertEqual(cm.exception.export_path, bad_export)
+            self.assertEqual(
+                cm.exception.member, "Retail.OrderHistory.3/Retail.OrderHistory.3.csv"
+            )
+            self.assertIn("bad.zip/Retail.OrderHistory.3", str(cm.exception))
+
+
+class MergeExports(unittest.TestCase):
+    def item(self, order_id, order_date="2014-02-26T19:21:42Z"):
+        row = order_history_row(
+            **{"Order ID": order_id, "Order Date": order_date, "Ship Date": ""}
+        )
+        csv_file = io.BytesIO(order_history_csv([row]))
+        return list(amazon.Item.parse_from_csv(csv_file))[0]
+
+    def test_single_export_keeps_repeats(self):
+        members = [("a.zip", "1.csv"), ("a.zip", "2.csv")]
+        items, dropped = amazon_export.merge_exports(
+            members, [[self.item("A")], [self.item("A")]]
+        )
+        self.assertEqual(len(items), 2)
+        self.assertEqual(dropped, 0)
+
+    def test_overlap_kept_from_newest_export(self):
+        older = [self.item("A"), self.item("B")]
+        newer = [self.item("B"), self.item("C", "2015-01-01T00:00:00Z")]
+        members = [("new.zip", "1.csv"), ("old.zip", "1.csv")]
+        items, dropped = amazon_export.merge_exports(members, [newer, older])
+        self.assertEqual(dropped, 1)
+        self.assertEqual([i.order_id for i in items], ["B", "C", "A"])
+        self.assertIs(items[0], newer[0])
+
+
+class HighWaterMark(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.state_path = os.path.join(self.tmp_dir.name, "state", "state.json")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def items(self, *ship_dates):
+        rows = [order_history_row(**{"Ship Date": d}) for d in ship_dates]
+        return list(amazon.Item.parse_from_csv(io.BytesIO(order_history_csv(rows))))
+
+    def test_round_trip(self):
+        self.assertIsNone(amazon_export.load_high_water_mark(self.state_path))
+        amazon_export.save_high_water_mark(
+            self.state_path, self.items("2020-01-05T00:00:00Z", "2020-03-01T00:00:00Z")
+        )
+        self.assertEqual(
+            amazon_export.load_high_water_mark(self.state_path),
+            datetime(2020, 3, 1, tzinfo=timezone.utc),
+        )
+
+    def test_naive_and_aware_dates(self):
+        # A date without a time zone (parsed by the fallback) is local time.
+        amazon_export.save_high_water_mark(
+            self.state_path, self.items("2020-03-02", "2020-01-05T00:00:00Z")
+        )
+        self.assertEqual(
+            amazon_export.load_high_water_mark(self.state_path),
+            datetime(2020, 3, 2).astimezone(),
+        )
+
+    def test_since_keeps_margin(self):
+        self.assertIsNone(amazon_export.since_high_water_mark(self.state_path, 10))
+        amazon_export.save_high_water_mark(
+            self.state_path, self.items("2020-03-01T00:00:00Z")
+        )
+        self.assertEqual(
+            amazon_export.since_high_water_mark(self.state_path, 10),
+            datetime(2020, 2, 20, tzinfo=timezone.utc),
+        )
+
+
+class ExportCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.export = write_export(
+            self.tmp_dir.name,
+            "a.zip",
+            {"Retail.OrderHistory.1/Retail.OrderHistory.1.csv": ["A1", "A2"]},
+        )
+        self.member = "Retail.OrderHistory.1/Retail.OrderHistory.1.csv"
+        self.cache = amazon_export.ExportCache(os.path.join(self.tmp_dir.name, "c"))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_warm_run_skips_parsing(self):
+        cold = amazon_export.parse_member(self.export, self.member, cache=self.cache)
+        with mock.patch.object(
+            amazon.Item, "parse_from_csv", side_effect=AssertionError("parsed")
+        ):
+            warm = amazon_export.parse_member(
+                self.export, self.member, cache=self.cache
+            )
+        self.assertEqual([i.order_id for i in warm], ["A1", "A2"])
+        self.assertEqual([i.ship_date for i in warm], [i.ship_date for i in cold])
+        self.assertEqual(warm[0].total_owed, cold[0].total_owed)
+
+    def test_filtered_entries_ignore_date_window(self):
+        window = amazon.ItemFilter(since=datetime(2030, 1, 1, tzinfo=timezone.utc))
+        self.assertEqual(
+            amazon_export.parse_member(
+                self.export, self.member, cache=self.cache, item_filter=window
+            ),
+            [],
+        )
+        with mock.patch.object(
+            amazon.Item, "parse_from_csv", side_effect=AssertionError("parsed")
+        ):
+            items = amazon_export.parse_member(
+                self.export,
+                self.member,
+                cache=self.cache,
+                item_filter=amazon.ItemFilter(),
+            )
+        self.assertEqual([i.order_id for i in items], ["A1", "A2"])
+
+    def test_same_content_shares_an_entry(self):
+        other_export = write_export(
+            self.tmp_dir.name,
+            "b.zip",
+            {"Retail.OrderHistory.9/Retail.OrderHistory.9.csv": ["A1", "A2"]},
+        )
+        with zipfile.ZipFile(self.export) as a, zipfile.ZipFile(other_export) as b:
+            self.assertEqual(
+                amazon_export.member_digest(a, self.member),
+                amazon_export.member_digest(
+                    b, "Retail.OrderHistory.9/Retail.OrderHistory.9.csv"
+                ),
+            )
+
+    def test_schema_version_invalidates(self):
+        self.cache.put("abc", ["cached"])
+        self.assertEqual(self.cache.get("abc"), ["cached"])
+        with mock.patch.object(amazon, "ITEM_SCHEMA_VERSION", -1):
+            self.assertIsNone(self.cache.get("abc"))
+        self.assertIsNone(self.cache.get("missing"))
+
+
+if __name__ == "__main__":
+    unittest.main()
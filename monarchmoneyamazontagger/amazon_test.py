@@ -1,3 +1,244 @@
+from datetime import datetime, timezone
+import io
+import unittest
+import zipfile
+
+from monarchmoneyamazontagger import amazon
+from monarchmoneyamazontagger.micro_usd import MicroUSD
+from monarchmoneyamazontagger.mockdata import item, order_history_csv, order_history_row
+
+
+class HelperMethods(unittest.TestCase):
+    def test_parse_amazon_date(self):
+        self.assertEqual(
+            amazon.parse_amazon_date("2023-12-31T00:21:42Z"),
+            datetime(2023, 12, 31, 0, 21, 42, tzinfo=timezone.utc),
+        )
+        self.assertIsNone(amazon.parse_amazon_date("Not Available"))
+        self.assertIsNone(amazon.parse_amazon_date(""))
+        # Other formats fall back to dateutil.
+        self.assertEqual(
+            amazon.parse_amazon_date("2023-12-31T00:21:42.5Z"),
+            datetime(2023, 12, 31, 0, 21, 42, 500000, tzinfo=timezone.utc),
+        )
+        self.assertEqual(amazon.parse_amazon_date("07/21/2010"), datetime(2010, 7, 21))
+
+    def test_parse_amazon_dates(self):
+        self.assertEqual(
+            amazon.parse_amazon_dates(
+                "2023-12-31T00:21:42Z and Not Available and 2024-01-02T10:00:00Z"
+            ),
+            [
+                datetime(2023, 12, 31, 0, 21, 42, tzinfo=timezone.utc),
+                datetime(2024, 1, 2, 10, tzinfo=timezone.utc),
+            ],
+        )
+        self.assertEqual(amazon.parse_amazon_dates("Not Available"), [])
+
+
+class ParseFromCsv(unittest.TestCase):
+    def test_empty(self):
+        self.assertEqual(list(amazon.Item.parse_from_csv(io.BytesIO(b""))), [])
+
+    def test_header_only(self):
+        csv_bytes = order_history_csv([])
+        self.assertEqual(list(amazon.Item.parse_from_csv(io.BytesIO(csv_bytes))), [])
+
+    def test_strips_bom(self):
+        for bom in (True, False):
+            csv_bytes = order_history_csv([order_history_row()], bom=bom)
+            items = list(amazon.Item.parse_from_csv(io.BytesIO(csv_bytes)))
+            self.assertEqual(len(items), 1)
+            self.assertEqual(items[0].website, "Amazon.com")
+            self.assertEqual(items[0].order_id, "123-3211232-7655671")
+
+    def test_yields_items_from_zip_with_progress(self):
+        rows = [order_history_row(**{"Order ID": f"111-{i}"}) for i in range(500)]
+        zip_bytes = io.BytesIO()
+        with zipfile.ZipFile(zip_bytes, "w", zipfile.ZIP_DEFLATED) as zip_file:
+            zip_file.writestr("orders.csv", order_history_csv(rows))
+
+        progress_bars = []
+
+        class FakeProgress:
+            def __init__(self, msg, max):
+                self.max = max
+                self.curr = 0
+                self.finished = False
+                progress_bars.append(self)
+
+            def next(self, i=1):
+                self.curr += i
+
+            def finish(self):
+                self.finished = True
+
+        with zipfile.ZipFile(zip_bytes) as zip_file:
+            file_size = zip_file.getinfo("orders.csv").file_size
+            with zip_file.open("orders.csv") as csv_file:
+                items = amazon.Item.parse_from_csv(
+                    csv_file, FakeProgress, total_bytes=file_size
+                )
+                self.assertEqual(next(items).order_id, "111-0")
+                self.assertEqual(len(list(items)), 499)
+
+        self.assertEqual(len(progress_bars), 1)
+        self.assertEqual(progress_bars[0].max, file_size)
+        self.assertEqual(progress_bars[0].curr, file_size)
+        self.assertTrue(progress_bars[0].finished)
+
+    def test_unseekable_stream(self):
+        csv_bytes = order_history_csv([order_history_row()])
+
+        class Unseekable(io.RawIOBase):
+            def __init__(self):
+                self.data = io.BytesIO(csv_bytes)
+
+            def readable(self):
+                return True
+
+            def readinto(self, buffer):
+                return self.data.readinto(buffer)
+
+            def tell(self):
+                raise OSError("not seekable")
+
+        items = list(amazon.Item.parse_from_csv(Unseekable()))
+        self.assertEqual(len(items), 1)
+
+
+class LazyFields(unittest.TestCase):
+    def item(self, **overrides):
+        csv_bytes = order_history_csv([order_history_row(**overrides)])
+        return next(amazon.Item.parse_from_csv(io.BytesIO(csv_bytes)))
+
+    def test_decoded_on_access(self):
+        item = self.item(
+            **{
+                "Purchase Order Number": "Not Applicable",
+                "Payment Instrument Type": "Visa - 1234 and Gift Certificate/Card",
+                "Carrier Name & Tracking Number": "UPS(1Z1) and USPS(92)",
+                "Gift Message": "Not Available",
+            }
+        )
+        self.assertEqual(item._undecoded, (1 << len(amazon.Item._LAZY_FIELDS)) - 1)
+        self.assertIsNone(item.purchase_order_number)
+        self.assertEqual(
+            item.payment_instrument_type, ["Visa - 1234", "Gift Certificate/Card"]
+        )
+        self.assertEqual(
+            item.carrier_name_and_tracking_number, ["UPS(1Z1)", "USPS(92)"]
+        )
+        self.assertIsNone(item.gift_message)
+        # Repeat access returns the decoded value as-is.
+        self.assertIs(item.payment_instrument_type, item.payment_instrument_type)
+
+    def test_assignment_skips_decoding(self):
+        item = self.item()
+        item.gift_message = "Not Available"
+        self.assertEqual(item.gift_message, "Not Available")
+
+    def test_decode_all(self):
+        item = self.item()
+        item.decode_all()
+        self.assertEqual(item._undecoded, 0)
+        self.assertEqual(
+            amazon.Charge([item]).tracking_numbers(), ["AMZN_US(TBA310866232294)"]
+        )
+
+
+class ChargeAggregates(unittest.TestCase):
+    def test_cached(self):
+        charge = amazon.Charge([item()])
+        self.assertIs(charge.transact_amount(), charge.transact_amount())
+        self.assertIs(charge.transact_date(), charge.transact_date())
+        charge.items[0].total_owed = MicroUSD.parse("1.00")
+        amazon.items_changed()
+        self.assertEqual(charge.total_owed(), MicroUSD.parse("1.00"))
+
+    def test_fixups_through_a_merged_charge(self):
+        a = amazon.Charge([item(**{"Total Owed": "13.95"})])
+        b = amazon.Charge([item(**{"Quantity": "1", "Total Owed": "5.45"})])
+        self.assertEqual(a.total_owed(), MicroUSD.parse("13.95"))
+        self.assertEqual(a.total_by_items(), MicroUSD.parse("11.95"))
+
+        merged = amazon.Charge.merge([a, b])
+        self.assertTrue(merged.attribute_subtotal_diff_to_misc_charge())
+        # a shares its item with merged, which moved the misc charge out of it.
+        self.assertEqual(a.total_owed(), MicroUSD.parse("11.95"))
+        self.assertEqual(a.total_by_items(), MicroUSD.parse("11.95"))
+
+    def test_set_items_invalidates(self):
+        charge = amazon.Charge([item()])
+        self.assertEqual(charge.total_quantity(), 2)
+        charge.set_items([item(), item(**{"Ship Date": "2014-03-01T12:00:00Z"})])
+        self.assertEqual(charge.total_quantity(), 4)
+        self.assertEqual(charge.total_owed(), MicroUSD.parse("23.90"))
+        self.assertEqual(charge.transact_date().isoformat(), "2014-03-01")
+
+    def test_attribute_invalidates(self):
+        charge = amazon.Charge([item(**{"Total Owed": "13.95"})])
+        self.assertEqual(charge.total_by_items(), MicroUSD.parse("11.95"))
+        self.assertTrue(charge.attribute_subtotal_diff_to_misc_charge())
+        self.assertEqual(len(charge.items), 2)
+        self.assertEqual(charge.total_by_items(), MicroUSD.parse("13.95"))
+        self.assertEqual(charge.total_owed(), MicroUSD.parse("13.95"))
+
+
+class ItemFilterTest(unittest.TestCase):
+    def rows(self):
+        return [
+            order_history_row(**{"Order ID": "closed"}),
+            order_history_row(**{"Order ID": "new", "Order Status": "New"}),
+            # Kept: the shipment status is not (yet) used to filter.
+            order_history_row(
+                **{"Order ID": "unshipped", "Shipment Status": "Not Available"}
+            ),
+            order_history_row(**{"Order ID": "zero", "Quantity": "0"}),
+            order_history_row(
+                **{"Order ID": "old", "Ship Date": "2010-01-01T00:00:00Z"}
+            ),
+            order_history_row(
+                **{
+                    "Order ID": "pending",
+                    "Order Date": "2010-01-01T00:00:00Z",
+                    "Ship Date": "Not Available",
+                }
+            ),
+        ]
+
+    def parse(self, item_filter=None):
+        csv_bytes = order_history_csv(self.rows())
+        return list(
+            amazon.Item.parse_from_csv(io.BytesIO(csv_bytes), item_filter=item_filter)
+        )
+
+    def test_charged_only(self):
+        item_filter = amazon.ItemFilter()
+        self.assertEqual(
+            [i.order_id for i in self.parse(item_filter)],
+            ["closed", "unshipped", "old", "pending"],
+        )
+        # Items and rows agree.
+        self.assertEqual(
+            [i.order_id for i in self.parse() if item_filter.accepts(i)],
+            ["closed", "unshipped", "old", "pending"],
+        )
+
+    def test_date_window(self):
+        item_filter = amazon.ItemFilter(
+            since=datetime(2014, 1, 1, tzinfo=timezone.utc),
+            until=datetime(2015, 1, 1, tzinfo=timezone.utc),
+        )
+        self.assertEqual(
+            [i.order_id for i in self.parse(item_filter)], ["closed", "unshipped"]
+        )
+        self.assertEqual(
+            [i.order_id for i in self.parse() if item_filter.accepts(i)],
+            ["closed", "unshipped"],
+        )
+
+
 # from datetime import datetime
 # import unittest
 
@@ -548,3 +789,7 @@
 
 # if __name__ == "__main__":
 #     unittest.main()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+from collections import Counter, defaultdict
+from typing import Dict, Generic, List, Tuple, TypeVar
+
+from monarchmoneyamazontagger.micro_usd import CENT_MICRO_USD, MICRO_USD_EPS, MicroUSD
+
+V = TypeVar("V")
+
+
+class AmountIndex(Generic[V]):
+    """A multimap from MicroUSD amounts to values.
+
+    Lookups find every value whose amount is equal to the query amount, as
+    per MicroUSD equality (within MICRO_USD_EPS). Amounts are bucketed by
+    whole cent; as MICRO_USD_EPS is well under a cent, a lookup probes at most
+    two buckets. Values are returned in insertion order.
+    """
+
+    def __init__(self):
+        # Cent bucket -> [(insertion order, micro_usd, value)]
+        self._buckets: Dict[int, List[Tuple[int, int, V]]] = defaultdict(list)
+        self._size = 0
+
+    def add(self, amount: MicroUSD, value: V) -> None:
+        micro_usd = amount.micro_usd
+        self._buckets[micro_usd // CENT_MICRO_USD].append(
+            (self._size, micro_usd, value)
+        )
+        self._size += 1
+
+    def get(self, amount: MicroUSD) -> List[V]:
+        micro_usd = amount.micro_usd
+        low = (micro_usd - MICRO_USD_EPS + 1) // CENT_MICRO_USD
+        high = (micro_usd + MICRO_USD_EPS - 1) // CENT_MICRO_USD
+        matches = [
+            entry
+            for bucket in range(low, high + 1)
+            if bucket in self._buckets
+            for entry in self._buckets[bucket]
+            if abs(entry[1] - micro_usd) < MICRO_USD_EPS
+        ]
+        if low != high:
+            matches.sort(key=lambda entry: entry[0])
+        return [value for _, _, value in matches]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def bucket_sizes(self) -> Counter:
+        """Number of cent buckets, by the number of values in them."""
+        return Counter(len(bucket) for bucket in self._buckets.values())
@@ -0,0 +1,55 @@
+import unittest
+
+from monarchmoneyamazontagger.amount_index import AmountIndex
+from monarchmoneyamazontagger.micro_usd import MicroUSD
+
+
+class AmountIndexTest(unittest.TestCase):
+    def test_empty(self):
+        index = AmountIndex()
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.get(MicroUSD(0)), [])
+
+    def test_exact_and_within_eps(self):
+        index = AmountIndex()
+        index.add(MicroUSD(-11950000), "a")
+        index.add(MicroUSD(-11950020), "b")
+        index.add(MicroUSD(-11960000), "c")
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.get(MicroUSD(-11950000)), ["a", "b"])
+        self.assertEqual(index.get(MicroUSD(-11950060)), ["b"])
+        self.assertEqual(index.get(MicroUSD(-11960000)), ["c"])
+        self.assertEqual(index.get(MicroUSD(11950000)), [])
+
+    def test_probes_neighboring_cents(self):
+        # 9.99999 and 10.00001 are equal MicroUSDs, but in different cents.
+        index = AmountIndex()
+        index.add(MicroUSD(10000010), "above")
+        index.add(MicroUSD(9999990), "below")
+        index.add(MicroUSD(10000005), "above again")
+        self.assertEqual(
+            index.get(MicroUSD(10000000)), ["above", "below", "above again"]
+        )
+        self.assertEqual(index.get(MicroUSD(9999950)), ["below"])
+        self.assertEqual(index.get(MicroUSD(-10000000)), [])
+
+    def test_consistent_with_micro_usd_equality(self):
+        amounts = [MicroUSD(m) for m in range(-20060, 20060, 7)]
+        index = AmountIndex()
+        for i, amount in enumerate(amounts):
+            index.add(amount, i)
+        for query in (MicroUSD(-20000), MicroUSD(-10), MicroUSD(0), MicroUSD(9975)):
+            self.assertEqual(
+                index.get(query),
+                [i for i, amount in enumerate(amounts) if amount == query],
+            )
+
+    def test_bucket_sizes(self):
+        index = AmountIndex()
+        for micro_usd in (-11950000, -11950020, -11960000, 5000000):
+            index.add(MicroUSD(micro_usd), None)
+        self.assertEqual(index.bucket_sizes(), {2: 1, 1: 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
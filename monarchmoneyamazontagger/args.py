@@ -1,8 +1,32 @@
 import argparse
+import datetime
 import os
 
 TAGGER_BASE_PATH = os.path.join(os.path.expanduser("~"), "MintAmazonTagger")
 
+# The names of tagger.MATCHERS and mmclient.TRANSACTION_FIELDS, for --matcher
+# and --mm_transaction_fields. They live here so parsing args does not import
+# the tagger or the Monarch Money client (and every pool worker with them).
+MATCHER_NAMES = (
+    "orig",
+    "orig_inverted",
+    "all_combo_singles",
+    "single_pass_singletons",
+    "single_pass_multi_combos",
+    "single_pass_all_combos",
+    "orig_with_shipment_merge1",
+    "orig_with_shipment_merge2",
+)
+DEFAULT_MATCHER = "orig_with_shipment_merge2"
+TRANSACTION_FIELDS_NAMES = ("full", "lean")
+
+
+def positive_int(value):
+    result = int(value)
+    if result < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {value}")
+    return result
+
 
 def get_name_to_help_dict(parser):
     return dict([(a.dest, a.help) for a in parser._actions])
@@ -112,15 +136,61 @@ def define_common_args(parser):
         ),
     )
 
+    parser.add_argument(
+        "--matcher",
+        choices=sorted(MATCHER_NAMES),
+        default=DEFAULT_MATCHER,
+        help=(
+            "The strategy for matching Amazon charges with transactions: which "
+            "charges are grouped together, and in what order single charges "
+            "and combinations of charges are matched."
+        ),
+    )
+    parser.add_argument(
+        "--compare_matchers",
+        action="store_true",
+        help=(
+            "Before matching, run every matcher on the same charges and "
+            "transactions and log a comparison of matches, conflicts, run time "
+            "and peak memory. Only --matcher is used for the actual updates."
+        ),
+    )
+    parser.add_argument(
+        "--match_stats",
+        action="store_true",
+        help=(
+            "Log, for each matching pass, the candidate charge groups, "
+            "combinations found or skipped, matches made and time taken."
+        ),
+    )
+    parser.add_argument(
+        "--match_stats_json",
+        default=None,
+        help=(
+            "Write the per-pass matching stats (see --match_stats) to this "
+            "file, as JSON. Implies --match_stats."
+        ),
+    )
+    parser.add_argument(
+        "--assignment_engine",
+        choices=["greedy", "optimal"],
+        default="greedy",
+        help=(
+            "How to pick between several charges a transaction could pay for. "
+            "greedy: in date order, each transaction takes the closest charge "
+            "still unmatched. optimal: matches as many transactions as "
+            "possible overall, then minimizes the days between shipping and "
+            "payment."
+        ),
+    )
     parser.add_argument(
         "--max_unmatched_charges_combinations",
         type=int,
         default=20,
         help=(
-            "Maximum number of charges to attempt to combinatorically match with "
-            "transactions. The current implementation is pretty memory intensive, "
-            "so setting this higher will potentially consume all available memory, "
-            "and cause the tagger to take a while."
+            "Maximum number of unmatched charges in one order to attempt to "
+            "match, in combination, with transactions. Orders with more "
+            "unmatched charges than this are only matched charge by charge."
         ),
     )
     # Tagging options:
@@ -143,6 +213,120 @@ def define_common_args(parser):
             "find items that you have manually changed categories for."
         ),
     )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=None,
+        help=(
+            "Number of worker processes used to parse Amazon Data Exports, "
+            "and to search orders with many charges for combinations "
+            "matching a transaction. Defaults to the number of CPUs. Use 1 to "
+            "do everything in this process."
+        ),
+    )
+    parser.add_argument(
+        "--cache_amazon_exports",
+        action="store_true",
+        default=False,
+        help=(
+            "Caches the parsed contents of each Amazon Data Export, so later "
+            "runs with the same export skip parsing it. The cache holds a copy "
+            "of your order history (including addresses), so it is off by "
+            "default to prevent storing sensitive information locally without "
+            "a user knowing it."
+        ),
+    )
+    default_cache_path = os.path.join(TAGGER_BASE_PATH, "Amazon Export Cache")
+    parser.add_argument(
+        "--amazon_cache_path",
+        type=str,
+        default=default_cache_path,
+        help="Where to store the Amazon Data Export cache.",
+    )
+    parser.add_argument(
+        "--since",
+        type=datetime.date.fromisoformat,
+        default=None,
+        help=(
+            "Only tag Amazon items shipped on or after this date (YYYY-MM-DD), "
+            "and only fetch Monarch Money transactions around that time. Items "
+            "up to --max_days_between_payment_and_shipping earlier are also "
+            "considered, for payments posting on or after this date."
+        ),
+    )
+    parser.add_argument(
+        "--until",
+        type=datetime.date.fromisoformat,
+        default=None,
+        help=(
+            "Only tag Amazon items shipped on or before this date (YYYY-MM-DD). "
+            "Monarch Money transactions up to "
+            "--max_days_between_payment_and_shipping later are fetched."
+        ),
+    )
+    parser.add_argument(
+        "--since_last_run",
+        action="store_true",
+        help=(
+            "Only process Amazon items shipped since the last successful run "
+            "(less --max_days_between_payment_and_shipping, for payments that "
+            "had not posted yet). Useful when re-running regularly with the "
+            "same, or overlapping, Amazon Data Exports."
+        ),
+    )
+    parser.add_argument(
+        "--tagger_state_path",
+        type=str,
+        default=os.path.join(TAGGER_BASE_PATH, "Tagger State.json"),
+        help="Where to store state from previous runs, used by --since_last_run.",
+    )
+    parser.add_argument(
+        "--match_ledger",
+        action="store_true",
+        default=False,
+        help=(
+            "Record the transactions and Amazon charges matched by each "
+            "successful run in a local database, and leave them out of later "
+            "runs, so each run only matches new activity. The ledger holds "
+            "transaction and order ids and amounts, so it is off by default."
+        ),
+    )
+    parser.add_argument(
+        "--match_ledger_path",
+        type=str,
+        default=os.path.join(TAGGER_BASE_PATH, "Match Ledger.sqlite"),
+        help="Where to store the match ledger (see --match_ledger).",
+    )
+    parser.add_argument(
+        "--rebuild_match_ledger",
+        action="store_true",
+        default=False,
+        help=(
+            "Clear the match ledger before this run, so the full history is "
+            "matched again and recorded anew."
+        ),
+    )
+    parser.add_argument(
+        "--invalidate_match_ledger_since",
+        type=datetime.date.fromisoformat,
+        default=None,
+        help=(
+            "Clear matches of transactions dated on or after this date "
+            "(YYYY-MM-DD) from the match ledger before this run, so they are "
+            "matched again."
+        ),
+    )
+    parser.add_argument(
+        "--partition_by_account",
+        action="store_true",
+        default=False,
+        help=(
+            "Match each Monarch Money account's transactions with the Amazon "
+            "charges paid by the cards previously matched to that account, "
+            "then match everything left over together. Learns from the "
+            "match ledger, so requires --match_ledger."
+        ),
+    )
     parser.add_argument(
         "--max_days_between_payment_and_shipping",
         type=int,
@@ -150,7 +334,8 @@ def define_common_args(parser):
         help=(
             "How many days are allowed to pass between when Amazon has "
             "shipped an order and when the payment has posted to your "
-            "bank account (as per Monarch Money's view)."
+            "bank account (as per Monarch Money's view). Also used as the "
+            "margin around --since, --until and --since_last_run."
         ),
     )
     parser.add_argument(
@@ -158,6 +343,31 @@ def define_common_args(parser):
         action="store_true",
         help=("Wait for Monarch Money to sync accounts immediately after login."),
     )
+    parser.add_argument(
+        "--mm_page_size",
+        type=positive_int,
+        default=100,
+        help="How many Monarch Money transactions to fetch per request.",
+    )
+    parser.add_argument(
+        "--mm_transaction_fields",
+        choices=TRANSACTION_FIELDS_NAMES,
+        default="lean",
+        help=(
+            "Which fields to fetch for each Monarch Money transaction. lean only "
+            "fetches what the tagger uses; full fetches everything Monarch Money "
+            "shows for a transaction (tags, attachments, etc)."
+        ),
+    )
+    parser.add_argument(
+        "--mm_fetch_concurrency",
+        type=positive_int,
+        default=4,
+        help=(
+            "How many requests for pages of Monarch Money transactions to have "
+            "in flight at once."
+        ),
+    )
     parser.add_argument(
         "--mm_account_ids",
         type=list,
@@ -178,6 +388,16 @@ def define_common_args(parser):
             "in the description field. Case-insensitive comma-separated."
         ),
     )
+    parser.add_argument(
+        "--mm_search_description_filter",
+        action="store_true",
+        help=(
+            "Ask Monarch Money for only the transactions found by searching for "
+            "each term of --mm_input_description_filter, instead of fetching "
+            "every transaction in the date range and filtering them locally. "
+            "Much less to download. Transactions are still filtered locally too."
+        ),
+    )
     parser.add_argument(
         "--mm_input_include_user_description",
         action="store_true",
@@ -188,20 +408,15 @@ def define_common_args(parser):
             "This is similar to --mm_input_include_inferred_description."
         ),
     )
-    # TODO(jprouty): Revisit if this is still accurate in the FIData message.
     parser.add_argument(
         "--mm_input_include_inferred_description",
         action="store_true",
         help=(
-            "Consider using the inferred description from Monarch Money's "
-            '"FinancialInstitutionData" when determining if '
-            "a transaction is an Amazon purchase. This may be necessary "
-            'when a bank renames transactions to "Debit card payment". '
-            'Monarch Money sometimes auto-recovers these into "Amazon", and flipping '
-            "this flag will help match these. To know if you should use it, "
-            "find a transaction in the Monarch Money tool, and click on the details. "
-            'Look for "Appears on your BANK ACCOUNT NAME statement as NOT '
-            'USEFUL NAME on DATE".'
+            "Consider using the merchant name Monarch Money inferred when "
+            "determining if a transaction is an Amazon purchase. This may be "
+            'necessary when a bank renames transactions to "Debit card payment". '
+            "Monarch Money keeps a single merchant name, which the user may "
+            "edit, so this is the same as --mm_input_include_user_description."
         ),
     )
     parser.add_argument(
@@ -242,6 +457,43 @@ def define_common_args(parser):
         default=default_json_path,
         help="Where to store the Monarch Money backup json files.",
     )
+    parser.add_argument(
+        "--mm_mirror",
+        action="store_true",
+        default=False,
+        help=(
+            "Keeps a local copy (a SQLite database) of your Monarch Money "
+            "transactions. Later runs only download recent transactions and "
+            "dates not yet in the mirror. Off by default to prevent storing "
+            "sensitive information locally without a user knowing it."
+        ),
+    )
+    parser.add_argument(
+        "--mm_mirror_path",
+        type=str,
+        default=os.path.join(TAGGER_BASE_PATH, "Monarch Money Mirror.sqlite"),
+        help="Where to store the transaction mirror of --mm_mirror.",
+    )
+    parser.add_argument(
+        "--mm_mirror_resync_days",
+        type=int,
+        default=14,
+        help=(
+            "Transactions dated up to this many days before the last sync of "
+            "the transaction mirror are downloaded again, as they may have "
+            "changed since (e.g. pending transactions)."
+        ),
+    )
+    parser.add_argument(
+        "--mm_mirror_offline",
+        action="store_true",
+        default=False,
+        help=(
+            "Do not fetch categories or transactions from Monarch Money. Use the "
+            "transaction mirror of --mm_mirror as is instead. If coupled with "
+            "--dry_run, no connection to Monarch Money is established."
+        ),
+    )
 
 
 def define_gui_args(parser):
@@ -0,0 +1,121 @@
+from collections import defaultdict
+import heapq
+from typing import Dict, Hashable, List, Tuple
+
+Edge = Tuple[Hashable, Hashable, int]
+
+
+def min_cost_matching(edges: List[Edge]) -> List[Tuple[Hashable, Hashable]]:
+    """Solves the assignment problem on a sparse bipartite graph.
+
+    edges are (left node, right node, cost) with non-negative integer costs.
+    Returns (left, right) pairs forming a matching that first has as many
+    pairs as possible, and then the lowest total cost among those.
+
+    The graph is split into connected components (typically small: edges
+    only join nodes of nearly the same amount and date), each solved with the
+    Hungarian method on the sparse graph. Results are deterministic for a
+    given edge order.
+    """
+    result = []
+    for component in _components(edges):
+        if len(component) == 1:
+            left, right, _ = component[0]
+            result.append((left, right))
+        else:
+            result.extend(_solve_component(component))
+    return result
+
+
+def _components(edges: List[Edge]) -> List[List[Edge]]:
+    parent: Dict[Tuple[int, Hashable], Tuple[int, Hashable]] = {}
+
+    def find(node):
+        parent.setdefault(node, node)
+        root = node
+        while parent[root] != root:
+            root = parent[root]
+        while parent[node] != root:
+            parent[node], node = root, parent[node]
+        return root
+
+    for left, right, _ in edges:
+        left_root, right_root = find((0, left)), find((1, right))
+        if left_root != right_root:
+            parent[right_root] = left_root
+
+    components = defaultdict(list)
+    for edge in edges:
+        components[find((0, edge[0]))].append(edge)
+    return list(components.values())
+
+
+def _solve_component(edges: List[Edge]) -> List[Tuple[Hashable, Hashable]]:
+    lefts = list(dict.fromkeys(left for left, _, _ in edges))
+    rights = list(dict.fromkeys(right for _, right, _ in edges))
+    left_index = {left: i for i, left in enumerate(lefts)}
+    right_index = {right: i for i, right in enumerate(rights)}
+    num_rights = len(rights)
+
+    # Each left also gets a private dummy right (num_rights + left), costing
+    # more than any set of real edges. Every left is then always matched, and
+    # a min-cost matching uses as few dummies (as many real pairs) as possible.
+    dummy_cost = (max(cost for _, _, cost in edges) + 1) * (len(lefts) + 1)
+    adjacent = [[(num_rights + i, dummy_cost)] for i in range(len(lefts))]
+    for left, right, cost in edges:
+        adjacent[left_index[left]].append((right_index[right], cost))
+
+    # Hungarian method, with shortest augmenting paths found by Dijkstra on
+    # reduced costs (cost - left_dual - right_dual, which stay non-negative).
+    left_dual = [0] * len(lefts)
+    right_dual = [0] * (num_rights + len(lefts))
+    left_match = [-1] * len(lefts)
+    right_match = [-1] * (num_rights + len(lefts))
+    for source in range(len(lefts)):
+        dist = {}
+        reached_from = {}
+        left_dist = {source: 0}
+        settled = []
+        heap = []
+
+        def relax(left, base):
+            for right, cost in adjacent[left]:
+                d = base + cost - left_dual[left] - right_dual[right]
+                if right not in dist or d < dist[right]:
+                    dist[right] = d
+                    reached_from[right] = left
+                    heapq.heappush(heap, (d, right))
+
+        relax(source, 0)
+        done = set()
+        while True:
+            d, right = heapq.heappop(heap)
+            if right in done or d > dist[right]:
+                continue
+            done.add(right)
+            settled.append(right)
+            if right_match[right] == -1:
+                break
+            left = right_match[right]
+            left_dist[left] = d
+            relax(left, d)
+
+        free_right = right
+        for right in settled:
+            right_dual[right] -= d - dist[right]
+        for left, ld in left_dist.items():
+            left_dual[left] += d - ld
+
+        right = free_right
+        while True:
+            left = reached_from[right]
+            left_match[left], right = right, left_match[left]
+            right_match[left_match[left]] = left
+            if left == source:
+                break
+
+    return [
+        (lefts[left], rights[right])
+        for left, right in enumerate(left_match)
+        if right < num_rights
+    ]
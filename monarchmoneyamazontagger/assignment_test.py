@@ -0,0 +1,68 @@
+import itertools
+import random
+import unittest
+
+from monarchmoneyamazontagger.assignment import min_cost_matching
+
+
+def brute_force(edges):
+    """Returns the (size, -cost) of the best matching, by enumeration."""
+    best = (0, 0)
+    for r in range(1, len(edges) + 1):
+        for subset in itertools.combinations(edges, r):
+            lefts = [e[0] for e in subset]
+            rights = [e[1] for e in subset]
+            if len(set(lefts)) == r and len(set(rights)) == r:
+                best = max(best, (r, -sum(e[2] for e in subset)))
+    return best
+
+
+class MinCostMatching(unittest.TestCase):
+    def test_empty(self):
+        self.assertEqual(min_cost_matching([]), [])
+
+    def test_prefers_more_pairs_over_lower_cost(self):
+        # Greedily taking the free a-x edge leaves b unmatched.
+        edges = [("a", "x", 0), ("a", "y", 3), ("b", "x", 3)]
+        self.assertCountEqual(min_cost_matching(edges), [("a", "y"), ("b", "x")])
+
+    def test_prefers_lower_cost(self):
+        edges = [("a", "x", 1), ("a", "y", 2), ("b", "x", 2), ("b", "y", 5)]
+        self.assertCountEqual(min_cost_matching(edges), [("a", "y"), ("b", "x")])
+
+    def test_matches_brute_force(self):
+        rng = random.Random(7)
+        for _ in range(100):
+            edges = list(
+                {
+                    (rng.randrange(5), rng.randrange(5)): rng.randrange(6)
+                    for _ in range(rng.randrange(1, 10))
+                }.items()
+            )
+            edges = [(left, right, cost) for (left, right), cost in edges]
+            cost_by_pair = {(left, right): cost for left, right, cost in edges}
+            pairs = min_cost_matching(edges)
+            self.assertEqual(len(set(p[0] for p in pairs)), len(pairs))
+            self.assertEqual(len(set(p[1] for p in pairs)), len(pairs))
+            self.assertEqual(
+                (len(pairs), -sum(cost_by_pair[p] for p in pairs)),
+                brute_force(edges),
+            )
+
+    def test_long_chain(self):
+        # Like a long history of a monthly subscription at the same price:
+        # each payment can pay for the next few shipments, but the cheapest
+        # choice of each is taken by the one before. For timings at scale,
+        # see dev/bench_assignment.py.
+        edges = [
+            (left, right, right - left)
+            for left in range(2000)
+            for right in range(left + 1, min(left + 4, 2000))
+        ]
+        pairs = min_cost_matching(edges)
+        self.assertEqual(len(pairs), 1999)
+        self.assertEqual(sum(right - left for left, right in pairs), 1999)
+
+
+if __name__ == "__main__":
+    unittest.main()
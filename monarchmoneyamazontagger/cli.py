@@ -10,6 +10,7 @@ import atexit
 from collections import defaultdict
 import getpass
 import logging
+import multiprocessing
 import os
 from signal import signal, SIGINT
 import time
@@ -32,6 +33,8 @@ logger = logging.getLogger(__name__)
 
 
 def main():
+    # Amazon export parsing uses a process pool; required for frozen builds.
+    multiprocessing.freeze_support()
     root_logger = logging.getLogger()
     root_logger.setLevel(logging.INFO)
     root_logger.addHandler(logging.StreamHandler())
@@ -120,6 +123,8 @@ def main():
 
     if not results.updates:
         logger.info("All done; no new tags to be updated at this point in time!")
+        if not args.dry_run:
+            tagger.record_successful_run(args, results.items, results.settled_trans)
         exit(0)
 
     if args.dry_run:
@@ -140,12 +145,18 @@ def main():
         )
 
         logger.info(f"Sent {num_updates} updates to Monarch Money")
+        tagger.record_successful_run(
+            args,
+            results.items,
+            results.settled_trans + [t for t, _ in results.updates],
+        )
 
 
 def maybe_prompt_for_credentials(args):
-    if not args.mm_email and not args.use_json_backup:
+    offline = args.use_json_backup or args.mm_mirror_offline
+    if not args.mm_email and not offline:
         args.mm_email = input("Money Monarch email: ")
-    if not args.mm_password and not args.use_json_backup:
+    if not args.mm_password and not offline:
         args.mm_password = getpass.getpass("Money Monarch password: ")
 
 
@@ -224,7 +235,7 @@ def log_processing_stats(stats):
         "Transactions with personalize categories: {personal_cat}\n"
         "\n"
         "Transactions to be retagged: {retag}\n"
-        "Transactions to be newly tagged: {new_tag}\n".format(**stats)
+        "Transactions to be newly tagged: {new_tag}\n".format_map(stats)
     )
 
 
@@ -0,0 +1,212 @@
+from collections import Counter
+from datetime import date, datetime, timezone
+import hashlib
+import logging
+import os
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Set
+
+from monarchmoneyamazontagger import amazon
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the tables change. A ledger with another version is cleared:
+# it only holds what later runs can match again.
+LEDGER_SCHEMA_VERSION = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    finished_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS matches (
+    trans_id TEXT NOT NULL,
+    trans_date TEXT NOT NULL,
+    trans_amount INTEGER NOT NULL,
+    account_id TEXT,
+    order_id TEXT NOT NULL,
+    charge_key TEXT NOT NULL,
+    charge_amount INTEGER NOT NULL,
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    PRIMARY KEY (trans_id, charge_key)
+);
+CREATE INDEX IF NOT EXISTS matches_by_trans_date ON matches(trans_date);
+CREATE TABLE IF NOT EXISTS matched_items (
+    item_key TEXT PRIMARY KEY,
+    charge_key TEXT NOT NULL,
+    trans_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS matched_items_by_trans_id ON matched_items(trans_id);
+CREATE TABLE IF NOT EXISTS match_instruments (
+    trans_id TEXT NOT NULL,
+    charge_key TEXT NOT NULL,
+    instrument TEXT NOT NULL,
+    PRIMARY KEY (trans_id, charge_key, instrument)
+);
+"""
+
+
+def _item_identity(item: amazon.Item) -> tuple:
+    # Unlike Item.row_identity, this leaves out the amounts that the Charge
+    # fix-ups (attribute_*) adjust, so it is the same before and after.
+    return (
+        item.order_id,
+        item.asin,
+        tuple(item.ship_date),
+        item.quantity,
+        item.unit_price.micro_usd,
+        item.product_name,
+    )
+
+
+def number_repeats(items: List[amazon.Item]) -> None:
+    """Sets Item.repeat, so rows that legitimately repeat in an export (e.g.
+    the same product bought twice in one shipment) get distinct item_keys.
+    items must be all the (merged) Items of the export(s), in their order.
+    """
+    seen = Counter()
+    for i in items:
+        identity = _item_identity(i)
+        i.repeat = seen[identity]
+        seen[identity] += 1
+
+
+def item_key(item: amazon.Item) -> str:
+    """Identifies an Item across runs and (overlapping) exports."""
+    identity = _item_identity(item) + (item.repeat,)
+    return hashlib.sha1(repr(identity).encode("utf-8")).hexdigest()
+
+
+def charge_key(charge: amazon.Charge) -> str:
+    """Identifies a Charge by its items, regardless of their order."""
+    digest = hashlib.sha1()
+    for key in sorted(item_key(i) for i in charge.items):
+        digest.update(key.encode("ascii"))
+    return digest.hexdigest()
+
+
+class MatchLedger:
+    """A SQLite record of the transactions and charges matched by prior runs.
+
+    Transactions and items in the ledger are settled: later runs leave them
+    out of matching, so a run only deals with new activity. Matches are
+    recorded after a successful run (see tagger.record_successful_run).
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        (version,) = self.conn.execute("PRAGMA user_version").fetchone()
+        if version != LEDGER_SCHEMA_VERSION:
+            if version:
+                logger.info("Match ledger format changed; starting a new one.")
+            with self.conn:
+                self.conn.executescript(
+                    "DROP TABLE IF EXISTS match_instruments;"
+                    "DROP TABLE IF EXISTS matched_items;"
+                    "DROP TABLE IF EXISTS matches;"
+                    "DROP TABLE IF EXISTS runs;"
+                )
+        with self.conn:
+            self.conn.executescript(_SCHEMA)
+            self.conn.execute(f"PRAGMA user_version = {LEDGER_SCHEMA_VERSION}")
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "MatchLedger":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def matched_trans_ids(self) -> Set[str]:
+        return set(
+            trans_id
+            for (trans_id,) in self.conn.execute(
+                "SELECT DISTINCT trans_id FROM matches"
+            )
+        )
+
+    def matched_item_keys(self) -> Set[str]:
+        return set(
+            key for (key,) in self.conn.execute("SELECT item_key FROM matched_items")
+        )
+
+    def instrument_accounts(self) -> Dict[str, str]:
+        """Returns payment instrument -> Monarch account id, learned from the
+        recorded matches. Instruments matched to several accounts (like gift
+        cards, used alongside different cards) are left out.
+        """
+        return dict(
+            self.conn.execute(
+                "SELECT instrument, MIN(account_id) FROM match_instruments "
+                "JOIN matches USING (trans_id, charge_key) "
+                "WHERE account_id IS NOT NULL "
+                "GROUP BY instrument HAVING COUNT(DISTINCT account_id) = 1"
+            )
+        )
+
+    def record(self, matched_trans: Iterable) -> Optional[int]:
+        """Records the charges of each matched transaction, as a new run.
+
+        Returns the run id, or None if there was nothing to record.
+        """
+        matched_trans = [t for t in matched_trans if t.charges]
+        if not matched_trans:
+            return None
+        with self.conn:
+            run_id = self.conn.execute(
+                "INSERT INTO runs (finished_at) VALUES (?)",
+                (datetime.now(timezone.utc).isoformat(),),
+            ).lastrowid
+            for t in matched_trans:
+                for c in t.charges:
+                    key = charge_key(c)
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO matches "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            t.id,
+                            t.date.isoformat(),
+                            t.amount.micro_usd,
+                            t.account.id if t.account else None,
+                            c.order_id(),
+                            key,
+                            c.transact_amount().micro_usd,
+                            run_id,
+                        ),
+                    )
+                    self.conn.executemany(
+                        "INSERT OR REPLACE INTO matched_items VALUES (?, ?, ?)",
+                        [(item_key(i), key, t.id) for i in c.items],
+                    )
+                    self.conn.executemany(
+                        "INSERT OR REPLACE INTO match_instruments VALUES (?, ?, ?)",
+                        [(t.id, key, pit) for pit in c.payment_instrument_types()],
+                    )
+        return run_id
+
+    def invalidate(self, since: Optional[date] = None) -> int:
+        """Forgets matches of transactions dated on or after since (or all).
+
+        Those transactions and their items are matched again on the next run.
+        Returns the number of transactions forgotten.
+        """
+        where, params = (
+            ("WHERE trans_date >= ?", (since.isoformat(),)) if since else ("", ())
+        )
+        with self.conn:
+            trans_ids = [
+                trans_id
+                for (trans_id,) in self.conn.execute(
+                    f"SELECT DISTINCT trans_id FROM matches {where}", params
+                )
+            ]
+            for table in ("matched_items", "match_instruments"):
+                self.conn.executemany(
+                    f"DELETE FROM {table} WHERE trans_id = ?",
+                    [(trans_id,) for trans_id in trans_ids],
+                )
+            self.conn.execute(f"DELETE FROM matches {where}", params)
+        return len(trans_ids)
@@ -0,0 +1,116 @@
+import datetime
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from monarchmoneyamazontagger import amazon
+from monarchmoneyamazontagger import ledger
+from monarchmoneyamazontagger.mockdata import item, transaction
+
+
+class MatchLedgerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "ledger", "Match Ledger.sqlite")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def matched(self, trans_id, date, order_id):
+        charge = amazon.Charge([item(**{"Order ID": order_id})])
+        t = transaction(id=trans_id, date=date)
+        t.match([charge])
+        return t
+
+    def test_record_and_load(self):
+        t1 = self.matched("1", "2014-02-28", "A")
+        t2 = self.matched("2", "2014-03-05", "B")
+        unmatched = transaction(id="3")
+        with ledger.MatchLedger(self.path) as match_ledger:
+            self.assertEqual(match_ledger.matched_trans_ids(), set())
+            self.assertEqual(match_ledger.record([t1, t2, unmatched]), 1)
+            self.assertIsNone(match_ledger.record([unmatched]))
+
+        with ledger.MatchLedger(self.path) as match_ledger:
+            self.assertEqual(match_ledger.matched_trans_ids(), {"1", "2"})
+            self.assertEqual(
+                match_ledger.matched_item_keys(),
+                {ledger.item_key(t.charges[0].items[0]) for t in (t1, t2)},
+            )
+
+    def test_item_key_ignores_fixups(self):
+        charge = amazon.Charge([item(**{"Total Owed": "13.95"})])
+        before = ledger.item_key(charge.items[0])
+        self.assertTrue(charge.attribute_subtotal_diff_to_misc_charge())
+        self.assertEqual(ledger.item_key(charge.items[0]), before)
+        self.assertNotEqual(ledger.item_key(item(**{"Order ID": "other"})), before)
+
+    def test_item_key_tells_repeated_rows_apart(self):
+        items = [item(), item(**{"Order ID": "other"}), item()]
+        self.assertEqual(ledger.item_key(items[0]), ledger.item_key(items[2]))
+        ledger.number_repeats(items)
+        self.assertEqual([i.repeat for i in items], [0, 0, 1])
+        self.assertNotEqual(ledger.item_key(items[0]), ledger.item_key(items[2]))
+
+        # Settling one of the repeats leaves the other to match.
+        t = transaction(id="1")
+        t.match([amazon.Charge([items[0]])])
+        with ledger.MatchLedger(self.path) as match_ledger:
+            match_ledger.record([t])
+            settled = match_ledger.matched_item_keys()
+        self.assertIn(ledger.item_key(items[0]), settled)
+        self.assertNotIn(ledger.item_key(items[2]), settled)
+
+    def test_instrument_accounts(self):
+        def matched(trans_id, instrument, account_id):
+            charge = amazon.Charge(
+                [item(**{"Order ID": trans_id, "Payment Instrument Type": instrument})]
+            )
+            t = transaction(
+                id=trans_id, account={"id": account_id, "displayName": account_id}
+            )
+            t.match([charge])
+            return t
+
+        with ledger.MatchLedger(self.path) as match_ledger:
+            match_ledger.record(
+                [
+                    matched("1", "Visa - 1234", "visa"),
+                    matched("2", "Visa - 1234", "visa"),
+                    matched("3", "Amex - 1111 and Gift Certificate/Card", "amex"),
+                    matched("4", "Visa - 1234 and Gift Certificate/Card", "visa"),
+                ]
+            )
+            self.assertEqual(
+                match_ledger.instrument_accounts(),
+                {"Visa - 1234": "visa", "Amex - 1111": "amex"},
+            )
+
+    def test_invalidate(self):
+        with ledger.MatchLedger(self.path) as match_ledger:
+            match_ledger.record(
+                [
+                    self.matched("1", "2014-02-28", "A"),
+                    self.matched("2", "2014-03-05", "B"),
+                ]
+            )
+            self.assertEqual(match_ledger.invalidate(datetime.date(2014, 3, 1)), 1)
+            self.assertEqual(match_ledger.matched_trans_ids(), {"1"})
+            self.assertEqual(len(match_ledger.matched_item_keys()), 1)
+            self.assertEqual(match_ledger.invalidate(), 1)
+            self.assertEqual(match_ledger.matched_trans_ids(), set())
+            self.assertEqual(match_ledger.matched_item_keys(), set())
+
+    def test_other_schema_version_is_cleared(self):
+        with ledger.MatchLedger(self.path) as match_ledger:
+            match_ledger.record([self.matched("1", "2014-02-28", "A")])
+        conn = sqlite3.connect(self.path)
+        conn.execute(f"PRAGMA user_version = {ledger.LEDGER_SCHEMA_VERSION + 1}")
+        conn.close()
+        with ledger.MatchLedger(self.path) as match_ledger:
+            self.assertEqual(match_ledger.matched_trans_ids(), set())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,6 +10,7 @@ import atexit
 import datetime
 from functools import partial
 import logging
+import multiprocessing
 import os
 from signal import signal, SIGINT
 import sys
@@ -159,6 +160,12 @@ class TaggerGui:
             self.create_line_label("Description Filter", "mm_input_description_filter"),
             self.create_line_edit("mm_input_description_filter"),
         )
+        mm_layout.addRow(
+            self.create_line_label(
+                "Search by description filter", "mm_search_description_filter"
+            ),
+            self.create_checkbox("mm_search_description_filter"),
+        )
         mm_layout.addRow(
             self.create_line_label(
                 "Include user description", "mm_input_include_user_description"
@@ -716,6 +723,8 @@ class TaggerWorker(QObject):
         )
 
         if results.success and not self.stopping:
+            self.items = results.items
+            self.settled_trans = results.settled_trans
             self.on_review_ready.emit(results)
 
     def do_send_updates(self, updates, args):
@@ -726,10 +735,15 @@ class TaggerWorker(QObject):
             ),
             ignore_category=args.no_tag_categories,
         )
+        tagger.record_successful_run(
+            args, self.items, self.settled_trans + [t for t, _ in updates]
+        )
         self.on_updates_sent.emit(num_updates)
 
 
 def main():
+    # Amazon export parsing uses a process pool; required for frozen builds.
+    multiprocessing.freeze_support()
     root_logger = logging.getLogger()
     root_logger.setLevel(logging.INFO)
     root_logger.addHandler(logging.StreamHandler())
@@ -0,0 +1,89 @@
+from collections import Counter
+from contextlib import contextmanager
+import time
+from typing import Any, Dict, List
+
+
+class MatchStats:
+    """Records what each pass of a matcher (see tagger.MATCHERS) did.
+
+    Matchers wrap each pass in measure(), and hand the candidate index they
+    built (a tagger.ChargeGroupIndex) to the function it yields. Per pass,
+    this records the candidate groups, the combinations found and the orders
+    left out by --max_unmatched_charges_combinations, how many groups share an
+    amount, the transactions matched and the time taken.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.passes: List[Dict[str, Any]] = []
+
+    @contextmanager
+    def measure(self, name, unmatched_trans):
+        matched_before = len([t for t in unmatched_trans if t.charges])
+        indexes = []
+        start = time.perf_counter()
+        yield indexes.append
+        seconds = time.perf_counter() - start
+
+        bucket_sizes = Counter()
+        for index in indexes:
+            bucket_sizes.update(index.bucket_sizes())
+        self.passes.append(
+            {
+                "name": name,
+                "candidate_groups": sum(index.num_groups() for index in indexes),
+                "combinations": sum(index.combinations for index in indexes),
+                "orders_over_cap": sum(index.orders_over_cap for index in indexes),
+                "charges_over_cap": sum(index.charges_over_cap for index in indexes),
+                # Number of amount buckets, by how many groups are in them.
+                "bucket_sizes": dict(sorted(bucket_sizes.items())),
+                "matches": len([t for t in unmatched_trans if t.charges])
+                - matched_before,
+                "seconds": seconds,
+            }
+        )
+
+    def counter(self) -> Counter:
+        """Totals per pass name, as stats keys (e.g. singles_matches)."""
+        result = Counter()
+        for p in self.passes:
+            for field, value in p.items():
+                if field not in ("name", "bucket_sizes"):
+                    result[f"{p['name']}_{field}"] += value
+        return result
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"passes": self.passes}
+
+
+class NoMatchStats:
+    """The MatchStats stand-in when not instrumenting; records nothing."""
+
+    enabled = False
+
+    def measure(self, name, unmatched_trans):
+        return _NO_PASS
+
+    def counter(self) -> Counter:
+        return Counter()
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"passes": []}
+
+
+class _NoPass:
+    def __enter__(self):
+        return _ignore
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+def _ignore(index):
+    pass
+
+
+_NO_PASS = _NoPass()
+NO_MATCH_STATS = NoMatchStats()
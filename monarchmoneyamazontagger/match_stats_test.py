@@ -0,0 +1,76 @@
+import argparse
+import json
+import unittest
+
+from monarchmoneyamazontagger import amazon
+from monarchmoneyamazontagger import tagger
+from monarchmoneyamazontagger.match_stats import MatchStats, NO_MATCH_STATS
+from monarchmoneyamazontagger.mockdata import item, transaction
+from monarchmoneyamazontagger.args import define_common_args
+
+
+def parse_args(*argv):
+    parser = argparse.ArgumentParser()
+    define_common_args(parser)
+    return parser.parse_args(argv)
+
+
+class MatchStatsTest(unittest.TestCase):
+    def match(self, match_stats, *argv):
+        charges = [
+            amazon.Charge([item(**{"Order ID": "A"})]),
+            amazon.Charge([item(**{"Order ID": "B", "Total Owed": "5.00"})]),
+            amazon.Charge([item(**{"Order ID": "B", "Total Owed": "7.50"})]),
+        ]
+        trans = [
+            transaction(id="1", amount=-11.95),
+            transaction(id="2", amount=-12.50),
+        ]
+        tagger.match_transactions_orig(
+            trans, charges, parse_args(*argv), match_stats=match_stats
+        )
+        return trans
+
+    def test_per_pass(self):
+        match_stats = MatchStats()
+        self.match(match_stats)
+
+        singles, combos = match_stats.passes
+        self.assertEqual(singles["name"], "singles")
+        self.assertEqual(singles["candidate_groups"], 3)
+        self.assertEqual(singles["bucket_sizes"], {1: 3})
+        self.assertEqual(singles["matches"], 1)
+        self.assertEqual(combos["name"], "combos")
+        self.assertEqual(combos["candidate_groups"], 1)
+        self.assertEqual(combos["combinations"], 1)
+        self.assertEqual(combos["orders_over_cap"], 0)
+        self.assertEqual(combos["matches"], 1)
+        self.assertGreaterEqual(combos["seconds"], 0)
+
+        counter = match_stats.counter()
+        self.assertEqual(counter["singles_matches"], 1)
+        self.assertEqual(counter["combos_combinations"], 1)
+        self.assertNotIn("singles_bucket_sizes", counter)
+        self.assertEqual(
+            json.loads(json.dumps(match_stats.to_json()))["passes"][1]["matches"], 1
+        )
+
+    def test_combinations_cap(self):
+        match_stats = MatchStats()
+        trans = self.match(match_stats, "--max_unmatched_charges_combinations", "1")
+        self.assertEqual(trans[1].charges, [])
+        _, combos = match_stats.passes
+        self.assertEqual(combos["candidate_groups"], 0)
+        self.assertEqual(combos["orders_over_cap"], 1)
+        self.assertEqual(combos["charges_over_cap"], 2)
+
+    def test_disabled(self):
+        trans = self.match(NO_MATCH_STATS)
+        self.assertTrue(all(t.charges for t in trans))
+        self.assertFalse(NO_MATCH_STATS.enabled)
+        self.assertEqual(NO_MATCH_STATS.counter(), {})
+        self.assertEqual(NO_MATCH_STATS.to_json(), {"passes": []})
+
+
+if __name__ == "__main__":
+    unittest.main()
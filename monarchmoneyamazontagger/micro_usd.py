@@ -1,8 +1,10 @@
 # 50 Micro dollars we'll consider equal (this allows for some
 # division/multiplication rounding wiggle room).
+from decimal import Decimal, InvalidOperation, ROUND_HALF_EVEN
+import functools
+import re
 from typing import Any
 
-
 MICRO_USD_EPS = 50
 CENT_MICRO_USD = 10000
 
@@ -10,6 +12,8 @@ DOLLAR_EPS = 0.0001
 
 
 class MicroUSD:
+    __slots__ = ("micro_usd",)
+
     def __init__(self, micro_usd: int):
         self.micro_usd = micro_usd
 
@@ -26,18 +30,49 @@ class MicroUSD:
             return False
         return abs(self.micro_usd - other.micro_usd) < MICRO_USD_EPS
 
+    # Equality is within MICRO_USD_EPS, which no hash can be consistent with.
+    # Index amounts with amount_index.AmountIndex instead.
+    __hash__ = None
+
+    def __bool__(self) -> bool:
+        return abs(self.micro_usd) >= MICRO_USD_EPS
+
+    def __lt__(self, other: "MicroUSD | int") -> bool:
+        return self.micro_usd < _to_micro_usd(other)
+
+    def __le__(self, other: "MicroUSD | int") -> bool:
+        return self.micro_usd <= _to_micro_usd(other)
+
+    def __gt__(self, other: "MicroUSD | int") -> bool:
+        return self.micro_usd > _to_micro_usd(other)
+
+    def __ge__(self, other: "MicroUSD | int") -> bool:
+        return self.micro_usd >= _to_micro_usd(other)
+
     def __neg__(self) -> "MicroUSD":
         return MicroUSD(-self.micro_usd)
 
-    def __add__(self, other: "MicroUSD") -> "MicroUSD":
-        return MicroUSD(self.micro_usd + other.micro_usd)
+    def __abs__(self) -> "MicroUSD":
+        return MicroUSD(abs(self.micro_usd))
+
+    def __add__(self, other: "MicroUSD | int") -> "MicroUSD":
+        return MicroUSD(self.micro_usd + _to_micro_usd(other))
+
+    # Allows sum() over MicroUSDs, which starts from 0.
+    __radd__ = __add__
 
-    def __sub__(self, other: "MicroUSD") -> "MicroUSD":
-        return MicroUSD(self.micro_usd - other.micro_usd)
+    def __sub__(self, other: "MicroUSD | int") -> "MicroUSD":
+        return MicroUSD(self.micro_usd - _to_micro_usd(other))
+
+    def __rsub__(self, other: "MicroUSD | int") -> "MicroUSD":
+        return MicroUSD(_to_micro_usd(other) - self.micro_usd)
 
     def __mul__(self, other: Any) -> "MicroUSD":
         return MicroUSD(self.micro_usd * other)
 
+    def __truediv__(self, other: int) -> "MicroUSD":
+        return MicroUSD(round(self.micro_usd / other))
+
     def round_to_cent(self) -> "MicroUSD":
         """Rounds to the nearest cent."""
         return MicroUSD.from_float(self.to_float())
@@ -53,14 +88,50 @@ class MicroUSD:
     def parse(cls, amount: float | str) -> "MicroUSD":
         if isinstance(amount, float):
             return cls.from_float(amount)
-        # Remove any formatting/grouping commas.
-        amount = amount.replace(",", "")
-        # Remove any quoting.
-        amount = amount.replace("'", "")
-        negate = False
-        if "-" == amount[0]:
-            negate = True
-            amount = amount[1:]
-        if "$" == amount[0]:
-            amount = amount[1:]
-        return cls.from_float(float(amount) if not negate else -float(amount))
+        return MicroUSD(parse_micro_usd(amount))
+
+
+def _to_micro_usd(amount: "MicroUSD | int") -> int:
+    """Plain ints (e.g. 0 or MICRO_USD_EPS) are taken as micro dollars."""
+    if isinstance(amount, MicroUSD):
+        return amount.micro_usd
+    if isinstance(amount, int):
+        return amount
+    raise TypeError(f"Cannot combine MicroUSD with {type(amount).__name__}")
+
+
+# Optional sign, optional '$' (and sign), then digits with up to 6 fractional
+# digits.
+_DECIMAL_AMOUNT_RE = re.compile(r"([-+])?(?:\$([-+])?)?([0-9]*)(?:\.([0-9]{0,6}))?")
+
+
+# Currency columns repeat the same handful of values ("0", common prices).
+@functools.lru_cache(maxsize=1 << 12)
+def parse_micro_usd(amount: str) -> int:
+    """Parses a currency string (e.g. '-$1,234.56') into exact micro dollars."""
+    # Remove any formatting/grouping commas and any quoting.
+    clean_amount = amount.replace(",", "").replace("'", "")
+    match = _DECIMAL_AMOUNT_RE.fullmatch(clean_amount)
+    if match and (match.group(3) or match.group(4)):
+        sign, dollar_sign, whole, frac = match.groups()
+        micro_usd = int(whole or "0") * 1000000 + int((frac or "").ljust(6, "0"))
+        return -micro_usd if (sign == "-") != (dollar_sign == "-") else micro_usd
+
+    # Uncommon formats (exponents, sub-micro precision): still no floats.
+    negate = clean_amount[:1] == "-"
+    if clean_amount[:1] in ("-", "+"):
+        clean_amount = clean_amount[1:]
+    if clean_amount[:1] == "$":
+        clean_amount = clean_amount[1:]
+        if clean_amount[:1] in ("-", "+"):
+            negate = negate != (clean_amount[:1] == "-")
+            clean_amount = clean_amount[1:]
+    if clean_amount[:1] in ("-", "+"):
+        raise ValueError(f"Invalid currency amount: {amount!r}")
+    try:
+        micro_usd = int(
+            (Decimal(clean_amount) * 1000000).to_integral_value(ROUND_HALF_EVEN)
+        )
+    except (InvalidOperation, OverflowError):
+        raise ValueError(f"Invalid currency amount: {amount!r}")
+    return -micro_usd if negate else micro_usd
@@ -20,6 +20,29 @@ class MicroUSDTest(unittest.TestCase):
         self.assertNotEqual(MicroUSD(-500), MicroUSD(0))
         self.assertNotEqual(MicroUSD(200), MicroUSD(0))
 
+    def test_unhashable(self):
+        with self.assertRaises(TypeError):
+            hash(MicroUSD(0))
+
+    def test_arithmetic(self):
+        self.assertEqual(sum([MicroUSD(1000000), MicroUSD(2500000)]), MicroUSD(3500000))
+        self.assertEqual(MicroUSD(1000000) + 0, MicroUSD(1000000))
+        self.assertEqual(0 - MicroUSD(1000000), MicroUSD(-1000000))
+        self.assertEqual(abs(MicroUSD(-30000)), MicroUSD(30000))
+        self.assertEqual(MicroUSD(30000) / 3, MicroUSD(10000))
+        with self.assertRaises(TypeError):
+            MicroUSD(1) + 1.5
+
+    def test_comparison(self):
+        self.assertTrue(MicroUSD(10) < MicroUSD(20))
+        self.assertTrue(MicroUSD(10) < 50)
+        self.assertTrue(MicroUSD(10000) > 0)
+        self.assertTrue(MicroUSD(-10000) <= 0)
+        self.assertTrue(MicroUSD(0) >= MicroUSD(0))
+        self.assertFalse(MicroUSD(0))
+        self.assertFalse(MicroUSD(-10))
+        self.assertTrue(MicroUSD(-10000))
+
     def test_to_float(self):
         self.assertEqual(MicroUSD(30000300).to_float(), 30.0)
         self.assertEqual(MicroUSD(103000).to_float(), 0.10)
@@ -57,6 +80,34 @@ class MicroUSDTest(unittest.TestCase):
         self.assertEqual(MicroUSD.parse("$55").micro_usd, 55000000)
         self.assertEqual(MicroUSD.parse("$12.23").micro_usd, 12230000)
         self.assertEqual(MicroUSD.parse("-$12.23").micro_usd, -12230000)
+        self.assertEqual(MicroUSD.parse("0.525").micro_usd, 525000)
+        self.assertEqual(MicroUSD.parse(".5").micro_usd, 500000)
+        self.assertEqual(MicroUSD.parse("$1,234.56").micro_usd, 1234560000)
+        self.assertEqual(MicroUSD.parse("'12.00'").micro_usd, 12000000)
+        self.assertEqual(MicroUSD.parse("1e2").micro_usd, 100000000)
+        self.assertEqual(MicroUSD.parse("0.0000015").micro_usd, 2)
+        self.assertEqual(MicroUSD.parse(12.23).micro_usd, 12230000)
+
+    def test_parse_is_exact(self):
+        # Large values lose precision when round tripped through a float.
+        self.assertEqual(
+            MicroUSD.parse("$123456789012.345678").micro_usd, 123456789012345678
+        )
+        self.assertEqual(
+            MicroUSD.parse("-90071992547.409931").micro_usd, -90071992547409931
+        )
+
+    def test_parse_invalid(self):
+        for amount in ("", "$", "Not Available", "1.2.3", "--1"):
+            with self.assertRaises(ValueError):
+                MicroUSD.parse(amount)
+
+    def test_parse_signs(self):
+        self.assertEqual(MicroUSD.parse("+1").micro_usd, 1000000)
+        self.assertEqual(MicroUSD.parse("$-1").micro_usd, -1000000)
+        self.assertEqual(MicroUSD.parse("-$-1").micro_usd, 1000000)
+        self.assertEqual(MicroUSD.parse("$+1.5").micro_usd, 1500000)
+        self.assertEqual(MicroUSD.parse("$-1e2").micro_usd, -100000000)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,219 @@
+from collections import Counter
+from datetime import date, timedelta
+import json
+import logging
+import os
+import sqlite3
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the tables change. A mirror with another version is cleared:
+# it only holds what can be downloaded from Monarch Money again.
+MIRROR_SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id TEXT PRIMARY KEY,
+    date TEXT NOT NULL,
+    updated_at TEXT,
+    stale INTEGER NOT NULL DEFAULT 0,
+    json TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transactions_by_date ON transactions(date);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class TransactionMirror:
+    """A SQLite copy of Monarch Money transactions (as returned by
+    get_transactions), keyed by id.
+
+    The mirror holds every transaction dated within its covered range, as of
+    the last sync. Syncing a range (replace_range) replaces what the mirror
+    holds for those dates. The scope describes what was fetched (e.g. the
+    account filter); a mirror of another scope is cleared.
+    """
+
+    def __init__(self, path: str, scope: str = ""):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        (version,) = self.conn.execute("PRAGMA user_version").fetchone()
+        if version != MIRROR_SCHEMA_VERSION:
+            if version:
+                logger.info("Transaction mirror format changed; starting a new one.")
+            with self.conn:
+                self.conn.executescript(
+                    "DROP TABLE IF EXISTS transactions;"
+                    "DROP TABLE IF EXISTS sync_state;"
+                )
+        with self.conn:
+            self.conn.executescript(_SCHEMA)
+            self.conn.execute(f"PRAGMA user_version = {MIRROR_SCHEMA_VERSION}")
+        if self._get_state("scope", scope) != scope:
+            logger.info("Transaction filters changed; starting a new mirror.")
+            self.clear()
+        with self.conn:
+            self._set_state("scope", scope)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "TransactionMirror":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def clear(self) -> None:
+        with self.conn:
+            self.conn.execute("DELETE FROM transactions")
+            self.conn.execute("DELETE FROM sync_state")
+
+    def covered_range(self) -> Optional[Tuple[date, date]]:
+        """The first and last dates the mirror holds all transactions for."""
+        first = self._get_state("covered_from")
+        last = self._get_state("covered_to")
+        if not first or not last:
+            return None
+        return date.fromisoformat(first), date.fromisoformat(last)
+
+    def last_synced_on(self) -> Optional[date]:
+        synced_on = self._get_state("last_synced_on")
+        return date.fromisoformat(synced_on) if synced_on else None
+
+    def stale_ranges(self, max_gap_days: int = 7) -> List[Tuple[date, date]]:
+        """The dates of transactions marked stale, as (first, last) ranges,
+        oldest first.
+
+        Dates up to max_gap_days apart share a range, so a few stale
+        transactions far apart are not downloaded along with every date in
+        between.
+        """
+        ranges = []
+        for (day,) in self.conn.execute(
+            "SELECT DISTINCT date FROM transactions WHERE stale ORDER BY date"
+        ):
+            day = date.fromisoformat(day)
+            if ranges and day - ranges[-1][1] <= timedelta(days=max_gap_days):
+                ranges[-1] = (ranges[-1][0], day)
+            else:
+                ranges.append((day, day))
+        return ranges
+
+    def transactions(
+        self, start: Optional[date] = None, end: Optional[date] = None
+    ) -> List[Dict[str, Any]]:
+        """Returns the transactions dated from start to end (inclusive), most
+        recent first, like Monarch Money does."""
+        return [
+            json.loads(t)
+            for (t,) in self.conn.execute(
+                "SELECT json FROM transactions WHERE date BETWEEN ? AND ? "
+                "ORDER BY date DESC, id",
+                (
+                    start.isoformat() if start else "",
+                    end.isoformat() if end else "9999-12-31",
+                ),
+            )
+        ]
+
+    def replace_range(
+        self,
+        start: Optional[date],
+        end: Optional[date],
+        transactions: Iterable[Dict[str, Any]],
+        synced_on: Optional[date] = None,
+    ) -> Counter:
+        """Makes transactions all the mirror holds from start to end (or for
+        all dates, if both are None), and extends the covered range to them.
+        If given, synced_on is when the mirror was last current as a whole.
+
+        The range should overlap or touch the covered range, which has no
+        gaps, and transactions must be complete for it (see update otherwise).
+        Returns the counts of new, changed and removed transactions.
+        """
+        transactions = list(transactions)
+        if start is None or end is None:
+            dates = [date.fromisoformat(t["date"]) for t in transactions]
+            dates += [synced_on] if synced_on else []
+            if not dates:
+                dates = [date.today()]
+            start, end = min(dates), max(dates)
+            where, params = "", ()
+        else:
+            where, params = "WHERE date BETWEEN ? AND ?", (
+                start.isoformat(),
+                end.isoformat(),
+            )
+
+        with self.conn:
+            in_range = set(
+                trans_id
+                for (trans_id,) in self.conn.execute(
+                    f"SELECT id FROM transactions {where}", params
+                )
+            )
+            counts = self._upsert(transactions)
+            removed = in_range - set(t["id"] for t in transactions)
+            self.conn.executemany(
+                "DELETE FROM transactions WHERE id = ?",
+                [(trans_id,) for trans_id in removed],
+            )
+            counts["removed"] = len(removed)
+
+            covered = self.covered_range()
+            if covered:
+                start, end = min(start, covered[0]), max(end, covered[1])
+            self._set_state("covered_from", start.isoformat())
+            self._set_state("covered_to", end.isoformat())
+            if synced_on:
+                self._set_state("last_synced_on", synced_on.isoformat())
+        return counts
+
+    def update(self, transactions: Iterable[Dict[str, Any]]) -> Counter:
+        """Adds or updates transactions, but leaves the rest and the covered
+        range as they are: for a download that may be missing some.
+        Returns the counts of new and changed transactions."""
+        with self.conn:
+            return self._upsert(transactions)
+
+    def _upsert(self, transactions: Iterable[Dict[str, Any]]) -> Counter:
+        counts = Counter()
+        for t in transactions:
+            previous = self.conn.execute(
+                "SELECT updated_at FROM transactions WHERE id = ?", (t["id"],)
+            ).fetchone()
+            if previous is None:
+                counts["new"] += 1
+            elif previous[0] != t.get("updatedAt"):
+                counts["changed"] += 1
+            self.conn.execute(
+                "INSERT OR REPLACE INTO transactions VALUES (?, ?, ?, 0, ?)",
+                (t["id"], t["date"], t.get("updatedAt"), json.dumps(t)),
+            )
+        return counts
+
+    def mark_stale(self, trans_ids: Iterable[str]) -> None:
+        """Marks transactions as changed since mirrored (e.g. by this tool),
+        so the next sync downloads them again."""
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE transactions SET stale = 1 WHERE id = ?",
+                [(trans_id,) for trans_id in trans_ids],
+            )
+
+    def _get_state(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        row = self.conn.execute(
+            "SELECT value FROM sync_state WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else default
+
+    def _set_state(self, key: str, value: str) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO sync_state VALUES (?, ?)", (key, value)
+        )
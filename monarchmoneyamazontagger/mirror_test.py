@@ -0,0 +1,123 @@
+from datetime import date
+import os
+import tempfile
+import unittest
+
+from monarchmoneyamazontagger.mirror import TransactionMirror
+from monarchmoneyamazontagger.mockdata import transaction_json
+
+
+class TransactionMirrorTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "mirror", "Mirror.sqlite")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_replace_range(self):
+        t1 = transaction_json(id="1", date="2024-01-02")
+        t2 = transaction_json(id="2", date="2024-01-05")
+        t3 = transaction_json(id="3", date="2024-01-09")
+        with TransactionMirror(self.path) as mirror:
+            self.assertIsNone(mirror.covered_range())
+            counts = mirror.replace_range(
+                date(2024, 1, 1), date(2024, 1, 10), [t3, t2, t1], date(2024, 1, 10)
+            )
+            self.assertEqual(counts, {"new": 3, "removed": 0})
+
+        t2_changed = dict(t2, notes="Edited", updatedAt="2024-01-11T00:00:00+00:00")
+        with TransactionMirror(self.path) as mirror:
+            counts = mirror.replace_range(
+                date(2024, 1, 4), date(2024, 1, 12), [t2_changed], date(2024, 1, 12)
+            )
+            self.assertEqual(counts, {"changed": 1, "removed": 1})
+            self.assertEqual(
+                mirror.covered_range(), (date(2024, 1, 1), date(2024, 1, 12))
+            )
+            self.assertEqual(mirror.last_synced_on(), date(2024, 1, 12))
+            self.assertEqual(mirror.transactions(), [t2_changed, t1])
+            self.assertEqual(
+                mirror.transactions(date(2024, 1, 3), date(2024, 1, 5)), [t2_changed]
+            )
+
+    def test_replace_all(self):
+        with TransactionMirror(":memory:") as mirror:
+            mirror.replace_range(
+                None,
+                None,
+                [transaction_json(id="1", date="2024-01-02")],
+                date(2024, 1, 10),
+            )
+            self.assertEqual(
+                mirror.covered_range(), (date(2024, 1, 2), date(2024, 1, 10))
+            )
+
+    def test_mark_stale(self):
+        with TransactionMirror(self.path) as mirror:
+            mirror.replace_range(
+                date(2024, 1, 1),
+                date(2024, 3, 31),
+                [
+                    transaction_json(id="1", date="2024-01-02"),
+                    transaction_json(id="2", date="2024-01-05"),
+                    transaction_json(id="3", date="2024-01-09"),
+                    transaction_json(id="4", date="2024-03-01"),
+                ],
+            )
+            self.assertIsNone(mirror.last_synced_on())
+            self.assertEqual(mirror.stale_ranges(), [])
+            mirror.mark_stale(["4", "3", "1"])
+            # Nearby dates share a range; far apart ones do not.
+            self.assertEqual(
+                mirror.stale_ranges(),
+                [
+                    (date(2024, 1, 2), date(2024, 1, 9)),
+                    (date(2024, 3, 1), date(2024, 3, 1)),
+                ],
+            )
+            self.assertEqual(
+                mirror.stale_ranges(max_gap_days=1),
+                [
+                    (date(2024, 1, 2), date(2024, 1, 2)),
+                    (date(2024, 1, 9), date(2024, 1, 9)),
+                    (date(2024, 3, 1), date(2024, 3, 1)),
+                ],
+            )
+            mirror.replace_range(
+                date(2024, 1, 2),
+                date(2024, 1, 9),
+                [transaction_json(id="1", date="2024-01-02")],
+            )
+            self.assertEqual(
+                mirror.stale_ranges(), [(date(2024, 3, 1), date(2024, 3, 1))]
+            )
+
+    def test_update_keeps_the_rest(self):
+        t1 = transaction_json(id="1", date="2024-01-02")
+        t2 = transaction_json(id="2", date="2024-01-05")
+        with TransactionMirror(":memory:") as mirror:
+            mirror.replace_range(date(2024, 1, 1), date(2024, 1, 10), [t1, t2])
+            t1_changed = dict(t1, updatedAt="2024-01-11T00:00:00+00:00")
+            t3 = transaction_json(id="3", date="2024-01-20")
+            counts = mirror.update([t1_changed, t3])
+            self.assertEqual(counts, {"new": 1, "changed": 1})
+            self.assertEqual(mirror.transactions(), [t3, t2, t1_changed])
+            self.assertEqual(
+                mirror.covered_range(), (date(2024, 1, 1), date(2024, 1, 10))
+            )
+
+    def test_scope_change_clears(self):
+        with TransactionMirror(self.path, scope="a") as mirror:
+            mirror.replace_range(
+                date(2024, 1, 1), date(2024, 1, 31), [transaction_json(id="1")]
+            )
+        with TransactionMirror(self.path, scope="a") as mirror:
+            self.assertEqual(len(mirror.transactions()), 1)
+        with TransactionMirror(self.path, scope="b") as mirror:
+            self.assertEqual(mirror.transactions(), [])
+            self.assertIsNone(mirror.covered_range())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,6 +2,8 @@ from collections import defaultdict
 from copy import deepcopy
 import datetime
 from dateutil.parser import parse as dateutil_parse
+import functools
+import inspect
 import logging
 import re
 from typing import Any, List, Optional
@@ -44,9 +46,9 @@ class Category(object):
         self.name = name
         self.icon = icon
 
-    # def update_category_id(self, categories):
-    #     if self.name in categories:
-    #         self.id = categories[self.name]["id"]
+    def update_category_id(self, categories):
+        if self.name in categories:
+            self.id = categories[self.name]["id"]
 
     def __repr__(self):
         return f"{self.name}({self.id})"
@@ -133,6 +135,22 @@ def strptime_or_none(datetime_str, format_str):
         return None
 
 
+def from_json(cls, json_obj):
+    """Constructs cls from a Monarch Money JSON object, or returns None.
+
+    Fields cls does not take (like __typename) are ignored.
+    """
+    if json_obj is None:
+        return None
+    params = _init_params(cls)
+    return cls(**{k: v for k, v in json_obj.items() if k in params})
+
+
+@functools.lru_cache(maxsize=None)
+def _init_params(cls):
+    return frozenset(inspect.signature(cls).parameters)
+
+
 class Transaction:
     """A Monarch Money transaction."""
 
@@ -177,24 +195,24 @@ class Transaction:
         id,
         amount,
         date,
-        originalDate,
-        pending,
-        needsReview,
-        isRecurring,
-        isSplitTransaction,
-        hideFromReports,
-        splitTransactions,
-        originalTransaction,
-        createdAt,
-        updatedAt,
-        category,
-        merchant,
-        account,
-        notes,
-        tags,
-        attachments,
-        goal,
-        plaidName,
+        originalDate=None,
+        pending=False,
+        needsReview=False,
+        isRecurring=False,
+        isSplitTransaction=False,
+        hideFromReports=False,
+        splitTransactions=None,
+        originalTransaction=None,
+        createdAt=None,
+        updatedAt=None,
+        category=None,
+        merchant=None,
+        account=None,
+        notes=None,
+        tags=None,
+        attachments=None,
+        goal=None,
+        plaidName=None,
     ):
         self.id = id
         self.amount = MicroUSD.from_float(amount)
@@ -209,18 +227,19 @@ class Transaction:
         self.isRecurring = isRecurring
         self.isSplitTransaction = isSplitTransaction
         self.hideFromReports = hideFromReports
-        self.splitTransactions = splitTransactions
+        self.splitTransactions = splitTransactions or []
         self.originalTransaction = originalTransaction
-        self.createdAt = dateutil_parse(createdAt)
-        self.updatedAt = dateutil_parse(updatedAt)
+        # Optional, as a leaner projection (see mmclient) may leave these out:
+        self.createdAt = dateutil_parse(createdAt) if createdAt else None
+        self.updatedAt = dateutil_parse(updatedAt) if updatedAt else None
 
-        self.category = Category(**category)
-        self.merchant = Merchant(**merchant)
-        self.account = Account(**account)
+        self.category = from_json(Category, category)
+        self.merchant = from_json(Merchant, merchant)
+        self.account = from_json(Account, account)
 
         self.notes = notes
-        self.tags = tags
-        self.attachments = attachments
+        self.tags = tags or []
+        self.attachments = attachments or []
         self.goal = goal
         self.plaidName = plaidName
 
@@ -236,12 +255,26 @@ class Transaction:
         self.matched = True
         self.charges = charges
 
+    def split(self, amount, category_name, description, notes):
+        """Returns a proposed part of this transaction (e.g. one item), named
+        description. Its category id is set by update_category_id."""
+        result = self.clone()
+        result.amount = amount
+        result.category = Category(None, category_name)
+        result.merchant = Merchant(None, description)
+        result.notes = notes
+        result.isSplitTransaction = False
+        result.splitTransactions = []
+        return result
+
     # def bastardize(self):
     #     """Severs the child from the parent making this a parent itself."""
     #     self.parent_id = None
 
-    # def update_category_id(self, categories):
-    #     self.category.update_category_id(categories)
+    def update_category_id(self, categories):
+        """Looks up the category id by name in categories (name -> category
+        JSON, as returned by get_categories)."""
+        self.category.update_category_id(categories)
 
     def get_compare_tuple(self, ignore_category=False):
         """Returns a 3-tuple used to determine if 2 transactions are equal."""
@@ -267,7 +300,7 @@ class Transaction:
     def parse_from_json(cls, json_objs: List[Any], progress=NoProgress()):
         result = []
         for json_obj in json_objs:
-            result.append(cls(**json_obj))
+            result.append(from_json(cls, json_obj))
             progress.next()
         return result
 
@@ -300,12 +333,14 @@ class Transaction:
 
     @staticmethod
     def old_and_new_are_identical(old, new, ignore_category=False):
-        """Returns True if there is zero difference between old and new."""
-        old_set = set(
-            [c.get_compare_tuple(ignore_category) for c in old.children]
-            if old.children
-            else [old.get_compare_tuple(ignore_category)]
-        )
+        """Returns True if there is zero difference between old and new.
+
+        The splits of old are not fetched, so a split old transaction is
+        never identical to new.
+        """
+        if old.isSplitTransaction:
+            return False
+        old_set = set([old.get_compare_tuple(ignore_category)])
         new_set = set([t.get_compare_tuple(ignore_category) for t in new])
         return old_set == new_set
 
@@ -314,7 +349,7 @@ def itemize_new_trans(new_trans, prefix):
     # Add a prefix to all itemized transactions for easy keyword searching
     # within Monarch Money. Use the same prefix, based on if the original transaction
     for nt in new_trans:
-        nt.description = prefix + nt.description
+        nt.merchant.name = prefix + nt.merchant.name
 
     # Turns out the first entry is typically displayed last in the Monarch Money
     # UI. Reverse everything for ideal readability.
@@ -335,26 +370,18 @@ def summarize_new_trans(t, new_trans, prefix):
     # When not itemizing, create a description by concatenating the items. Store
     # the full information in the transaction notes. Category is untouched when
     # there's more than one item (this is why itemizing is better!).
-    title = summarize_title(
-        [
-            nt.description
-            for nt in new_trans
-            if nt.description not in NON_ITEM_DESCRIPTIONS
-        ],
-        prefix,
-    )
+    item_names = [
+        nt.merchant.name
+        for nt in new_trans
+        if nt.merchant.name not in NON_ITEM_DESCRIPTIONS
+    ]
+    title = summarize_title(item_names, prefix)
     notes = "{}\nItem(s):\n{}".format(
-        new_trans[0].notes, "\n".join([" - " + nt.description for nt in new_trans])
+        new_trans[0].notes,
+        "\n".join([" - " + nt.merchant.name for nt in new_trans]),
     )
 
-    summary_trans = deepcopy(t)
-    summary_trans.description = title
-    if (
-        len([nt for nt in new_trans if nt.description not in NON_ITEM_DESCRIPTIONS])
-        == 1
-    ):
+    summary_trans = t.split(t.amount, category.DEFAULT_CATEGORY, title, notes)
+    if len(item_names) == 1:
         summary_trans.category = new_trans[0].category
-    else:
-        summary_trans.category.name = category.DEFAULT_CATEGORY
-    summary_trans.notes = notes
     return [summary_trans]
@@ -1,3 +1,4 @@
+import asyncio
 import datetime
 import json
 import logging
@@ -7,8 +8,44 @@ import typing
 
 from monarchmoney import MonarchMoney
 
+from monarchmoneyamazontagger.mirror import TransactionMirror
+from monarchmoneyamazontagger.my_progress import no_progress_factory
+
 logger = logging.getLogger(__name__)
 
+# GraphQL projections for fetching transactions, by --mm_transaction_fields
+# (named in args.TRANSACTION_FIELDS_NAMES).
+TRANSACTION_FIELDS = {
+    # Only what mm.Transaction and matching use.
+    "lean": """
+      fragment TransactionFields on Transaction {
+        id
+        amount
+        pending
+        date
+        plaidName
+        notes
+        isSplitTransaction
+        createdAt
+        updatedAt
+        category {
+          id
+          name
+        }
+        merchant {
+          id
+          name
+        }
+        account {
+          id
+          displayName
+        }
+      }
+    """,
+    # Everything MonarchMoney.get_transactions returns by default.
+    "full": None,
+}
+
 
 class MonarchMoneyClient:
     args = None
@@ -32,7 +69,7 @@ class MonarchMoneyClient:
             logger.error("Missing Monarch Money email or password.")
             return False
 
-        self.mm = MonarchMoney()
+        self.mm = MonarchMoney(connection_limit=max(1, self.args.mm_fetch_concurrency))
         await self.mm.login(self.args.mm_email, self.args.mm_password)
         if self.args.mm_wait_for_sync:
             await self.mm.request_accounts_refresh_and_wait(
@@ -45,6 +82,7 @@ class MonarchMoneyClient:
         self,
         from_date: typing.Optional[datetime.date] = None,
         to_date: typing.Optional[datetime.date] = None,
+        progress_factory=no_progress_factory,
     ):
         if self.args.use_json_backup:
             json_path = _json_transactions_path(
@@ -55,7 +93,24 @@ class MonarchMoneyClient:
             logger.info(f"Loading Transactions from json file: {json_path}")
             with open(json_path, "r") as json_in:
                 results = json.load(json_in)
-                return results
+            # A backup is read like an (in memory) offline mirror of one sync.
+            with TransactionMirror(":memory:") as mirror:
+                mirror.replace_range(None, None, results, datetime.date.today())
+                return mirror.transactions(from_date, to_date)
+
+        if self.args.mm_mirror_offline:
+            with self._open_mirror() as mirror:
+                logger.info("Loading Transactions from the transaction mirror.")
+                covered = mirror.covered_range()
+                if not covered or not (
+                    covered[0] <= (from_date or covered[0])
+                    and (to_date or datetime.date.today()) <= covered[1]
+                ):
+                    logger.warning(
+                        f"The transaction mirror only covers {covered}; "
+                        "transactions outside of it are missing."
+                    )
+                return mirror.transactions(from_date, to_date)
 
         if not await self.login():
             logger.error("Cannot login")
@@ -64,55 +119,201 @@ class MonarchMoneyClient:
             f"Getting all Monarch Money transactions since {from_date} to {to_date}."
         )
 
-        limit = 100
-        offset = 0
+        # Each asyncio.run gets its own connections; close them when done.
+        async with self.mm:
+            if self.args.mm_mirror:
+                results = await self._sync_mirror(from_date, to_date, progress_factory)
+            else:
+                results, _ = await self._fetch_transactions(
+                    from_date, to_date, progress_factory
+                )
+        if not results:
+            return []
+
+        if self.args.save_json_backup:
+            json_path = _json_transactions_path(
+                self.args.mm_json_backup_path, int(time.time())
+            )
+            logger.info(f"Saving Transactions to json file: {json_path}")
+            with open(json_path, "w") as json_out:
+                json.dump(results, json_out)
+
+        return results
+
+    async def _sync_mirror(self, from_date, to_date, progress_factory):
+        """Brings the transaction mirror up to date for from_date to to_date,
+        and returns the transactions in it for those dates."""
+        today = datetime.date.today()
+        with self._open_mirror() as mirror:
+            ranges = mirror_ranges_to_sync(
+                mirror.covered_range(),
+                mirror.last_synced_on(),
+                mirror.stale_ranges(),
+                from_date,
+                to_date,
+                today,
+                self.args.mm_mirror_resync_days,
+            )
+            for i, (start, end) in enumerate(ranges):
+                transactions, complete = await self._fetch_transactions(
+                    start, end, progress_factory
+                )
+                if not complete:
+                    # What is missing may just have failed to download: keep
+                    # what the mirror has, and sync these dates again next time.
+                    logger.warning(
+                        f"Incomplete download from {start} to {end}; not removing "
+                        "transactions from the mirror, nor marking it synced."
+                    )
+                    counts = mirror.update(transactions)
+                else:
+                    counts = mirror.replace_range(
+                        start,
+                        end,
+                        transactions,
+                        # The last range has the recent dates; only then is
+                        # the mirror current.
+                        synced_on=today if i == len(ranges) - 1 else None,
+                    )
+                logger.info(
+                    f"Transaction mirror from {start} to {end}: {counts['new']} new, "
+                    f"{counts['changed']} changed, {counts['removed']} removed."
+                )
+            return mirror.transactions(from_date, to_date)
+
+    def _open_mirror(self):
+        search_terms = (
+            self._search_terms() if self.args.mm_search_description_filter else []
+        )
+        scope = json.dumps(
+            {
+                "account_ids": self.args.mm_account_ids or [],
+                "search": ",".join(search_terms) or None,
+                "fields": self.args.mm_transaction_fields,
+            }
+        )
+        return TransactionMirror(self.args.mm_mirror_path, scope)
+
+    async def _fetch_transactions(self, from_date, to_date, progress_factory):
+        """Returns the transactions from from_date to to_date, and whether
+        they are complete (see _get_transaction_pages)."""
         start_date = None
         if from_date:
             start_date = from_date.strftime("%Y-%m-%d")
         end_date = None
         if to_date:
             end_date = to_date.strftime("%Y-%m-%d")
+        elif from_date:
+            # Monarch Money requires both dates, or neither.
+            end_date = datetime.date.today().strftime("%Y-%m-%d")
 
-        response = await self.mm.get_transactions(
-            limit=limit,
-            offset=offset,
-            start_date=start_date,
-            end_date=end_date,
-            account_ids=self.args.mm_account_ids or [],
+        if self.args.mm_search_description_filter:
+            return await self._search_transactions(
+                start_date, end_date, progress_factory
+            )
+        return await self._get_transaction_pages(start_date, end_date, progress_factory)
+
+    async def _search_transactions(self, start_date, end_date, progress_factory):
+        """Fetches the transactions found by each description filter term.
+
+        A transaction found by several terms is returned once. Without any
+        terms, fetches every transaction, like the local filter would keep.
+        Returns the transactions, and whether every term's are complete.
+        """
+        terms = self._search_terms()
+        if not terms:
+            logger.warning(
+                "--mm_input_description_filter has no terms to search for; "
+                "fetching all transactions instead."
+            )
+            return await self._get_transaction_pages(
+                start_date, end_date, progress_factory
+            )
+        results = {}
+        all_complete = True
+        for term in terms:
+            logger.info(f'Searching Monarch Money transactions for "{term}".')
+            term_results, complete = await self._get_transaction_pages(
+                start_date, end_date, progress_factory, search=term
+            )
+            all_complete = all_complete and complete
+            for t in term_results:
+                results.setdefault(t["id"], t)
+        return list(results.values()), all_complete
+
+    def _search_terms(self):
+        """The distinct, non-blank terms of --mm_input_description_filter."""
+        return list(
+            dict.fromkeys(
+                term.strip()
+                for term in self.args.mm_input_description_filter.split(",")
+                if term.strip()
+            )
         )
-        results = []
-        while True:
-            if (
-                not response
-                or response["allTransactions"]["totalCount"] == 0
-                or not response["allTransactions"]["results"]
-            ):
-                return results
-            num_transactions = len(response["allTransactions"]["results"])
-            total_count = len(response["allTransactions"]["totalCount"])
-            logger.info(f"Received {num_transactions} transactions.")
-            logger.info(f"Total of {total_count} transactions.")
-            results.extend(response["allTransactions"]["results"])
-            offset += num_transactions
-            if offset == total_count:
-                break
+
+    async def _get_transaction_pages(
+        self, start_date, end_date, progress_factory, search=""
+    ):
+        """Returns the transactions found, and whether they are complete: all
+        pages arrived, with as many transactions as Monarch Money counted."""
+
+        async def get_page(offset):
             response = await self.mm.get_transactions(
-                limit=limit,
+                limit=self.args.mm_page_size,
                 offset=offset,
                 start_date=start_date,
                 end_date=end_date,
+                search=search,
                 account_ids=self.args.mm_account_ids or [],
+                transaction_fields=TRANSACTION_FIELDS[self.args.mm_transaction_fields],
             )
+            return response["allTransactions"] if response else None
 
-        if self.args.save_json_backup:
-            json_path = _json_transactions_path(
-                self.args.mm_json_backup_path, int(time.time())
-            )
-            logger.info(f"Saving Transactions to json file: {json_path}")
-            with open(json_path, "w") as json_out:
-                json.dump(results, json_out)
+        # The first page tells how many there are; the rest are then fetched
+        # concurrently.
+        first_page = await get_page(0)
+        if not first_page:
+            logger.warning("Received no response for Monarch Money transactions.")
+            return [], False
+        if first_page["totalCount"] == 0:
+            return [], True
+        if not first_page["results"]:
+            logger.warning(f"Received none of {first_page['totalCount']} transactions.")
+            return [], False
+        total_count = first_page["totalCount"]
+        logger.info(f"Total of {total_count} transactions.")
+        progress = progress_factory("Getting MM Transactions", total_count)
+        progress.next(len(first_page["results"]))
 
-        return results
+        concurrency = asyncio.Semaphore(max(1, self.args.mm_fetch_concurrency))
+
+        async def get_page_results(offset):
+            async with concurrency:
+                page = await get_page(offset)
+            if page is None:
+                return None
+            progress.next(len(page["results"]))
+            return page["results"]
+
+        # Monarch Money may return fewer than mm_page_size per page.
+        page_size = len(first_page["results"])
+        pages = await asyncio.gather(
+            *[
+                get_page_results(offset)
+                for offset in range(page_size, total_count, page_size)
+            ]
+        )
+        progress.finish()
+
+        # gather keeps the order of the pages, whichever finished first.
+        results = first_page["results"] + [t for page in pages if page for t in page]
+        complete = None not in pages and len(results) == total_count
+        if not complete:
+            logger.warning(
+                f"Received {len(results)} of {total_count} transactions; "
+                "pages failed, or transactions changed while fetching."
+            )
+        return results, complete
 
     async def get_categories(self):
         if self.args.use_json_backup:
@@ -125,6 +326,9 @@ class MonarchMoneyClient:
             with open(json_path, "r") as json_in:
                 results = json.load(json_in)
                 return results
+        if self.args.mm_mirror_offline:
+            # Categories are not mirrored.
+            return []
         if not await self.login():
             logger.error("Cannot login")
             return []
@@ -147,6 +351,10 @@ class MonarchMoneyClient:
             logger.error("Cannot login")
             return 0
         num_requests = 0
+        if self.args.mm_mirror:
+            # Download these again on the next sync.
+            with self._open_mirror() as mirror:
+                mirror.mark_stale([orig_trans.id for orig_trans, _ in updates])
         return num_requests
         # for orig_trans, new_trans in updates:
         #     if len(new_trans) == 1:
@@ -208,6 +416,44 @@ class MonarchMoneyClient:
         # return num_requests
 
 
+def mirror_ranges_to_sync(
+    covered, last_synced_on, stale_ranges, from_date, to_date, today, resync_days
+):
+    """Returns the (start, end) date ranges to download, oldest first, so a
+    TransactionMirror holds all transactions from from_date to to_date as of
+    today. The last range is the most recent. (None, None) is all dates.
+
+    Monarch Money cannot be asked for what changed since the last sync, so
+    transactions dated up to resync_days before it (e.g. pending ones) are
+    downloaded again, as are the dates of transactions marked stale (see
+    TransactionMirror.stale_ranges).
+    """
+    if from_date is None:
+        return [(None, None)]
+    end = to_date or today
+    if covered is None:
+        return [(from_date, end)]
+    covered_from, covered_to = covered
+
+    ranges = []
+    if from_date < covered_from:
+        ranges.append((from_date, covered_from - datetime.timedelta(days=1)))
+    ranges.extend(stale_ranges)
+    recent = min(
+        last_synced_on or covered_from, covered_to + datetime.timedelta(days=1)
+    )
+    recent -= datetime.timedelta(days=resync_days)
+    ranges.append((max(recent, min(from_date, covered_from)), max(end, covered_to)))
+
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + datetime.timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
 def _json_transactions_path(prefix: str, time_epoch: int):
     return os.path.join(prefix, f"{time_epoch} Transactions.json")
 
@@ -0,0 +1,357 @@
+import argparse
+import asyncio
+import contextlib
+import datetime
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from monarchmoneyamazontagger.args import TRANSACTION_FIELDS_NAMES, define_common_args
+from monarchmoneyamazontagger import mm
+from monarchmoneyamazontagger.micro_usd import MicroUSD
+from monarchmoneyamazontagger.mmclient import (
+    MonarchMoneyClient,
+    TRANSACTION_FIELDS,
+    mirror_ranges_to_sync,
+)
+
+
+class FakeMonarchMoney:
+    """Serves get_transactions pages out of a list, like Monarch Money."""
+
+    def __init__(self, transactions, max_page_size=None, failing_offsets=()):
+        self.transactions = transactions
+        self.max_page_size = max_page_size
+        # Pages at these offsets get no response.
+        self.failing_offsets = failing_offsets
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = []
+        self.closed = False
+
+    async def __aenter__(self):
+        self.closed = False
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.closed = True
+
+    async def get_transactions(self, limit, offset, **filters):
+        self.requests.append((limit, offset, filters))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        # Later pages come back first.
+        await asyncio.sleep(0.001 * (len(self.transactions) - offset) / limit)
+        self.in_flight -= 1
+        if offset in self.failing_offsets:
+            return None
+        limit = min(limit, self.max_page_size or limit)
+        search = filters.get("search", "").lower()
+        found = [
+            t
+            for t in self.transactions
+            if search in t.get("merchant", "").lower()
+            and (filters.get("start_date") or "") <= t.get("date", "")
+            and t.get("date", "") <= (filters.get("end_date") or "9999-12-31")
+        ]
+        return {
+            "allTransactions": {
+                "totalCount": len(found),
+                "results": found[offset : offset + limit],
+            }
+        }
+
+
+class GetTransactions(unittest.TestCase):
+    def get_transactions(self, fake_mm, *argv, from_date=None):
+        parser = argparse.ArgumentParser()
+        define_common_args(parser)
+        mmc = MonarchMoneyClient(parser.parse_args(argv))
+        mmc.mm = fake_mm
+
+        progress_bars = []
+
+        class FakeProgress:
+            def __init__(self, msg, max):
+                self.max = max
+                self.curr = 0
+                self.finished = False
+                progress_bars.append(self)
+
+            def next(self, i=1):
+                self.curr += i
+
+            def finish(self):
+                self.finished = True
+
+        results = asyncio.run(
+            mmc.get_transactions(from_date=from_date, progress_factory=FakeProgress)
+        )
+        return results, progress_bars
+
+    def test_concurrent_pages_in_order(self):
+        transactions = [{"id": str(i)} for i in range(1050)]
+        fake_mm = FakeMonarchMoney(transactions)
+        results, progress_bars = self.get_transactions(
+            fake_mm, "--mm_page_size", "100", "--mm_fetch_concurrency", "3"
+        )
+        self.assertEqual(results, transactions)
+        self.assertEqual(len(fake_mm.requests), 11)
+        self.assertEqual(fake_mm.max_in_flight, 3)
+        self.assertEqual(len(progress_bars), 1)
+        self.assertEqual(progress_bars[0].max, 1050)
+        self.assertEqual(progress_bars[0].curr, 1050)
+        self.assertTrue(progress_bars[0].finished)
+        self.assertTrue(fake_mm.closed)
+
+    def test_server_page_size_limit(self):
+        transactions = [{"id": str(i)} for i in range(250)]
+        fake_mm = FakeMonarchMoney(transactions, max_page_size=50)
+        results, _ = self.get_transactions(fake_mm, "--mm_page_size", "100")
+        self.assertEqual(results, transactions)
+        self.assertEqual([offset for _, offset, _ in fake_mm.requests][:2], [0, 50])
+
+    def test_dates(self):
+        fake_mm = FakeMonarchMoney([{"id": "1"}])
+        self.get_transactions(fake_mm, from_date=datetime.date(2024, 1, 2))
+        _, _, filters = fake_mm.requests[0]
+        self.assertEqual(filters["start_date"], "2024-01-02")
+        self.assertEqual(filters["end_date"], datetime.date.today().isoformat())
+
+    def test_search_description_filter(self):
+        transactions = [
+            {"id": "1", "merchant": "Amazon"},
+            {"id": "2", "merchant": "Grocer"},
+            {"id": "3", "merchant": "AMZN Mktp"},
+            {"id": "4", "merchant": "Amazon AMZN"},
+        ]
+        fake_mm = FakeMonarchMoney(transactions)
+        results, progress_bars = self.get_transactions(
+            fake_mm,
+            "--mm_search_description_filter",
+            "--mm_input_description_filter",
+            "amazon, amzn,",
+        )
+        self.assertEqual([t["id"] for t in results], ["1", "4", "3"])
+        self.assertEqual(
+            [filters["search"] for _, _, filters in fake_mm.requests],
+            ["amazon", "amzn"],
+        )
+        self.assertEqual(len(progress_bars), 2)
+
+    def test_page_size_and_concurrency_must_be_positive(self):
+        parser = argparse.ArgumentParser()
+        define_common_args(parser)
+        for arg in ("--mm_page_size", "--mm_fetch_concurrency"):
+            with self.assertRaises(SystemExit), contextlib.redirect_stderr(
+                io.StringIO()
+            ):
+                parser.parse_args([arg, "0"])
+            self.assertEqual(getattr(parser.parse_args([arg, "1"]), arg[2:]), 1)
+
+    def test_search_without_terms(self):
+        fake_mm = FakeMonarchMoney([{"id": "1", "merchant": "Grocer"}])
+        with self.assertLogs("monarchmoneyamazontagger.mmclient", "WARNING"):
+            results, _ = self.get_transactions(
+                fake_mm,
+                "--mm_search_description_filter",
+                "--mm_input_description_filter",
+                " , ",
+            )
+        self.assertEqual([t["id"] for t in results], ["1"])
+        self.assertEqual(
+            [filters["search"] for _, _, filters in fake_mm.requests], [""]
+        )
+
+    def test_transaction_fields(self):
+        fake_mm = FakeMonarchMoney([{"id": "1"}])
+        self.get_transactions(fake_mm)
+        self.assertEqual(
+            fake_mm.requests[0][2]["transaction_fields"], TRANSACTION_FIELDS["lean"]
+        )
+
+        fake_mm = FakeMonarchMoney([{"id": "1"}])
+        self.get_transactions(fake_mm, "--mm_transaction_fields", "full")
+        self.assertIsNone(fake_mm.requests[0][2]["transaction_fields"])
+        self.assertEqual(sorted(TRANSACTION_FIELDS), list(TRANSACTION_FIELDS_NAMES))
+
+    def test_empty(self):
+        results, progress_bars = self.get_transactions(FakeMonarchMoney([]))
+        self.assertEqual(results, [])
+        self.assertEqual(progress_bars, [])
+
+
+class MirrorSync(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "Mirror.sqlite")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def get_transactions(self, fake_mm, from_date, *argv):
+        parser = argparse.ArgumentParser()
+        define_common_args(parser)
+        mmc = MonarchMoneyClient(
+            parser.parse_args(["--mm_mirror_path", self.path] + list(argv))
+        )
+        mmc.mm = fake_mm
+        return asyncio.run(mmc.get_transactions(from_date=from_date))
+
+    def test_sync_then_offline(self):
+        today = datetime.date.today()
+        days_ago = [(today - datetime.timedelta(days=d)).isoformat() for d in range(60)]
+        transactions = [{"id": str(i), "date": days_ago[i * 5]} for i in range(10)]
+
+        fake_mm = FakeMonarchMoney(transactions)
+        start = today - datetime.timedelta(days=40)
+        results = self.get_transactions(fake_mm, start, "--mm_mirror")
+        self.assertEqual(results, transactions[:9])
+
+        # Only dates before the mirror and recent dates are downloaded.
+        transactions[0]["notes"] = "Edited"
+        fake_mm = FakeMonarchMoney(transactions)
+        results = self.get_transactions(
+            fake_mm, today - datetime.timedelta(days=50), "--mm_mirror"
+        )
+        self.assertEqual(results, transactions)
+        self.assertEqual(
+            [(f["start_date"], f["end_date"]) for _, _, f in fake_mm.requests],
+            [(days_ago[50], days_ago[41]), (days_ago[14], days_ago[0])],
+        )
+
+        results = self.get_transactions(
+            None, today - datetime.timedelta(days=20), "--mm_mirror_offline"
+        )
+        self.assertEqual(results, transactions[:5])
+
+    def test_incomplete_download(self):
+        today = datetime.date.today()
+        days_ago = [(today - datetime.timedelta(days=d)).isoformat() for d in range(10)]
+        transactions = [{"id": str(i), "date": days_ago[i]} for i in range(6)]
+        self.get_transactions(FakeMonarchMoney(transactions), None, "--mm_mirror")
+
+        # One transaction was deleted, but a page of the others is missing too.
+        fake_mm = FakeMonarchMoney(
+            transactions[1:], max_page_size=2, failing_offsets=(2,)
+        )
+        with self.assertLogs("monarchmoneyamazontagger.mmclient", "WARNING"):
+            results = self.get_transactions(fake_mm, None, "--mm_mirror")
+        self.assertEqual(results, transactions)
+
+        # Once complete, the deleted transaction is removed.
+        results = self.get_transactions(
+            FakeMonarchMoney(transactions[1:]), None, "--mm_mirror"
+        )
+        self.assertEqual(results, transactions[1:])
+
+    def test_json_backup(self):
+        with open(os.path.join(self.tmp_dir.name, "123 Transactions.json"), "w") as f:
+            json.dump(
+                [{"id": "1", "date": "2024-01-05"}, {"id": "2", "date": "2023-12-01"}],
+                f,
+            )
+        results = self.get_transactions(
+            None,
+            datetime.date(2024, 1, 1),
+            "--use_json_backup",
+            "123",
+            "--mm_json_backup_path",
+            self.tmp_dir.name,
+        )
+        self.assertEqual(results, [{"id": "1", "date": "2024-01-05"}])
+
+
+class MirrorRangesToSync(unittest.TestCase):
+    def test_ranges(self):
+        def d(day):
+            return datetime.date(2024, 1, day)
+
+        today = d(31)
+        self.assertEqual(
+            mirror_ranges_to_sync(None, None, [], None, None, today, 7),
+            [(None, None)],
+        )
+        self.assertEqual(
+            mirror_ranges_to_sync(None, None, [], d(5), None, today, 7),
+            [(d(5), d(31))],
+        )
+        # Before the mirror, then the recent dates.
+        self.assertEqual(
+            mirror_ranges_to_sync((d(10), d(25)), d(25), [], d(5), d(20), today, 7),
+            [(d(5), d(9)), (d(18), d(25))],
+        )
+        # Stale transactions, merged with the recent dates if they overlap.
+        self.assertEqual(
+            mirror_ranges_to_sync(
+                (d(1), d(25)),
+                d(25),
+                [(d(3), d(4)), (d(12), d(12))],
+                d(10),
+                None,
+                today,
+                7,
+            ),
+            [(d(3), d(4)), (d(12), d(12)), (d(18), d(31))],
+        )
+        self.assertEqual(
+            mirror_ranges_to_sync(
+                (d(1), d(25)), d(25), [(d(12), d(20))], d(10), None, today, 7
+            ),
+            [(d(12), d(31))],
+        )
+
+
+class ParseTransactions(unittest.TestCase):
+    def test_lean(self):
+        (trans,) = mm.Transaction.parse_from_json(
+            [
+                {
+                    "id": "1",
+                    "amount": -11.95,
+                    "pending": False,
+                    "date": "2024-01-03",
+                    "plaidName": "AMAZON MKTPLACE PMTS",
+                    "notes": None,
+                    "isSplitTransaction": False,
+                    "createdAt": "2024-01-03T15:43:18.634009+00:00",
+                    "updatedAt": "2024-01-03T16:32:08.539592+00:00",
+                    "category": {"id": "2", "name": "Shopping"},
+                    "merchant": {"id": "3", "name": "Amazon"},
+                    "account": {"id": "4", "displayName": "Visa"},
+                }
+            ]
+        )
+        self.assertEqual(trans.amount, MicroUSD(-11950000))
+        self.assertEqual(trans.date, datetime.date(2024, 1, 3))
+        self.assertEqual(trans.account.id, "4")
+        self.assertEqual(trans.tags, [])
+        self.assertFalse(trans.hideFromReports)
+
+    def test_full_ignores_unmodeled_fields(self):
+        (trans,) = mm.Transaction.parse_from_json(
+            [
+                {
+                    "id": "1",
+                    "amount": 5.0,
+                    "date": "2024-01-03",
+                    "reviewStatus": None,
+                    "merchant": {
+                        "id": "3",
+                        "name": "Amazon",
+                        "transactionsCount": 12,
+                        "__typename": "Merchant",
+                    },
+                    "__typename": "Transaction",
+                }
+            ]
+        )
+        self.assertEqual(trans.merchant.transactionsCount, 12)
+        self.assertIsNone(trans.category)
+        self.assertIsNone(trans.updatedAt)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,3 +1,125 @@
+import csv
+import io
+
+from monarchmoneyamazontagger import amazon
+from monarchmoneyamazontagger import mm
+
+ORDER_HISTORY_CSV_FIELDS = [
+    "Website",
+    "Order ID",
+    "Order Date",
+    "Purchase Order Number",
+    "Currency",
+    "Unit Price",
+    "Unit Price Tax",
+    "Shipping Charge",
+    "Total Discounts",
+    "Total Owed",
+    "Shipment Item Subtotal",
+    "Shipment Item Subtotal Tax",
+    "ASIN",
+    "Product Condition",
+    "Quantity",
+    "Payment Instrument Type",
+    "Order Status",
+    "Shipment Status",
+    "Ship Date",
+    "Shipping Option",
+    "Shipping Address",
+    "Billing Address",
+    "Carrier Name & Tracking Number",
+    "Product Name",
+    "Gift Message",
+    "Gift Sender Name",
+    "Gift Recipient Contact Details",
+]
+
+
+def order_history_row(**overrides):
+    """Returns a single Retail.OrderHistory CSV row, keyed by CSV header."""
+    row = {
+        "Website": "Amazon.com",
+        "Order ID": "123-3211232-7655671",
+        "Order Date": "2014-02-26T19:21:42Z",
+        "Purchase Order Number": "Not Applicable",
+        "Currency": "USD",
+        "Unit Price": "5.45",
+        "Unit Price Tax": "0.525",
+        "Shipping Charge": "0",
+        "Total Discounts": "0",
+        "Total Owed": "11.95",
+        "Shipment Item Subtotal": "10.9",
+        "Shipment Item Subtotal Tax": "1.05",
+        "ASIN": "B00000JHQ0",
+        "Product Condition": "New",
+        "Quantity": "2",
+        "Payment Instrument Type": "Visa - 1234",
+        "Order Status": "Closed",
+        "Shipment Status": "Shipped",
+        "Ship Date": "2014-02-28T10:21:37Z",
+        "Shipping Option": "std-us",
+        "Shipping Address": "Some Great Buyer 123 Main St SEATTLE WA 98101 United States",
+        "Billing Address": "Some Great Buyer 123 Main St SEATTLE WA 98101 United States",
+        "Carrier Name & Tracking Number": "AMZN_US(TBA310866232294)",
+        "Product Name": "Duracell AAs",
+        "Gift Message": "Not Available",
+        "Gift Sender Name": "Not Available",
+        "Gift Recipient Contact Details": "Not Available",
+    }
+    row.update(overrides)
+    return row
+
+
+def order_history_csv(rows, bom=True):
+    """Returns the bytes of a Retail.OrderHistory CSV containing rows."""
+    out = io.StringIO(newline="")
+    writer = csv.DictWriter(
+        out, fieldnames=ORDER_HISTORY_CSV_FIELDS, quoting=csv.QUOTE_ALL
+    )
+    writer.writeheader()
+    writer.writerows(rows)
+    return ("\ufeff" if bom else "").encode("utf-8") + out.getvalue().encode("utf-8")
+
+
+def item(**overrides):
+    """Returns an amazon.Item parsed from order_history_row(**overrides)."""
+    csv_bytes = order_history_csv([order_history_row(**overrides)])
+    return next(amazon.Item.parse_from_csv(io.BytesIO(csv_bytes)))
+
+
+def transaction_json(**overrides):
+    """Returns a Monarch Money transaction, as returned by get_transactions."""
+    result = {
+        "id": "160713389926411893",
+        "amount": -11.95,
+        "date": "2014-02-28",
+        "originalDate": "2014-02-28",
+        "pending": False,
+        "needsReview": False,
+        "isRecurring": False,
+        "isSplitTransaction": False,
+        "hideFromReports": False,
+        "splitTransactions": [],
+        "originalTransaction": None,
+        "createdAt": "2014-02-28T15:43:18.634009+00:00",
+        "updatedAt": "2014-02-28T16:32:08.539592+00:00",
+        "category": {"id": "160713389926411811", "name": "Shopping"},
+        "merchant": {"id": "160713389926411822", "name": "Amazon"},
+        "account": {"id": "160713389926411833", "displayName": "Visa"},
+        "notes": None,
+        "tags": [],
+        "attachments": [],
+        "goal": None,
+        "plaidName": "AMAZON MKTPLACE PMTS",
+    }
+    result.update(overrides)
+    return result
+
+
+def transaction(**overrides):
+    return mm.Transaction(**transaction_json(**overrides))
+
+
 # from collections import OrderedDict
 
 # from monarchmoneyamazontagger import amazon
@@ -55,7 +55,7 @@ class QtProgress:
         pass
 
 
-def no_progress_factory(msg, max):
+def no_progress_factory(msg, max=0):
     return NoProgress()
 
 
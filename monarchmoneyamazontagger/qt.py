@@ -16,6 +16,15 @@ from monarchmoneyamazontagger import amazon
 from monarchmoneyamazontagger import mm
 
 
+def merchant_name(trans):
+    # Transactions may have no merchant or category (see tagger).
+    return trans.merchant.name if trans.merchant else ""
+
+
+def category_name(trans):
+    return trans.category.name if trans.category else ""
+
+
 class MMUpdatesTableModel(QAbstractTableModel):
     def __init__(self, updates, **kwargs):
         super(MMUpdatesTableModel, self).__init__(**kwargs)
@@ -27,25 +36,19 @@ class MMUpdatesTableModel(QAbstractTableModel):
             category_names = []
             amounts = []
 
-            if orig_trans.children:
-                for trans in orig_trans.children:
-                    descriptions.append("CURRENTLY: " + trans.description)
-                    category_names.append(trans.category.name)
-                    amounts.append(str(trans.amount))
-            else:
-                descriptions.append("CURRENTLY: " + orig_trans.description)
-                category_names.append(orig_trans.category.name)
-                amounts.append(str(orig_trans.amount))
+            descriptions.append("CURRENTLY: " + merchant_name(orig_trans))
+            category_names.append(category_name(orig_trans))
+            amounts.append(str(orig_trans.amount))
 
             if len(new_trans) == 1:
                 trans = new_trans[0]
-                descriptions.append("PROPOSED: " + trans.description)
-                category_names.append(trans.category.name)
+                descriptions.append("PROPOSED: " + merchant_name(trans))
+                category_names.append(category_name(trans))
                 amounts.append(str(trans.amount))
             else:
                 for trans in reversed(new_trans):
-                    descriptions.append("PROPOSED: " + trans.description)
-                    category_names.append(trans.category.name)
+                    descriptions.append("PROPOSED: " + merchant_name(trans))
+                    category_names.append(category_name(trans))
                     amounts.append(str(trans.amount))
 
             self.my_data.append(
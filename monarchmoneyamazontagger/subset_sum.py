@@ -0,0 +1,111 @@
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from monarchmoneyamazontagger.micro_usd import CENT_MICRO_USD, MICRO_USD_EPS
+
+
+def find_subsets(
+    amounts: List[int],
+    targets: Iterable[int],
+    min_size: int = 1,
+    max_size: Optional[int] = None,
+) -> Dict[int, List[Tuple[int, ...]]]:
+    """Finds every subset of amounts that adds up to each of targets.
+
+    amounts and targets are in micro dollars; a subset matches a target if its
+    sum is within MICRO_USD_EPS of it. Returns target -> subsets of min_size
+    to max_size amounts, as tuples of indices into amounts, smallest first and
+    then in the order of itertools.combinations. Subsets with the same total
+    are all returned: they may differ in ship date, or be needed by more than
+    one transaction of that amount.
+
+    A dynamic program first finds the (exact sum, size) pairs reachable with
+    each prefix of amounts, dropping partial sums that cannot end up near any
+    target whatever amounts are left to add. The subsets are then walked back
+    from the sums near a target, through reachable pairs only, so the work
+    scales with the number of distinct sums and of matching subsets rather
+    than with the number of all subsets.
+    """
+    if max_size is None or max_size > len(amounts):
+        max_size = len(amounts)
+    # Targets beyond what all negative (or all positive) amounts add up to
+    # cannot be reached, e.g. a refund among payments.
+    lowest = sum(a for a in amounts if a < 0)
+    highest = sum(a for a in amounts if a > 0)
+    targets = set(
+        t for t in targets if lowest - MICRO_USD_EPS < t < highest + MICRO_USD_EPS
+    )
+    if not targets or min_size > max_size:
+        return {}
+    low_target = min(targets) - MICRO_USD_EPS
+    high_target = max(targets) + MICRO_USD_EPS
+
+    # reachable[i]: the (exact sum, size) pairs amounts[:i] can add up to.
+    reachable = [{(0, 0)}]
+    # What the amounts after index can still add, at least and at most.
+    negative_left = lowest
+    positive_left = highest
+    for amount in amounts:
+        if amount < 0:
+            negative_left -= amount
+        else:
+            positive_left -= amount
+        states = set(reachable[-1])
+        for total, size in reachable[-1]:
+            if size == max_size:
+                continue
+            total += amount
+            if (
+                total + positive_left <= low_target
+                or total + negative_left >= high_target
+            ):
+                continue
+            states.add((total, size + 1))
+        reachable.append(states)
+
+    # (cent, size) -> [exact sum]
+    by_cent = defaultdict(list)
+    for total, size in reachable[-1]:
+        if size >= min_size:
+            by_cent[(total // CENT_MICRO_USD, size)].append(total)
+
+    result = {}
+    for target in targets:
+        # MICRO_USD_EPS is well under a cent: at most two cents to look in.
+        cents = range(
+            (target - MICRO_USD_EPS + 1) // CENT_MICRO_USD,
+            (target + MICRO_USD_EPS - 1) // CENT_MICRO_USD + 1,
+        )
+        subsets = []
+        for size in range(min_size, max_size + 1):
+            for cent in cents:
+                for total in by_cent.get((cent, size), ()):
+                    if abs(total - target) < MICRO_USD_EPS:
+                        subsets.extend(_walk_back(amounts, reachable, total, size))
+        if subsets:
+            result[target] = sorted(subsets, key=lambda s: (len(s), s))
+    return result
+
+
+def _walk_back(
+    amounts: List[int], reachable: List[Set[Tuple[int, int]]], total: int, size: int
+) -> Iterator[Tuple[int, ...]]:
+    """Yields every subset of size amounts that adds up to exactly total."""
+    # (number of amounts left to choose from, sum and size still to add, mask)
+    stack = [(len(amounts), total, size, 0)]
+    while stack:
+        index, total, size, mask = stack.pop()
+        if index == 0:
+            # Only (0, 0) is reachable with no amounts.
+            yield _indices(mask)
+            continue
+        index -= 1
+        if (total, size) in reachable[index]:
+            stack.append((index, total, size, mask))
+        rest = (total - amounts[index], size - 1)
+        if size and rest in reachable[index]:
+            stack.append((index, rest[0], rest[1], mask | 1 << index))
+
+
+def _indices(mask: int) -> Tuple[int, ...]:
+    return tuple(i for i in range(mask.bit_length()) if mask >> i & 1)
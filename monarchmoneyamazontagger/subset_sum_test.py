@@ -0,0 +1,80 @@
+import itertools
+import random
+import unittest
+
+from monarchmoneyamazontagger.subset_sum import find_subsets
+
+
+class FindSubsets(unittest.TestCase):
+    def test_no_targets(self):
+        self.assertEqual(find_subsets([-1000000, -2000000], []), {})
+
+    def test_every_subset_with_the_total(self):
+        self.assertEqual(
+            find_subsets([-10000000, -10000000, -5000000, -5000000], [-15000000]),
+            {-15000000: [(0, 2), (0, 3), (1, 2), (1, 3)]},
+        )
+
+    def test_smallest_first(self):
+        amounts = [-1000000, -2000000, -3000000, -4000000]
+        self.assertEqual(
+            find_subsets(amounts, [-3000000, -10000000, -99000000]),
+            {-3000000: [(2,), (0, 1)], -10000000: [(0, 1, 2, 3)]},
+        )
+
+    def test_size_bounds(self):
+        amounts = [-1000000, -2000000, -3000000]
+        self.assertEqual(
+            find_subsets(amounts, [-3000000, -6000000], min_size=2, max_size=2),
+            {-3000000: [(0, 1)]},
+        )
+
+    def test_within_eps(self):
+        # 0.99999 + 2.00000 is equal (within MICRO_USD_EPS) to 3.00000.
+        self.assertEqual(
+            find_subsets([999990, 2000000], [3000000], min_size=2),
+            {3000000: [(0, 1)]},
+        )
+        self.assertEqual(find_subsets([999900, 2000000], [3000000], min_size=2), {})
+
+    def test_same_cent_different_sums(self):
+        # 6000 + 8000 and 8000 + 12000 both round to 2 cents; only the latter
+        # is the target.
+        self.assertEqual(
+            find_subsets([6000, 8000, 12000], [20000], min_size=2),
+            {20000: [(1, 2)]},
+        )
+
+    def test_unreachable_targets(self):
+        # A refund (positive) among payments (negative) cannot be matched, and
+        # must not stop the search from bounding the sums.
+        amounts = [-cents * 10000 for cents in range(10000, 10030)]
+        self.assertEqual(
+            find_subsets(amounts, [5000000, sum(amounts[:2])], min_size=2),
+            {sum(amounts[:2]): [(0, 1)]},
+        )
+
+    def test_mixed_signs(self):
+        self.assertEqual(
+            find_subsets([-5000000, 1000000, -2000000], [-6000000], min_size=2),
+            {-6000000: [(0, 1, 2)]},
+        )
+
+    def test_agrees_with_enumeration(self):
+        rng = random.Random(42)
+        # Few distinct amounts, so that many subsets share a total.
+        amounts = [-rng.randrange(1, 20) * 100000 for _ in range(12)]
+        targets = [sum(rng.sample(amounts, 4)), sum(amounts[:2]), -12345]
+        result = find_subsets(amounts, targets, min_size=2)
+        for target in targets:
+            expected = [
+                c
+                for r in range(2, len(amounts) + 1)
+                for c in itertools.combinations(range(len(amounts)), r)
+                if sum(amounts[i] for i in c) == target
+            ]
+            self.assertEqual(result.get(target, []), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,17 +7,28 @@
 # https://www.amazon.com/gp/b2b/reports
 
 import asyncio
+from bisect import bisect_left, bisect_right
 from collections import defaultdict, namedtuple, Counter
+import copy
 import datetime
-import itertools
+import json
 import logging
 import readchar
-import zipfile
+import time
+import tracemalloc
 
 from monarchmoneyamazontagger import amazon
+from monarchmoneyamazontagger import amazon_export
+from monarchmoneyamazontagger import assignment
 from monarchmoneyamazontagger import category
+from monarchmoneyamazontagger import ledger
 from monarchmoneyamazontagger import mm
+from monarchmoneyamazontagger import subset_sum
+from monarchmoneyamazontagger.amount_index import AmountIndex
+from monarchmoneyamazontagger.args import MATCHER_NAMES
+from monarchmoneyamazontagger.match_stats import MatchStats, NO_MATCH_STATS
 from monarchmoneyamazontagger.my_progress import no_progress_factory
+from monarchmoneyamazontagger.worker_pool import WorkerPool
 
 logger = logging.getLogger(__name__)
 
@@ -30,8 +41,10 @@ UpdatesResult = namedtuple(
         "updates",
         "unmatched_charges",
         "stats",
+        # Matched transactions needing no update (see record_successful_run).
+        "settled_trans",
     ],
-    defaults=[False, None, None, None, None, None],
+    defaults=[False, None, None, None, None, None, None],
 )
 
 
@@ -43,49 +56,82 @@ def create_updates(
     determinate_progress_factory=no_progress_factory,
     counter_progress_factory=no_progress_factory,
 ):
-    items = []
+    # Parsing the exports and searching charge combinations (in every pass of
+    # the matcher) share one set of worker processes.
+    with WorkerPool(args.num_workers) as pool:
+        return _create_updates(
+            args,
+            mmc,
+            on_critical,
+            pool,
+            indeterminate_progress_factory,
+            determinate_progress_factory,
+            counter_progress_factory,
+        )
+
+
+def _create_updates(
+    args,
+    mmc,
+    on_critical,
+    pool,
+    indeterminate_progress_factory,
+    determinate_progress_factory,
+    counter_progress_factory,
+):
+    members = []
     for export_zip in args.amazon_export:
-        with zipfile.ZipFile(export_zip.name) as zip_file:
-            order_history_csvs = [
-                f for f in zip_file.namelist() if amazon.is_order_history_csv(f)
-            ]
-            if not order_history_csvs:
-                on_critical(
-                    "Cannot find any order history data in the given Amazon Export."
-                )
-                return UpdatesResult()
-
-            try:
-                for csv in order_history_csvs:
-                    items.extend(
-                        amazon.Item.parse_from_csv(
-                            zip_file.open(csv),
-                            progress_factory=determinate_progress_factory,
-                        )
-                    )
-            except AttributeError as e:
-                msg = (
-                    "Error while parsing Amazon Order history report CSV files: " f"{e}"
-                )
-                logger.exception(msg)
-                on_critical(msg)
-                return UpdatesResult()
+        order_history_csvs = amazon_export.find_order_history_csvs(export_zip.name)
+        if not order_history_csvs:
+            on_critical(
+                "Cannot find any order history data in the given Amazon Export."
+            )
+            return UpdatesResult()
+        members.extend((export_zip.name, csv) for csv in order_history_csvs)
+
+    since, until = get_item_date_window(args)
+
+    cache = None
+    if args.cache_amazon_exports:
+        cache = amazon_export.ExportCache(args.amazon_cache_path)
+    try:
+        member_items = amazon_export.parse_members(
+            members,
+            progress_factory=determinate_progress_factory,
+            cache=cache,
+            # Drops items from canceled or pending charges (only "Closed"
+            # orders), items with zero quantity, and items outside the date
+            # window.
+            item_filter=amazon.ItemFilter(since=since, until=until),
+            pool=pool,
+        )
+    except amazon_export.ExportParseError as e:
+        msg = f"Error while parsing Amazon Order history report CSV files: {e}"
+        logger.exception(msg)
+        on_critical(msg)
+        return UpdatesResult()
 
+    items, num_duplicates = amazon_export.merge_exports(members, member_items)
+    ledger.number_repeats(items)
+    if num_duplicates:
+        logger.info(
+            f"Ignoring {num_duplicates} items present in more than one Amazon Export."
+        )
+
+    if not len(items) and (since or until):
+        # Routine for --since_last_run when nothing was ordered since.
+        logger.info("No Amazon items within the given dates; nothing to do.")
+        return UpdatesResult(True, [], [], [], [], Counter(), [])
     if not len(items):
         on_critical(
             "The Items report contains no data. Try "
-            f"downloading again. Reports used: {order_history_csvs}"
+            f"downloading again. Reports used: {[csv for _, csv in members]}"
         )
         return UpdatesResult()
 
     # Sort all items by date, newest first. This is useful when multiple export zips are given.
-    items = sorted(
-        items,
-        key=lambda i: i.ship_date[0]
-        if i.ship_date and i.ship_date[0]
-        else datetime.datetime.now(datetime.timezone.utc),
-        reverse=True,
-    )
+    now = datetime.datetime.now(datetime.timezone.utc)
+    items.sort(key=lambda i: i.ship_date[0] if i.ship_date else now, reverse=True)
 
     # Initialize the stats. Explicitly initialize stats that might not be
     # accumulated (conditionals).
@@ -101,14 +147,10 @@ def create_updates(
         personal_cat=0,
     )
 
-    # Remove items from canceled charges or pending charges (only accept "Closed" orders).
-    items = [i for i in items if i.order_status == "Closed"]
-    # Remove items that haven't shipped yet / aren't charged / or cancelled items out of an otherwise valid order.
-    items = [i for i in items if i.shipment_status != "Not Available"]
-    # Remove items with zero quantity.
-    items = [i for i in items if i.quantity > 0]
+    # Leave out what earlier runs already matched (see --match_ledger).
+    new_items, settled_trans_ids = exclude_settled(args, items, stats)
 
-    charges = [amazon.Charge([i]) for i in items]
+    charges = [amazon.Charge([i]) for i in new_items]
     # THIS IS NOT ALWAYS THE CASE: I HAVE FOUND A CASE WERE THE SHIPMENT ITEM AMOUNTS WERE ACTUALLY SPLIT INTO TWO CC CHARGES FOR THE SAME CARD FOR AN ORDER THAT SHIPPED IN ONE BOX.
     # Merge charges if both the order id and the shipment item amount + shipment item tax align with total owed.
     # ie: Combine items into a charge that have matching:
@@ -140,33 +182,131 @@ def create_updates(
     #         # These will be cleaned up later with the combo matching logic per same order.
     #         charges.extend([amazon.Charge([i]) for i in items_same_id])
 
-    # Get the date of the oldest Amazon order.
-    start_date = min([date.date() for i in items for date in i.order_date])
+    categories_json = []
+    trans = []
+    if new_items:
+        # Only fetch transactions that could pay for the (windowed) items.
+        start_date, end_date = get_transaction_date_window(
+            args, new_items, since, until
+        )
 
-    cat_progress = indeterminate_progress_factory("Getting MM Categories")
-    categories_json = asyncio.run(mmc.get_categories())
-    cat_progress.finish()
+        cat_progress = indeterminate_progress_factory("Getting MM Categories")
+        categories_json = asyncio.run(mmc.get_categories())
+        cat_progress.finish()
 
-    trans_progress = indeterminate_progress_factory("Getting MM Transactions")
-    transactions_json = asyncio.run(mmc.get_transactions(start_date))
-    trans_progress.finish()
+        transactions_json = asyncio.run(
+            mmc.get_transactions(
+                start_date,
+                end_date,
+                progress_factory=determinate_progress_factory,
+            )
+        )
 
-    parse_progress = determinate_progress_factory(
-        "Parsing MM Transactions", len(transactions_json)
-    )
-    trans = mm.Transaction.parse_from_json(transactions_json, parse_progress)
-    parse_progress.finish()
+        parse_progress = determinate_progress_factory(
+            "Parsing MM Transactions", len(transactions_json)
+        )
+        trans = mm.Transaction.parse_from_json(transactions_json, parse_progress)
+        parse_progress.finish()
+    else:
+        logger.info("All Amazon items were matched by earlier runs.")
 
-    updates, unmatched_charges = get_mint_updates(
-        items,
+    updates, unmatched_charges, settled_trans = get_mint_updates(
+        new_items,
         charges,
         trans,
         args,
         stats,
         categories_json,
         progress_factory=determinate_progress_factory,
+        pool=pool,
+        settled_trans_ids=settled_trans_ids,
     )
-    return UpdatesResult(True, items, charges, updates, unmatched_charges, stats)
+    return UpdatesResult(
+        True, items, charges, updates, unmatched_charges, stats, settled_trans
+    )
+
+
+def get_item_date_window(args):
+    """Returns the (since, until) datetimes bounding Amazon items to match.
+
+    Either may be None, for no bound. since is widened by
+    max_days_between_payment_and_shipping, as items shipped shortly before it
+    may have been charged after it.
+    """
+    margin = datetime.timedelta(days=args.max_days_between_payment_and_shipping)
+    since = None
+    if args.since:
+        since = _local_midnight(args.since) - margin
+    if args.since_last_run:
+        last_run = amazon_export.since_high_water_mark(
+            args.tagger_state_path, args.max_days_between_payment_and_shipping
+        )
+        if last_run and (not since or last_run > since):
+            since = last_run
+    until = None
+    if args.until:
+        until = _local_midnight(args.until + datetime.timedelta(days=1))
+    return since, until
+
+
+def get_transaction_date_window(args, items, since, until):
+    """Returns the (start, end) dates of Monarch Money transactions to fetch.
+
+    Payments post on or after an item ships, up to
+    max_days_between_payment_and_shipping later.
+    """
+    start_date = min([date.date() for i in items for date in i.order_date])
+    if since:
+        start_date = max(start_date, since.astimezone().date())
+    end_date = None
+    if until:
+        margin = datetime.timedelta(days=args.max_days_between_payment_and_shipping)
+        end_date = (until + margin).astimezone().date()
+    return start_date, end_date
+
+
+def _local_midnight(date):
+    return datetime.datetime.combine(date, datetime.time()).astimezone()
+
+
+def record_successful_run(args, items, settled_trans=()):
+    """Call after updates have been sent, to support --since_last_run.
+
+    settled_trans are the matched transactions that are now up to date: the
+    ones updated, and UpdatesResult.settled_trans. With --match_ledger, they
+    are left out of later runs.
+    """
+    amazon_export.save_high_water_mark(args.tagger_state_path, items)
+    if args.match_ledger:
+        with ledger.MatchLedger(args.match_ledger_path) as match_ledger:
+            match_ledger.record(settled_trans)
+
+
+def exclude_settled(args, items, stats):
+    """Returns the items not yet matched by an earlier run, and the ids of
+    transactions already matched (see --match_ledger).
+
+    Applies --rebuild_match_ledger and --invalidate_match_ledger_since first.
+    Retagging (--retag_changed, --prompt_retag) needs every match, so then
+    nothing is excluded.
+    """
+    if not args.match_ledger:
+        return items, set()
+    with ledger.MatchLedger(args.match_ledger_path) as match_ledger:
+        if args.rebuild_match_ledger:
+            num_trans = match_ledger.invalidate()
+            logger.info(f"Cleared {num_trans} transactions from the match ledger.")
+        elif args.invalidate_match_ledger_since:
+            num_trans = match_ledger.invalidate(args.invalidate_match_ledger_since)
+            logger.info(f"Cleared {num_trans} transactions from the match ledger.")
+        if args.retag_changed or args.prompt_retag:
+            return items, set()
+        settled_item_keys = match_ledger.matched_item_keys()
+        settled_trans_ids = match_ledger.matched_trans_ids()
+
+    new_items = [i for i in items if ledger.item_key(i) not in settled_item_keys]
+    stats["ledger_settled_items"] = len(items) - len(new_items)
+    return new_items, settled_trans_ids
 
 
 def get_mint_category_history_for_items(trans, args):
@@ -177,7 +317,7 @@ def get_mint_category_history_for_items(trans, args):
     if args.do_not_predict_categories:
         return None
     # Don't worry about pending.
-    trans = [t for t in trans if not t.is_pending]
+    trans = [t for t in trans if not t.pending]
     # Only do debits for now.
     trans = [t for t in trans if t.amount < 0]
 
@@ -186,23 +326,27 @@ def get_mint_category_history_for_items(trans, args):
     valid_prefixes = [f"{pre}: " for pre in valid_prefixes]
     if args.description_prefix_override:
         valid_prefixes.append(args.description_prefix_override.lower())
+    # Tagged transactions (and splits) are named after their item.
     trans = [
         t
         for t in trans
-        if any(t.description.lower().startswith(pre) for pre in valid_prefixes)
+        if t.merchant
+        and any(t.merchant.name.lower().startswith(pre) for pre in valid_prefixes)
     ]
 
     # Filter out the default category: there is no signal here.
-    trans = [t for t in trans if t.category.name != category.DEFAULT_CATEGORY]
+    trans = [
+        t for t in trans if t.category and t.category.name != category.DEFAULT_CATEGORY
+    ]
 
     # Filter out non-item descriptions.
-    trans = [t for t in trans if t.description not in mm.NON_ITEM_DESCRIPTIONS]
+    trans = [t for t in trans if t.merchant.name not in mm.NON_ITEM_DESCRIPTIONS]
 
     item_to_cats = defaultdict(Counter)
     for t in trans:
         # Remove the prefix for the item:
         for pre in valid_prefixes:
-            item_name = t.description.lower()
+            item_name = t.merchant.name.lower()
             # Find & remove the prefix and remove any leading '3x '.
             if item_name.startswith(pre):
                 item_name = amazon.rm_leading_qty(item_name[len(pre) :])
@@ -225,31 +369,44 @@ def get_mint_updates(
     stats,
     mint_categories,
     progress_factory=no_progress_factory,
+    pool=None,
+    settled_trans_ids=frozenset(),
 ):
+    # Transactions tagged by earlier runs are the category history, even the
+    # ones settled in the match ledger.
     mint_historic_category_renames = get_mint_category_history_for_items(trans, args)
 
+    # Only match what earlier runs did not (see exclude_settled).
+    if settled_trans_ids:
+        num_trans = len(trans)
+        trans = [t for t in trans if t.id not in settled_trans_ids]
+        stats["ledger_settled_trans"] = num_trans - len(trans)
+
     # trans = mm.Transaction.unsplit(trans)
     stats["trans"] = len(trans)
     trans = sorted(trans, key=lambda t: t.date)
 
     # Skip t if the original description doesn't contain 'amazon'
-    merch_whitelist = args.mint_input_description_filter.lower().split(",")
+    merch_whitelist = args.mm_input_description_filter.lower().split(",")
 
     def get_original_names(t):
         """Returns a tuple of description strings to consider"""
         # Always consider the original description from the financial
-        # institution. Conditionally consider the current/user description or
-        # the Mint inferred description.
-
-        # Manually added transactions don't have `fi_data.description`, so return user description
-        if not hasattr(t.fi_data, "description"):
-            return (t.description.lower(),)
-
-        result = (t.fi_data.description.lower(),)
-        if args.mint_input_include_user_description:
-            result = result + (t.description.lower(),)
-        if args.mint_input_include_inferred_description:
-            result = result + (t.fi_data.inferred_description.lower(),)
+        # institution (plaidName). Conditionally consider the merchant name,
+        # which Monarch Money infers and the user may edit.
+        merchant_name = t.merchant.name.lower() if t.merchant else ""
+
+        # Manually added transactions don't have a plaidName, so return the
+        # merchant name.
+        if not t.plaidName:
+            return (merchant_name,)
+
+        result = (t.plaidName.lower(),)
+        if (
+            args.mm_input_include_user_description
+            or args.mm_input_include_inferred_description
+        ):
+            result = result + (merchant_name,)
         return result
 
     trans = [
@@ -263,21 +420,44 @@ def get_mint_updates(
 
     stats["amazon_in_desc"] = len(trans)
     # Skip t if it's pending.
-    trans = [t for t in trans if not t.is_pending]
+    trans = [t for t in trans if not t.pending]
     stats["pending"] = stats["amazon_in_desc"] - len(trans)
     # Skip t if a category filter is given and t does not match.
-    if args.mint_input_categories_filter:
-        cat_whitelist = set(args.mint_input_categories_filter.lower().split(","))
-        trans = [t for t in trans if t.category.name.lower() in cat_whitelist]
+    if args.mm_input_categories_filter:
+        cat_whitelist = set(args.mm_input_categories_filter.lower().split(","))
+        trans = [
+            t for t in trans if t.category and t.category.name.lower() in cat_whitelist
+        ]
 
     # Match charges.
     orderMatchProgress = progress_factory(
         "Matching Amazon Items w/ Mint Trans", len(items)
     )
-    match_transactions_orig_with_shipment_merge2(
-        trans, charges, args, orderMatchProgress
+    if args.compare_matchers:
+        logger.info(
+            format_matcher_reports(compare_matchers(trans, charges, args, pool=pool))
+        )
+    match_stats = (
+        MatchStats() if args.match_stats or args.match_stats_json else NO_MATCH_STATS
     )
+    matcher = MATCHERS[args.matcher]
+    instrument_accounts = learned_instrument_accounts(args)
+    if instrument_accounts:
+        match_by_account(
+            trans,
+            charges,
+            args,
+            matcher,
+            instrument_accounts,
+            orderMatchProgress,
+            match_stats,
+            pool,
+        )
+    else:
+        matcher(trans, charges, args, orderMatchProgress, match_stats, pool)
     orderMatchProgress.finish()
+    if match_stats.enabled:
+        report_match_stats(match_stats, args, stats)
 
     unmatched_trans = [t for t in trans if not t.charges]
 
@@ -315,8 +495,10 @@ def get_mint_updates(
     stats["skipped_charges_gift_card"] = num_gift_card
     stats["skipped_charges_unshipped"] = num_unshipped
 
+    categories_by_name = {c["name"]: c for c in mint_categories}
     updateCounter = progress_factory("Determining Mint Updates", len(matched_trans))
     updates = []
+    settled_trans = []
     for t in matched_trans:
         updateCounter.next()
         if t.amount < 0:
@@ -344,7 +526,7 @@ def get_mint_updates(
 
         for nt in new_transactions:
             # Look if there's a personal category tagged.
-            item_name = amazon.rm_leading_qty(nt.description.lower())
+            item_name = amazon.rm_leading_qty(nt.merchant.name.lower())
             if (
                 mint_historic_category_renames
                 and item_name in mint_historic_category_renames
@@ -354,8 +536,6 @@ def get_mint_updates(
                     stats["personal_cat"] += 1
                     nt.category.name = mint_historic_category_renames[item_name]
 
-            nt.update_category_id(mint_categories)
-
         summarize_single_item_order = (
             t.amount < 0 and len(charge.items) == 1 and not args.verbose_itemize
         )
@@ -363,11 +543,14 @@ def get_mint_updates(
             new_transactions = mm.summarize_new_trans(t, new_transactions, prefix)
         else:
             new_transactions = mm.itemize_new_trans(new_transactions, prefix)
+        for nt in new_transactions:
+            nt.update_category_id(categories_by_name)
 
         if mm.Transaction.old_and_new_are_identical(
             t, new_transactions, ignore_category=args.no_tag_categories
         ):
             stats["already_up_to_date"] += 1
+            settled_trans.append(t)
             continue
 
         valid_prefixes = args.amazon_domains.lower().split(",") + [prefix.lower()]
@@ -375,8 +558,8 @@ def get_mint_updates(
         # sure to check for possible prefixes with ": ". Some financial
         # institutions are showing Amazon purchases as "AMAZON.COM ..." in Mint,
         # making a simple prefix search unsuitable.
-        has_prefix = any(
-            t.description.lower().startswith(pre + ": ") for pre in valid_prefixes
+        has_prefix = t.merchant and any(
+            t.merchant.name.lower().startswith(pre + ": ") for pre in valid_prefixes
         )
         if has_prefix:
             if args.prompt_retag:
@@ -396,6 +579,7 @@ def get_mint_updates(
                 stats["retag"] += 1
             elif not args.retag_changed:
                 stats["no_retag"] += 1
+                settled_trans.append(t)
                 continue
             else:
                 stats["retag"] += 1
@@ -406,257 +590,445 @@ def get_mint_updates(
     if args.num_updates > 0:
         updates = updates[: args.num_updates]
 
-    return updates, unmatched_charges
+    return updates, unmatched_charges, settled_trans
     # return updates, unmatched_charges + unmatched_refunds
 
 
-def mark_best_as_matched(t, list_of_charges_or_refunds, args, progress=None):
-    if not list_of_charges_or_refunds:
-        return
+def exact_amount(amount):
+    """A hashable key for grouping by identical (not just equal) amounts."""
+    return amount.micro_usd if amount is not None else None
+
+
+class ChargeGroupIndex:
+    """Candidate groups of charges, by amount, for mark_best_as_matched.
+
+    Each group's last ship date is computed once, on add. The groups for a
+    given amount are sorted once, newest first, on first lookup.
+    """
 
+    def __init__(self):
+        self._amounts = AmountIndex()
+        self._num_groups = 0
+        # micro_usd -> (negated ship date ordinals, [(ship date, id, charges)])
+        self._sorted = {}
+        # Set by index_charge_combinations, for MatchStats.
+        self.combinations = 0
+        self.orders_over_cap = 0
+        self.charges_over_cap = 0
+
+    def add(self, amount, charges):
+        ship_dates = [c.transact_date() for c in charges if c.transact_date()]
+        if not ship_dates:
+            # Unshipped: there is no charge to match yet.
+            return
+        self._amounts.add(amount, (max(ship_dates), self._num_groups, charges))
+        self._num_groups += 1
+        self._sorted.clear()
+
+    def candidates(self, t, max_days):
+        """Yields (days, group id, charges) that could have been paid by t.
+
+        These are the groups shipped on, or up to max_days before, the
+        transaction date; closest first, then in the order added.
+        """
+        result = self._sorted.get(t.amount.micro_usd)
+        if result is None:
+            # sort is stable: same day groups remain in the order added.
+            groups = sorted(
+                self._amounts.get(t.amount), key=lambda g: g[0], reverse=True
+            )
+            result = ([-g[0].toordinal() for g in groups], groups)
+            self._sorted[t.amount.micro_usd] = result
+        keys, groups = result
+
+        trans_ordinal = t.date.toordinal()
+        for index in range(bisect_left(keys, -trans_ordinal), len(keys)):
+            days = trans_ordinal + keys[index]
+            if days > max_days:
+                break
+            _, group_id, charges = groups[index]
+            yield days, group_id, charges
+
+    def num_groups(self):
+        return self._num_groups
+
+    def bucket_sizes(self):
+        return self._amounts.bucket_sizes()
+
+
+def mark_best_as_matched(t, amount_to_charges, args, progress=None):
     # Only consider it a match if the posted date (transaction date) is
     # within a low number of days of the ship date of the order.
+    # TODO: consider charges even if it has a matched_transaction if this
+    # transaction is closer (see assign_optimally).
     max_days = args.max_days_between_payment_and_shipping
-    closest_match_num_days = max_days + 365  # Large number
-    closest_match = None
+    for _, _, charges in amount_to_charges.candidates(t, max_days):
+        if not any([c.matched for c in charges]):
+            match_charges(t, charges, progress)
+            return
 
-    for charges in list_of_charges_or_refunds:
-        last_shipment = max([c.transact_date() for c in charges if c.transact_date()])
-        if not last_shipment:
-            continue
-        num_days = (t.date - last_shipment).days
-        # TODO: consider charges even if it has a matched_transaction if this
-        # transaction is closer.
-        already_matched = any([c.matched for c in charges])
-        if (
-            num_days <= max_days
-            and num_days >= 0
-            and num_days < closest_match_num_days
-            and not already_matched
-        ):
-            closest_match = charges
-            closest_match_num_days = num_days
 
-    if closest_match:
-        for c in closest_match:
-            c.match(t)
+def match_charges(t, charges, progress=None):
+    for c in charges:
+        c.match(t)
 
-        t.match(closest_match)
-        if progress:
-            progress.next(len(closest_match))
+    t.match(charges)
+    if progress:
+        progress.next(len(charges))
 
 
-def match_transactions_orig(unmatched_trans, unmatched_charges, args, progress=None):
-    # First pass: Match up transactions that exactly equal an order's charged
-    # amount.
-    amount_to_charges = defaultdict(list)
+def assign_matches(unmatched_trans, amount_to_charges, args, progress=None):
+    """Matches transactions to candidate groups of charges."""
+    if args.assignment_engine == "optimal":
+        assign_optimally(unmatched_trans, amount_to_charges, args, progress)
+        return
+    for t in unmatched_trans:
+        mark_best_as_matched(t, amount_to_charges, args, progress)
 
-    for c in unmatched_charges:
-        amount_to_charges[c.transact_amount()].append([c])
+
+def assign_optimally(unmatched_trans, amount_to_charges, args, progress=None):
+    """Matches as many transactions as possible, then as closely as possible.
+
+    Unlike mark_best_as_matched, an earlier transaction does not get to claim
+    a group that a later transaction is closer to. Groups overlapping in
+    charges (from combinations) are not exclusive of each other in the
+    assignment, so any such conflicts are settled closest first, and the
+    losing transactions fall back to mark_best_as_matched.
+    """
+    max_days = args.max_days_between_payment_and_shipping
+    edges = []
+    groups = {}
+    for trans_index, t in enumerate(unmatched_trans):
+        for days, group_id, charges in amount_to_charges.candidates(t, max_days):
+            if not any([c.matched for c in charges]):
+                edges.append((trans_index, group_id, days))
+                groups[group_id] = charges
+
+    days_by_pair = {(left, right): days for left, right, days in edges}
+    pairs = sorted(
+        assignment.min_cost_matching(edges),
+        key=lambda pair: (days_by_pair[pair], pair[0]),
+    )
+    for trans_index, group_id in pairs:
+        charges = groups[group_id]
+        if not any([c.matched for c in charges]):
+            match_charges(unmatched_trans[trans_index], charges, progress)
 
     for t in unmatched_trans:
-        mark_best_as_matched(t, amount_to_charges[t.amount], args, progress)
+        if not t.charges:
+            mark_best_as_matched(t, amount_to_charges, args, progress)
 
-    unmatched_charges = [c for c in unmatched_charges if not c.matched]
-    unmatched_trans = [t for t in unmatched_trans if not t.charges]
 
-    # Second pass: Match up transactions to a combination of charges (sometimes
-    # they are charged together).
+def index_charge_combinations(
+    unmatched_trans, unmatched_charges, args, min_size=2, include_all=True, pool=None
+):
+    """Indexes the combinations of charges that could pay a transaction.
+
+    Only combinations of charges from the same order, of at least min_size
+    charges (and excluding all of an order's charges, unless include_all) are
+    considered. Rather than enumerating every combination, each order only
+    looks for combinations adding up to the amount of a transaction dated
+    within its shipping window (see subset_sum.find_subsets). Orders are
+    independent of each other, so they are searched in pool's processes when
+    there are many (see find_combinations).
+    """
+    max_days = args.max_days_between_payment_and_shipping
+    trans_by_date = sorted(
+        (t.date.toordinal(), t.amount.micro_usd) for t in unmatched_trans
+    )
+    trans_ordinals = [ordinal for ordinal, _ in trans_by_date]
+
     oid_to_charges = defaultdict(list)
     for c in unmatched_charges:
         oid_to_charges[c.order_id()].append(c)
 
-    amount_to_charges = defaultdict(list)
+    amount_to_charges = ChargeGroupIndex()
+    orders = []
+    jobs = []
     for charges_same_id in oid_to_charges.values():
-        if len(charges_same_id) == 1:
+        if len(charges_same_id) < min_size:
             continue
-
-        # Expanding all combinations does not scale, so short-circuit out order ids that have a high unmatched count
+        # A safety valve for orders with an unusually high unmatched count.
         if len(charges_same_id) > args.max_unmatched_charges_combinations:
+            amount_to_charges.orders_over_cap += 1
+            amount_to_charges.charges_over_cap += len(charges_same_id)
+            continue
+        ship_dates = [
+            c.transact_date().toordinal() for c in charges_same_id if c.transact_date()
+        ]
+        if not ship_dates:
             continue
+        # Payments post on, or up to max_days after, a shipment.
+        first = bisect_left(trans_ordinals, min(ship_dates))
+        last = bisect_right(trans_ordinals, max(ship_dates) + max_days)
+        targets = sorted(set(micro_usd for _, micro_usd in trans_by_date[first:last]))
+        if not targets:
+            continue
+        orders.append(charges_same_id)
+        jobs.append(
+            (
+                [c.transact_amount().micro_usd for c in charges_same_id],
+                targets,
+                min_size,
+                len(charges_same_id) - (0 if include_all else 1),
+            )
+        )
 
-        combos = []
-        for r in range(2, len(charges_same_id) + 1):
-            combos.extend(itertools.combinations(charges_same_id, r))
-        for c in combos:
-            charges_total = sum([charge.transact_amount() for charge in c])
-            amount_to_charges[charges_total].append(c)
+    combinations = find_combinations(jobs, pool)
+    for charges_same_id, subsets in zip(orders, combinations):
+        amount_to_charges.combinations += len(subsets)
+        for indices in subsets:
+            combo = [charges_same_id[i] for i in indices]
+            amount_to_charges.add(
+                sum([charge.transact_amount() for charge in combo]), combo
+            )
+    return amount_to_charges
 
-    for t in unmatched_trans:
-        mark_best_as_matched(t, amount_to_charges[t.amount], args, progress)
 
+# Below this many orders per worker process, starting the processes costs
+# more than searching the orders in this process.
+MIN_COMBINATION_ORDERS_PER_WORKER = 200
 
-def match_transactions_orig_inverted(
-    unmatched_trans, unmatched_charges, args, progress=None
-):
-    # Second pass: Match up transactions to a combination of charges (sometimes
-    # they are charged together).
-    oid_to_charges = defaultdict(list)
-    for c in unmatched_charges:
-        oid_to_charges[c.order_id()].append(c)
 
-    amount_to_charges = defaultdict(list)
-    for charges_same_id in oid_to_charges.values():
-        if len(charges_same_id) == 1:
-            continue
+def find_combinations(jobs, pool=None):
+    """Runs find_order_combinations for each job.
 
-        # Expanding all combinations does not scale, so short-circuit out order ids that have a high unmatched count
-        if len(charges_same_id) > args.max_unmatched_charges_combinations:
-            continue
+    Uses pool's worker processes when there are enough jobs, and this process
+    otherwise (or without a pool). Results are in the order of jobs, so they
+    are the same regardless of the number of workers.
+    """
+    num_workers = (
+        pool.workers_for(len(jobs) // MIN_COMBINATION_ORDERS_PER_WORKER) if pool else 0
+    )
+    if num_workers <= 1:
+        return [find_order_combinations(job) for job in jobs]
+    # A few chunks per worker evens out orders of very different sizes.
+    chunksize = -(-len(jobs) // (num_workers * 4))
+    return list(pool.executor().map(find_order_combinations, jobs, chunksize=chunksize))
 
-        combos = []
-        for r in range(2, len(charges_same_id) + 1):
-            combos.extend(itertools.combinations(charges_same_id, r))
-        for c in combos:
-            charges_total = sum([charge.transact_amount() for charge in c])
-            amount_to_charges[charges_total].append(c)
 
-    for t in unmatched_trans:
-        mark_best_as_matched(t, amount_to_charges[t.amount], args, progress)
+def find_order_combinations(job):
+    """Returns the distinct subsets of one order's charges that add up to a
+    transaction amount, as tuples of charge indices. They are in the order of
+    itertools.combinations, smallest first, which breaks ship date ties in
+    mark_best_as_matched.
 
-    unmatched_charges = [c for c in unmatched_charges if not c.matched]
-    unmatched_trans = [t for t in unmatched_trans if not t.charges]
+    job is (charge amounts, sorted transaction amounts, min_size, max_size),
+    in micro dollars: plain ints are cheap to send to a worker process.
+    """
+    amounts, targets, min_size, max_size = job
+    subsets_by_target = subset_sum.find_subsets(
+        amounts, targets, min_size=min_size, max_size=max_size
+    )
+    result = []
+    seen = set()
+    for target in targets:
+        for indices in subsets_by_target.get(target, []):
+            if indices not in seen:
+                seen.add(indices)
+                result.append(indices)
+    return sorted(result, key=lambda indices: (len(indices), indices))
 
-    # First pass: Match up transactions that exactly equal an order's charged
-    # amount.
-    amount_to_charges = defaultdict(list)
 
-    for c in unmatched_charges:
-        amount_to_charges[c.transact_amount()].append([c])
+# Matching strategies by --matcher name. Each takes (unmatched_trans,
+# unmatched_charges, args, progress, match_stats, pool) and marks its matches on
+# those objects. Strategies that regroup charges replace the contents of
+# unmatched_charges. Each pass is measured with match_stats. Names are listed
+# in args.MATCHER_NAMES.
+MATCHERS = {}
 
-    for t in unmatched_trans:
-        mark_best_as_matched(t, amount_to_charges[t.amount], args, progress)
 
+def register_matcher(name):
+    assert name in MATCHER_NAMES, f"Add {name} to args.MATCHER_NAMES"
 
-def match_transactions_all_combo_singles(
-    unmatched_trans, unmatched_charges, args, progress=None
+    def register(matcher):
+        MATCHERS[name] = matcher
+        return matcher
+
+    return register
+
+
+@register_matcher("orig")
+def match_transactions_orig(
+    unmatched_trans,
+    unmatched_charges,
+    args,
+    progress=None,
+    match_stats=NO_MATCH_STATS,
+    pool=None,
 ):
-    # First pass: Match up transactions where all charges are charged together for orders with more than one item:
-    oid_to_charges = defaultdict(list)
-    for c in unmatched_charges:
-        oid_to_charges[c.order_id()].append(c)
+    # First pass: Match up transactions that exactly equal an order's charged
+    # amount.
+    with match_stats.measure("singles", unmatched_trans) as record:
+        amount_to_charges = ChargeGroupIndex()
+        for c in unmatched_charges:
+            amount_to_charges.add(c.transact_amount(), [c])
+        record(amount_to_charges)
+        assign_matches(unmatched_trans, amount_to_charges, args, progress)
 
-    amount_to_charges = defaultdict(list)
-    for charges_same_id in oid_to_charges.values():
-        if len(charges_same_id) == 1:
-            continue
+    unmatched_charges = [c for c in unmatched_charges if not c.matched]
+    unmatched_trans = [t for t in unmatched_trans if not t.charges]
 
-        charges_total = sum([charge.transact_amount() for charge in charges_same_id])
-        amount_to_charges[charges_total].append(charges_same_id)
+    # Second pass: Match up transactions to a combination of charges (sometimes
+    # they are charged together).
+    with match_stats.measure("combos", unmatched_trans) as record:
+        amount_to_charges = index_charge_combinations(
+            unmatched_trans, unmatched_charges, args, min_size=2, pool=pool
+        )
+        record(amount_to_charges)
+        assign_matches(unmatched_trans, amount_to_charges, args, progress)
 
-    for t in unmatched_trans:
-        mark_best_as_matched(t, amount_to_charges[t.amount], args, progress)
+
+@register_matcher("orig_inverted")
+def match_transactions_orig_inverted(
+    unmatched_trans,
+    unmatched_charges,
+    args,
+    progress=None,
+    match_stats=NO_MATCH_STATS,
+    pool=None,
+):
+    # Second pass: Match up transactions to a combination of charges (sometimes
+    # they are charged together).
+    with match_stats.measure("combos", unmatched_trans) as record:
+        amount_to_charges = index_charge_combinations(
+            unmatched_trans, unmatched_charges, args, min_size=2, pool=pool
+        )
+        record(amount_to_charges)
+        assign_matches(unmatched_trans, amount_to_charges, args, progress)
 
     unmatched_charges = [c for c in unmatched_charges if not c.matched]
     unmatched_trans = [t for t in unmatched_trans if not t.charges]
 
-    # Second pass: Match up transactions to a combination of charges (but not all, and not singletons).
-    oid_to_charges = defaultdict(list)
-    for c in unmatched_charges:
-        oid_to_charges[c.order_id()].append(c)
+    # First pass: Match up transactions that exactly equal an order's charged
+    # amount.
+    with match_stats.measure("singles", unmatched_trans) as record:
+        amount_to_charges = ChargeGroupIndex()
+        for c in unmatched_charges:
+            amount_to_charges.add(c.transact_amount(), [c])
+        record(amount_to_charges)
+        assign_matches(unmatched_trans, amount_to_charges, args, progress)
 
-    amount_to_charges = defaultdict(list)
-    for charges_same_id in oid_to_charges.values():
-        if len(charges_same_id) == 1:
-            continue
 
-        # Expanding all combinations does not scale, so short-circuit out order ids that have a high unmatched count
-        if len(charges_same_id) > args.max_unmatched_charges_combinations:
-            continue
+@register_matcher("all_combo_singles")
+def match_transactions_all_combo_singles(
+    unmatched_trans,
+    unmatched_charges,
+    args,
+    progress=None,
+    match_stats=NO_MATCH_STATS,
+    pool=None,
+):
+    # First pass: Match up transactions where all charges are charged together for orders with more than one item:
+    with match_stats.measure("whole_orders", unmatched_trans) as record:
+        oid_to_charges = defaultdict(list)
+        for c in unmatched_charges:
+            oid_to_charges[c.order_id()].append(c)
+
+        amount_to_charges = ChargeGroupIndex()
+        for charges_same_id in oid_to_charges.values():
+            if len(charges_same_id) == 1:
+                continue
 
-        combos = []
-        for r in range(2, len(charges_same_id)):
-            combos.extend(itertools.combinations(charges_same_id, r))
-        for c in combos:
-            charges_total = sum([charge.transact_amount() for charge in c])
-            amount_to_charges[charges_total].append(c)
+            charges_total = sum(
+                [charge.transact_amount() for charge in charges_same_id]
+            )
+            amount_to_charges.add(charges_total, charges_same_id)
+        record(amount_to_charges)
+        assign_matches(unmatched_trans, amount_to_charges, args, progress)
 
-    for t in unmatched_trans:
-        mark_best_as_matched(t, amount_to_charges[t.amount], args, progress)
+    unmatched_charges = [c for c in unmatched_charges if not c.matched]
+    unmatched_trans = [t for t in unmatched_trans if not t.charges]
+
+    # Second pass: Match up transactions to a combination of charges (but not all, and not singletons).
+    with match_stats.measure("partial_combos", unmatched_trans) as record:
+        amount_to_charges = index_charge_combinations(
+            unmatched_trans,
+            unmatched_charges,
+            args,
+            min_size=2,
+            include_all=False,
+            pool=pool,
+        )
+        record(amount_to_charges)
+        assign_matches(unmatched_trans, amount_to_charges, args, progress)
 
     unmatched_charges = [c for c in unmatched_charges if not c.matched]
     unmatched_trans = [t for t in unmatched_trans if not t.charges]
 
     # Third pass: Match up transactions that exactly equal an order's charged
     # amount.
-    amount_to_charges = defaultdict(list)
-
-    for c in unmatched_charges:
-        amount_to_charges[c.transact_amount()].append([c])
-
-    for t in unmatched_trans:
-        mark_best_as_matched(t, amount_to_charges[t.amount], args, progress)
+    with match_stats.measure("singles", unmatched_trans) as record:
+        amount_to_charges = ChargeGroupIndex()
+        for c in unmatched_charges:
+            amount_to_charges.add(c.transact_amount(), [c])
+        record(amount_to_charges)
+        assign_matches(unmatched_trans, amount_to_charges, args, progress)
 
 
+@register_matcher("single_pass_singletons")
 def match_transactions_single_pass_singletons(
-    unmatched_trans, unmatched_charges, args, progress=None
+    unmatched_trans,
+    unmatched_charges,
+    args,
+    progress=None,
+    match_stats=NO_MATCH_STATS,
+    pool=None,
 ):
     # First pass: Match up transactions that exactly equal an order's charged
     # amount.
-    amount_to_charges = defaultdict(list)
-
-    for c in unmatched_charges:
-        amount_to_charges[c.transact_amount()].append([c])
-
-    for t in unmatched_trans:
-        mark_best_as_matched(t, amount_to_charges[t.amount], args, progress)
+    with match_stats.measure("singles", unmatched_trans) as record:
+        amount_to_charges = ChargeGroupIndex()
+        for c in unmatched_charges:
+            amount_to_charges.add(c.transact_amount(), [c])
+        record(amount_to_charges)
+        assign_matches(unmatched_trans, amount_to_charges, args, progress)
 
 
+@register_matcher("single_pass_multi_combos")
 def match_transactions_single_pass_multi_combos(
-    unmatched_trans, unmatched_charges, args, progress=None
+    unmatched_trans,
+    unmatched_charges,
+    args,
+    progress=None,
+    match_stats=NO_MATCH_STATS,
+    pool=None,
 ):
     # Match up transactions to a combination of charges (sometimes they are charged together).
-    oid_to_charges = defaultdict(list)
-    for c in unmatched_charges:
-        oid_to_charges[c.order_id()].append(c)
-
-    amount_to_charges = defaultdict(list)
-    for charges_same_id in oid_to_charges.values():
-        if len(charges_same_id) == 1:
-            continue
-
-        # Expanding all combinations does not scale, so short-circuit out order ids that have a high unmatched count
-        if len(charges_same_id) > args.max_unmatched_charges_combinations:
-            continue
-
-        combos = []
-        for r in range(2, len(charges_same_id) + 1):
-            combos.extend(itertools.combinations(charges_same_id, r))
-        for c in combos:
-            charges_total = sum([charge.transact_amount() for charge in c])
-            amount_to_charges[charges_total].append(c)
-
-    for t in unmatched_trans:
-        mark_best_as_matched(t, amount_to_charges[t.amount], args, progress)
+    with match_stats.measure("combos", unmatched_trans) as record:
+        amount_to_charges = index_charge_combinations(
+            unmatched_trans, unmatched_charges, args, min_size=2, pool=pool
+        )
+        record(amount_to_charges)
+        assign_matches(unmatched_trans, amount_to_charges, args, progress)
 
 
+@register_matcher("single_pass_all_combos")
 def match_transactions_single_pass_all_combos(
-    unmatched_trans, unmatched_charges, args, progress=None
+    unmatched_trans,
+    unmatched_charges,
+    args,
+    progress=None,
+    match_stats=NO_MATCH_STATS,
+    pool=None,
 ):
     # Match up transactions to a combination of charges (sometimes they are charged together).
-    oid_to_charges = defaultdict(list)
-    for c in unmatched_charges:
-        oid_to_charges[c.order_id()].append(c)
-
-    amount_to_charges = defaultdict(list)
-    for charges_same_id in oid_to_charges.values():
-        # Expanding all combinations does not scale, so short-circuit out order ids that have a high unmatched count
-        if len(charges_same_id) > args.max_unmatched_charges_combinations:
-            continue
-
-        combos = []
-        for r in range(1, len(charges_same_id) + 1):
-            combos.extend(itertools.combinations(charges_same_id, r))
-        for c in combos:
-            charges_total = sum([charge.transact_amount() for charge in c])
-            amount_to_charges[charges_total].append(c)
-
-    for t in unmatched_trans:
-        mark_best_as_matched(t, amount_to_charges[t.amount], args, progress)
+    with match_stats.measure("all_combos", unmatched_trans) as record:
+        amount_to_charges = index_charge_combinations(
+            unmatched_trans, unmatched_charges, args, min_size=1, pool=pool
+        )
+        record(amount_to_charges)
+        assign_matches(unmatched_trans, amount_to_charges, args, progress)
 
 
+@register_matcher("orig_with_shipment_merge1")
 def match_transactions_orig_with_shipment_merge1(
-    unmatched_trans, unmatched_charges, args, progress=None
+    unmatched_trans,
+    unmatched_charges,
+    args,
+    progress=None,
+    match_stats=NO_MATCH_STATS,
+    pool=None,
 ):
     # THIS IS NOT ALWAYS THE CASE: I HAVE FOUND A CASE WERE THE SHIPMENT ITEM AMOUNTS WERE ACTUALLY SPLIT INTO TWO CC CHARGES FOR THE SAME CARD FOR AN ORDER THAT SHIPPED IN ONE BOX.
     # Merge charges if both the order id and the shipment item amount + shipment item tax align with total owed.
@@ -668,7 +1040,11 @@ def match_transactions_orig_with_shipment_merge1(
     for c in unmatched_charges:
         for i in c.items:
             oid_to_items[
-                (i.order_id, i.shipment_item_subtotal, i.shipment_item_subtotal_tax)
+                (
+                    i.order_id,
+                    exact_amount(i.shipment_item_subtotal),
+                    exact_amount(i.shipment_item_subtotal_tax),
+                )
             ].append(i)
 
     unmatched_charges.clear()
@@ -699,11 +1075,24 @@ def match_transactions_orig_with_shipment_merge1(
             # Something doesn't match up (could be same charge but two different shipments).
             # These will be cleaned up later with the combo matching logic per same order.
             unmatched_charges.extend([amazon.Charge([i]) for i in items_same_id])
-    match_transactions_orig(unmatched_trans, unmatched_charges, args, progress=None)
+    match_transactions_orig(
+        unmatched_trans,
+        unmatched_charges,
+        args,
+        progress=None,
+        match_stats=match_stats,
+        pool=pool,
+    )
 
 
+@register_matcher("orig_with_shipment_merge2")
 def match_transactions_orig_with_shipment_merge2(
-    unmatched_trans, unmatched_charges, args, progress=None
+    unmatched_trans,
+    unmatched_charges,
+    args,
+    progress=None,
+    match_stats=NO_MATCH_STATS,
+    pool=None,
 ):
     # THIS IS NOT ALWAYS THE CASE: I HAVE FOUND A CASE WERE THE SHIPMENT ITEM AMOUNTS WERE ACTUALLY SPLIT INTO TWO CC CHARGES FOR THE SAME CARD FOR AN ORDER THAT SHIPPED IN ONE BOX.
     # Merge charges if both the order id and the shipment item amount + shipment item tax align with total owed.
@@ -715,7 +1104,11 @@ def match_transactions_orig_with_shipment_merge2(
     for c in unmatched_charges:
         for i in c.items:
             oid_to_items[
-                (i.order_id, i.shipment_item_subtotal, i.shipment_item_subtotal_tax)
+                (
+                    i.order_id,
+                    exact_amount(i.shipment_item_subtotal),
+                    exact_amount(i.shipment_item_subtotal_tax),
+                )
             ].append(i)
 
     unmatched_charges.clear()
@@ -727,7 +1120,10 @@ def match_transactions_orig_with_shipment_merge2(
         items_by_shipment = defaultdict(list)
         for i in items_same_id:
             items_by_shipment[
-                (i.shipment_item_subtotal, i.shipment_item_subtotal_tax)
+                (
+                    exact_amount(i.shipment_item_subtotal),
+                    exact_amount(i.shipment_item_subtotal_tax),
+                )
             ].append(i)
 
         for items in items_by_shipment.values():
@@ -746,48 +1142,250 @@ def match_transactions_orig_with_shipment_merge2(
             else:
                 unmatched_charges.extend([amazon.Charge([i]) for i in items_same_id])
 
-    match_transactions_orig(unmatched_trans, unmatched_charges, args, progress=None)
+    match_transactions_orig(
+        unmatched_trans,
+        unmatched_charges,
+        args,
+        progress=None,
+        match_stats=match_stats,
+        pool=pool,
+    )
 
 
-def match_transactions(unmatched_trans, unmatched_charges, args, progress=None):
+def match_transactions(
+    unmatched_trans,
+    unmatched_charges,
+    args,
+    progress=None,
+    match_stats=NO_MATCH_STATS,
+    pool=None,
+):
     # Also works with Refund objects.
     # First pass: Match up transactions that exactly equal an order's charged
     # amount.
-    amount_to_charges = defaultdict(list)
-
-    for c in unmatched_charges:
-        amount_to_charges[c.transact_amount()].append([c])
-
-    for t in unmatched_trans:
-        mark_best_as_matched(t, amount_to_charges[t.amount], args, progress)
+    with match_stats.measure("singles", unmatched_trans) as record:
+        amount_to_charges = ChargeGroupIndex()
+        for c in unmatched_charges:
+            amount_to_charges.add(c.transact_amount(), [c])
+        record(amount_to_charges)
+        assign_matches(unmatched_trans, amount_to_charges, args, progress)
 
     unmatched_charges = [c for c in unmatched_charges if not c.matched]
     unmatched_trans = [t for t in unmatched_trans if not t.charges]
 
     # Second pass: Match up transactions to a combination of charges (sometimes
     # they are charged together).
-    oid_to_charges = defaultdict(list)
-    for c in unmatched_charges:
-        oid_to_charges[c.order_id()].append(c)
+    with match_stats.measure("combos", unmatched_trans) as record:
+        amount_to_charges = index_charge_combinations(
+            unmatched_trans, unmatched_charges, args, min_size=2, pool=pool
+        )
+        record(amount_to_charges)
+        assign_matches(unmatched_trans, amount_to_charges, args, progress)
 
-    amount_to_charges = defaultdict(list)
-    for charges_same_id in oid_to_charges.values():
-        if len(charges_same_id) == 1:
-            continue
 
-        # Expanding all combinations does not scale, so short-circuit out order ids that have a high unmatched count
-        if len(charges_same_id) > args.max_unmatched_charges_combinations:
-            continue
+def learned_instrument_accounts(args):
+    """Returns payment instrument -> account id for --partition_by_account."""
+    if not args.partition_by_account:
+        return {}
+    if not args.match_ledger:
+        logger.warning(
+            "--partition_by_account learns from past matches; it needs --match_ledger."
+        )
+        return {}
+    with ledger.MatchLedger(args.match_ledger_path) as match_ledger:
+        return match_ledger.instrument_accounts()
 
-        combos = []
-        for r in range(2, len(charges_same_id) + 1):
-            combos.extend(itertools.combinations(charges_same_id, r))
-        for c in combos:
-            charges_total = sum([charge.transact_amount() for charge in c])
-            amount_to_charges[charges_total].append(c)
 
-    for t in unmatched_trans:
-        mark_best_as_matched(t, amount_to_charges[t.amount], args, progress)
+def partition_by_account(trans, charges, instrument_accounts):
+    """Splits transactions and charges by Monarch Money account.
+
+    A charge goes to the account its payment instruments map to in
+    instrument_accounts (see MatchLedger.instrument_accounts); a transaction
+    to its own account. Returns ({account id: (trans, charges)}, other trans,
+    other charges). Charges with unknown instruments, or instruments of
+    different accounts, and transactions of accounts without any charges are
+    left for the others.
+    """
+    partitions = {}
+    other_charges = []
+    for c in charges:
+        accounts = set(
+            instrument_accounts[pit]
+            for pit in c.payment_instrument_types()
+            if pit in instrument_accounts
+        )
+        if len(accounts) == 1:
+            partitions.setdefault(accounts.pop(), ([], []))[1].append(c)
+        else:
+            other_charges.append(c)
+
+    other_trans = []
+    for t in trans:
+        account_id = t.account.id if t.account else None
+        if account_id in partitions:
+            partitions[account_id][0].append(t)
+        else:
+            other_trans.append(t)
+    return partitions, other_trans, other_charges
+
+
+def match_by_account(
+    trans,
+    charges,
+    args,
+    matcher,
+    instrument_accounts,
+    progress=None,
+    match_stats=NO_MATCH_STATS,
+    pool=None,
+):
+    """Runs matcher for each account's transactions and charges (see
+    partition_by_account), then once more on everything left unmatched.
+
+    Each partition has far fewer candidates than the whole. The last pass
+    catches new cards, and charges paid from an unexpected account. Like the
+    matchers, this replaces the contents of charges.
+    """
+    partitions, rest_trans, rest_charges = partition_by_account(
+        trans, charges, instrument_accounts
+    )
+    logger.info(
+        f"Matching {len(trans) - len(rest_trans)} transactions in "
+        f"{len(partitions)} accounts first, then {len(rest_trans)} others."
+    )
+    matched_charges = []
+    for account_id in sorted(partitions):
+        account_trans, account_charges = partitions[account_id]
+        matcher(account_trans, account_charges, args, progress, match_stats, pool)
+        matched_charges.extend(c for c in account_charges if c.matched)
+        rest_trans.extend(t for t in account_trans if not t.charges)
+        rest_charges.extend(c for c in account_charges if not c.matched)
+
+    # Matchers take transactions in date order.
+    trans_order = {id(t): index for index, t in enumerate(trans)}
+    rest_trans.sort(key=lambda t: trans_order[id(t)])
+    matcher(rest_trans, rest_charges, args, progress, match_stats, pool)
+    charges[:] = matched_charges + rest_charges
+
+
+def report_match_stats(match_stats, args, stats):
+    stats.update(match_stats.counter())
+    for p in match_stats.passes:
+        logger.info(
+            f"Matching pass {p['name']}: {p['matches']} matches from "
+            f"{p['candidate_groups']} candidate groups "
+            f"({p['combinations']} combinations, {p['orders_over_cap']} orders "
+            f"over the combinations cap) in {p['seconds']:.3f}s"
+        )
+    if args.match_stats_json:
+        with open(args.match_stats_json, "w") as f:
+            json.dump(match_stats.to_json(), f, indent=2)
+
+
+MatcherReport = namedtuple(
+    "MatcherReport",
+    field_names=[
+        "matcher",
+        "matched_trans",
+        "unmatched_trans",
+        "matched_charges",
+        "unmatched_charges",
+        "conflicts",
+        "seconds",
+        "peak_bytes",
+    ],
+)
+
+
+def compare_matchers(trans, charges, args, names=None, pool=None):
+    """Runs each matcher (all registered, by default) on the same inputs.
+
+    Every run gets its own deep copy of trans and charges, so the inputs are
+    left untouched. Returns a MatcherReport per matcher.
+    """
+    reports = []
+    for name in names or MATCHERS:
+        matcher = MATCHERS[name]
+        run_trans, run_charges = copy.deepcopy((trans, charges))
+        # Seconds are measured while tracing allocations, so they are inflated
+        # alike for every matcher: compare them with each other, not with
+        # untraced runs.
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        try:
+            start = time.perf_counter()
+            matcher(run_trans, run_charges, args, pool=pool)
+            seconds = time.perf_counter() - start
+            _, peak_bytes = tracemalloc.get_traced_memory()
+        finally:
+            if not was_tracing:
+                tracemalloc.stop()
+
+        matched_trans = [t for t in run_trans if t.charges]
+        reports.append(
+            MatcherReport(
+                matcher=name,
+                matched_trans=len(matched_trans),
+                unmatched_trans=len(run_trans) - len(matched_trans),
+                matched_charges=len([c for c in run_charges if c.matched]),
+                unmatched_charges=len([c for c in run_charges if not c.matched]),
+                conflicts=count_conflicts(matched_trans),
+                seconds=seconds,
+                peak_bytes=peak_bytes,
+            )
+        )
+    return reports
+
+
+def count_conflicts(matched_trans):
+    """Counts matched transactions that share a charge with another one, or
+    whose charges do not add up to the transaction amount."""
+    claims = Counter(id(c) for t in matched_trans for c in t.charges)
+    return len(
+        [
+            t
+            for t in matched_trans
+            if any(claims[id(c)] > 1 for c in t.charges)
+            or sum(c.transact_amount() for c in t.charges) != t.amount
+        ]
+    )
+
+
+def format_matcher_reports(reports):
+    header = (
+        "Matcher",
+        "Trans matched",
+        "Trans unmatched",
+        "Charges matched",
+        "Charges unmatched",
+        "Conflicts",
+        "Seconds",
+        "Peak KiB",
+    )
+    rows = [header] + [
+        (
+            r.matcher,
+            str(r.matched_trans),
+            str(r.unmatched_trans),
+            str(r.matched_charges),
+            str(r.unmatched_charges),
+            str(r.conflicts),
+            f"{r.seconds:.3f}",
+            str(r.peak_bytes // 1024),
+        )
+        for r in reports
+    ]
+    widths = [max(len(row[col]) for row in rows) for col in range(len(header))]
+    lines = [
+        "  ".join(
+            cell.ljust(width) if col == 0 else cell.rjust(width)
+            for col, (cell, width) in enumerate(zip(row, widths))
+        )
+        for row in rows
+    ]
+    return "\nMatcher comparison:\n" + "\n".join(lines)
 
 
 def print_dry_run(orig_trans_to_tagged, ignore_category=False):
@@ -799,15 +1397,7 @@ def print_dry_run(orig_trans_to_tagged, ignore_category=False):
             f"Invoice URL: {amazon.get_invoice_url(oid)}"
         )
 
-        if orig_trans.children:
-            for i, trans in enumerate(orig_trans.children):
-                print(
-                    "{}{}) Current: \t{}".format(
-                        "\n" if i == 0 else "", i + 1, trans.dry_run_str()
-                    )
-                )
-        else:
-            print(f"\nCurrent: \t{orig_trans.dry_run_str()}")
+        print(f"\nCurrent: \t{orig_trans.dry_run_str()}")
 
         if len(new_trans) == 1:
             trans = new_trans[0]
@@ -1,3 +1,583 @@
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import datetime
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+import zipfile
+
+from monarchmoneyamazontagger import amazon
+from monarchmoneyamazontagger import amazon_export
+from monarchmoneyamazontagger import tagger
+from monarchmoneyamazontagger import worker_pool
+from monarchmoneyamazontagger.args import (
+    DEFAULT_MATCHER,
+    MATCHER_NAMES,
+    define_cli_args,
+)
+from monarchmoneyamazontagger.mockdata import (
+    item,
+    order_history_csv,
+    order_history_row,
+    transaction,
+    transaction_json,
+)
+from monarchmoneyamazontagger.worker_pool import WorkerPool
+
+
+def parse_args(*argv):
+    parser = argparse.ArgumentParser()
+    define_cli_args(parser)
+    return parser.parse_args(argv)
+
+
+def local_midnight(year, month, day):
+    return datetime.datetime(year, month, day).astimezone()
+
+
+class DateWindow(unittest.TestCase):
+    def test_no_window(self):
+        self.assertEqual(tagger.get_item_date_window(parse_args()), (None, None))
+
+    def test_since_until_with_margin(self):
+        args = parse_args(
+            "--since",
+            "2024-03-10",
+            "--until",
+            "2024-03-20",
+            "--max_days_between_payment_and_shipping",
+            "3",
+        )
+        since, until = tagger.get_item_date_window(args)
+        self.assertEqual(since, local_midnight(2024, 3, 7))
+        self.assertEqual(until, local_midnight(2024, 3, 21))
+
+        items = list(
+            amazon.Item.parse_from_csv(
+                io.BytesIO(
+                    order_history_csv(
+                        [order_history_row(**{"Order Date": "2024-01-05T12:00:00Z"})]
+                    )
+                )
+            )
+        )
+        self.assertEqual(
+            tagger.get_transaction_date_window(args, items, since, until),
+            (datetime.date(2024, 3, 7), datetime.date(2024, 3, 24)),
+        )
+        # Without a window, start from the oldest order.
+        self.assertEqual(
+            tagger.get_transaction_date_window(args, items, None, None),
+            (datetime.date(2024, 1, 5), None),
+        )
+
+    def test_since_last_run_when_later(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            state_path = os.path.join(tmp_dir, "state.json")
+            item = amazon.Item.parse_from_csv(
+                io.BytesIO(
+                    order_history_csv(
+                        [order_history_row(**{"Ship Date": "2024-06-01T00:00:00Z"})]
+                    )
+                )
+            )
+            amazon_export.save_high_water_mark(state_path, list(item))
+            args = parse_args(
+                "--since",
+                "2024-01-01",
+                "--since_last_run",
+                "--tagger_state_path",
+                state_path,
+            )
+            since, _ = tagger.get_item_date_window(args)
+            self.assertEqual(
+                since, datetime.datetime(2024, 5, 27, tzinfo=datetime.timezone.utc)
+            )
+
+
+class FakeMonarchMoneyClient:
+    """Serves categories and transactions JSON, like mmclient does."""
+
+    def __init__(self, categories, transactions):
+        self.categories = categories
+        self.transactions = transactions
+
+    async def get_categories(self):
+        return self.categories
+
+    async def get_transactions(self, start_date, end_date, progress_factory=None):
+        return self.transactions
+
+
+class CreateUpdates(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.export_path = os.path.join(self.tmp_dir.name, "export.zip")
+        with zipfile.ZipFile(self.export_path, "w") as zip_file:
+            zip_file.writestr(
+                "Retail.OrderHistory.1/Retail.OrderHistory.1.csv",
+                order_history_csv([order_history_row()]),
+            )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def create_updates(self, mmc, *argv):
+        args = parse_args("--amazon_export", self.export_path, *argv)
+        for export_zip in args.amazon_export:
+            export_zip.close()
+        criticals = []
+        results = tagger.create_updates(args, mmc, criticals.append)
+        self.assertEqual(criticals, [])
+        return results
+
+    def test_empty_window_is_not_critical(self):
+        results = self.create_updates(None, "--since", "2030-01-01")
+        self.assertTrue(results.success)
+        self.assertEqual(results.items, [])
+        self.assertEqual(results.updates, [])
+
+    def test_transactions_json_to_updates(self):
+        mmc = FakeMonarchMoneyClient(
+            [{"id": "cat-shopping", "name": "Shopping"}],
+            [
+                transaction_json(id="amazon"),
+                # Same amount and date, but neither from Amazon nor settled.
+                transaction_json(
+                    id="grocer",
+                    plaidName="SAFEWAY #123",
+                    merchant={"id": "m2", "name": "Safeway"},
+                ),
+                transaction_json(id="pending", pending=True),
+            ],
+        )
+
+        results = self.create_updates(mmc)
+
+        self.assertTrue(results.success)
+        self.assertEqual(results.stats["amazon_in_desc"], 2)
+        self.assertEqual(results.stats["pending"], 1)
+        self.assertEqual(results.stats["new_tag"], 1)
+        self.assertEqual(len(results.updates), 1)
+        orig_trans, new_trans = results.updates[0]
+        self.assertEqual(orig_trans.id, "amazon")
+        self.assertEqual(len(new_trans), 1)
+        self.assertEqual(new_trans[0].merchant.name, "Amazon.com: 2x Duracell AAs")
+        self.assertEqual(new_trans[0].amount, orig_trans.amount)
+        self.assertEqual(new_trans[0].category.id, "cat-shopping")
+        self.assertIn("123-3211232-7655671", new_trans[0].notes)
+
+    def test_user_description_filter(self):
+        mmc = FakeMonarchMoneyClient(
+            [],
+            [
+                transaction_json(
+                    id="renamed",
+                    plaidName="DEBIT CARD PURCHASE",
+                    merchant={"id": "m1", "name": "Amazon"},
+                )
+            ],
+        )
+        self.assertEqual(self.create_updates(mmc).updates, [])
+
+        results = self.create_updates(mmc, "--mm_input_include_user_description")
+        self.assertEqual([t.id for t, _ in results.updates], ["renamed"])
+
+
+class ExcludeSettled(unittest.TestCase):
+    def test_leaves_out_ledger_matches(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "ledger.sqlite")
+            settled = item(**{"Order ID": "settled"})
+            new = item(**{"Order ID": "new"})
+            t = transaction(id="1")
+            t.match([amazon.Charge([settled])])
+            args = parse_args("--match_ledger", "--match_ledger_path", path)
+            tagger.record_successful_run(
+                parse_args(
+                    "--match_ledger",
+                    "--match_ledger_path",
+                    path,
+                    "--tagger_state_path",
+                    os.path.join(tmp_dir, "state.json"),
+                ),
+                [settled, new],
+                [t],
+            )
+
+            stats = {}
+            self.assertEqual(
+                tagger.exclude_settled(args, [settled, new], stats), ([new], {"1"})
+            )
+            self.assertEqual(stats["ledger_settled_items"], 1)
+
+            # Retagging needs the earlier matches.
+            retag_args = parse_args(
+                "--match_ledger", "--match_ledger_path", path, "--retag_changed"
+            )
+            self.assertEqual(
+                tagger.exclude_settled(retag_args, [settled, new], {}),
+                ([settled, new], set()),
+            )
+
+            rebuild_args = parse_args(
+                "--match_ledger", "--match_ledger_path", path, "--rebuild_match_ledger"
+            )
+            self.assertEqual(
+                tagger.exclude_settled(rebuild_args, [settled, new], {}),
+                ([settled, new], set()),
+            )
+
+    def test_settled_trans_still_teach_categories(self):
+        tagged = transaction(
+            id="settled",
+            amount=-5.00,
+            date="2014-01-10",
+            merchant={"id": "m1", "name": "Amazon.com: 2x Duracell AAs"},
+            category={"id": "c1", "name": "Electronics"},
+        )
+        new = item()
+        stats = Counter()
+        updates, _, _ = tagger.get_mint_updates(
+            [new],
+            [amazon.Charge([new])],
+            [tagged, transaction(id="new")],
+            parse_args(),
+            stats,
+            [],
+            settled_trans_ids={"settled"},
+        )
+        self.assertEqual(stats["ledger_settled_trans"], 1)
+        self.assertEqual(stats["personal_cat"], 1)
+        ((t, new_trans),) = updates
+        self.assertEqual(t.id, "new")
+        self.assertEqual(new_trans[0].category.name, "Electronics")
+
+
+class MatchTransactions(unittest.TestCase):
+    def test_single_and_combined_charges(self):
+        single = amazon.Charge([item(**{"Order ID": "A"})])
+        half_a = amazon.Charge([item(**{"Order ID": "B", "Total Owed": "5.00"})])
+        half_b = amazon.Charge([item(**{"Order ID": "B", "Total Owed": "7.50"})])
+        unrelated = amazon.Charge([item(**{"Order ID": "C", "Total Owed": "99.00"})])
+        # Within MICRO_USD_EPS of the order's total, but in the next cent bucket
+        # down (-11.95002 vs -11.95), so the lookup has to probe both.
+        t_single = transaction(id="1", amount=-11.95002)
+        t_combo = transaction(id="2", amount=-12.50)
+        t_none = transaction(id="3", amount=-1.00)
+
+        tagger.match_transactions_orig(
+            [t_single, t_combo, t_none],
+            [single, half_a, half_b, unrelated],
+            parse_args(),
+        )
+
+        self.assertEqual(t_single.charges, [single])
+        self.assertCountEqual(t_combo.charges, (half_a, half_b))
+        self.assertEqual(t_none.charges, [])
+        self.assertEqual(single.trans_id, "1")
+        self.assertFalse(unrelated.matched)
+
+    def charge(self, amount, ship_date="2014-02-28"):
+        return amazon.Charge(
+            [
+                item(
+                    **{
+                        "Order ID": "A",
+                        "Total Owed": amount,
+                        "Ship Date": f"{ship_date}T12:00:00Z",
+                    }
+                )
+            ]
+        )
+
+    def test_combination_shipped_in_window(self):
+        # Both pairs add up to 15, but only the one shipped 2/28 is in the
+        # payment's window.
+        late = [self.charge("10.00", "2014-03-20"), self.charge("5.00", "2014-03-20")]
+        early = [self.charge("10.00"), self.charge("5.00")]
+        t = transaction(amount=-15, date="2014-03-01")
+
+        tagger.match_transactions_orig([t], late + early, parse_args())
+
+        self.assertCountEqual(t.charges, early)
+
+    def test_combinations_with_the_same_total(self):
+        charges = [self.charge(a) for a in ("10.00", "10.00", "5.00", "5.00")]
+        trans = [transaction(id=str(i), amount=-15) for i in range(2)]
+
+        tagger.match_transactions_orig(trans, charges, parse_args())
+
+        self.assertEqual([len(t.charges) for t in trans], [2, 2])
+        self.assertTrue(all(c.matched for c in charges))
+
+
+class GetMintUpdatesFilters(unittest.TestCase):
+    def filter_stats(self, trans, *argv):
+        stats = {}
+        tagger.get_mint_updates([], [], trans, parse_args(*argv), stats, [])
+        return stats
+
+    def test_mm_input_filters(self):
+        trans = [
+            transaction(id="amazon"),
+            transaction(id="pending", pending=True),
+            transaction(
+                id="grocer",
+                plaidName="SAFEWAY #123",
+                merchant={"id": "m2", "name": "Safeway"},
+            ),
+            transaction(
+                id="renamed",
+                plaidName="DEBIT CARD PURCHASE",
+                merchant={"id": "m1", "name": "Amazon"},
+            ),
+            # Manually added: no plaidName, so the merchant name is used.
+            transaction(id="manual", plaidName=None),
+        ]
+
+        stats = self.filter_stats(trans)
+        self.assertEqual(stats["amazon_in_desc"], 3)
+        self.assertEqual(stats["pending"], 1)
+
+        stats = self.filter_stats(trans, "--mm_input_include_user_description")
+        self.assertEqual(stats["amazon_in_desc"], 4)
+
+        stats = self.filter_stats(trans, "--mm_input_description_filter", "safeway")
+        self.assertEqual(stats["amazon_in_desc"], 1)
+        self.assertEqual(stats["pending"], 0)
+
+    def test_category_filter_skips_uncategorized(self):
+        trans = [transaction(id="shopping"), transaction(id="none", category=None)]
+        stats = self.filter_stats(trans, "--mm_input_categories_filter", "shopping")
+        self.assertEqual(stats["amazon_in_desc"], 2)
+        self.assertEqual(stats["trans_unmatch"], 1)
+
+
+class MarkBestAsMatched(unittest.TestCase):
+    def charge(self, order_id, ship_date):
+        return amazon.Charge(
+            [item(**{"Order ID": order_id, "Ship Date": f"{ship_date}T12:00:00Z"})]
+        )
+
+    def test_closest_unmatched_in_window(self):
+        args = parse_args("--max_days_between_payment_and_shipping", "3")
+        charges = [
+            self.charge("too old", "2014-02-20"),
+            self.charge("older", "2014-02-25"),
+            self.charge("closest", "2014-02-27"),
+            self.charge("closest tie", "2014-02-27"),
+            self.charge("after", "2014-03-01"),
+        ]
+        unshipped = amazon.Charge([item(**{"Order ID": "u", "Ship Date": ""})])
+        index = tagger.ChargeGroupIndex()
+        for c in charges + [unshipped]:
+            index.add(c.transact_amount(), [c])
+
+        matched_order_ids = []
+        for trans_id in range(4):
+            t = transaction(id=str(trans_id), date="2014-02-28")
+            tagger.mark_best_as_matched(t, index, args)
+            matched_order_ids.append(t.charges[0].order_id() if t.charges else None)
+
+        self.assertEqual(matched_order_ids, ["closest", "closest tie", "older", None])
+
+
+class AssignmentEngines(unittest.TestCase):
+    def match(self, engine):
+        args = parse_args(
+            "--max_days_between_payment_and_shipping",
+            "3",
+            "--assignment_engine",
+            engine,
+        )
+        early = amazon.Charge(
+            [item(**{"Order ID": "early", "Ship Date": "2014-02-20T12:00:00Z"})]
+        )
+        late = amazon.Charge(
+            [item(**{"Order ID": "late", "Ship Date": "2014-02-22T12:00:00Z"})]
+        )
+        first = transaction(id="first", date="2014-02-22")
+        second = transaction(id="second", date="2014-02-24")
+        tagger.match_transactions_orig([first, second], [early, late], args)
+        return [t.charges[0].order_id() if t.charges else None for t in (first, second)]
+
+    def test_greedy_lets_first_take_closest(self):
+        self.assertEqual(self.match("greedy"), ["late", None])
+
+    def test_optimal_matches_both(self):
+        self.assertEqual(self.match("optimal"), ["early", "late"])
+
+
+class IndexChargeCombinations(unittest.TestCase):
+    def setUp(self):
+        self.charges = [
+            amazon.Charge(
+                [item(**{"Order ID": f"order-{order}", "Total Owed": f"{amount}.00"})]
+            )
+            for order in range(6)
+            for amount in (3, 4, 5, 7)
+        ]
+        self.trans = [
+            transaction(id=str(amount), amount=-amount) for amount in (7, 9, 12, 16)
+        ]
+
+    def index(self, num_workers):
+        with WorkerPool(num_workers) as pool, mock.patch.object(
+            tagger, "MIN_COMBINATION_ORDERS_PER_WORKER", 1
+        ):
+            index = tagger.index_charge_combinations(
+                self.trans, self.charges, parse_args(), pool=pool
+            )
+        return [
+            (days, group_id, [self.charges.index(c) for c in group])
+            for t in self.trans
+            for days, group_id, group in index.candidates(t, 3)
+        ]
+
+    def test_same_for_any_number_of_workers(self):
+        serial = self.index(1)
+        # 7 = 3+4, 9 = 4+5, 12 = 3+4+5 or 5+7, 16 = 4+5+7.
+        self.assertEqual(len(serial), 6 * 5)
+        self.assertEqual(self.index(3), serial)
+
+    def test_one_pool_for_all_passes(self):
+        with mock.patch.object(
+            worker_pool, "ProcessPoolExecutor", wraps=ProcessPoolExecutor
+        ) as new_executor, mock.patch.object(
+            tagger, "MIN_COMBINATION_ORDERS_PER_WORKER", 1
+        ):
+            with WorkerPool(2) as pool:
+                reports = tagger.compare_matchers(
+                    self.trans, self.charges, parse_args(), pool=pool
+                )
+        self.assertEqual(new_executor.call_count, 1)
+        self.assertEqual(len(reports), len(MATCHER_NAMES))
+
+    def test_no_processes_for_few_orders(self):
+        with mock.patch.object(worker_pool, "ProcessPoolExecutor") as new_executor:
+            with WorkerPool(2) as pool:
+                tagger.index_charge_combinations(
+                    self.trans, self.charges, parse_args(), pool=pool
+                )
+        new_executor.assert_not_called()
+
+
+class MatchByAccount(unittest.TestCase):
+    def charge(self, order_id, instrument):
+        return amazon.Charge(
+            [item(**{"Order ID": order_id, "Payment Instrument Type": instrument})]
+        )
+
+    def trans(self, trans_id, account_id):
+        return transaction(
+            id=trans_id, account={"id": account_id, "displayName": account_id}
+        )
+
+    def test_partitions_then_fallback(self):
+        visa = self.charge("visa order", "Visa - 1234")
+        amex = self.charge("amex order", "Amex - 1111")
+        new_card = self.charge("new card order", "Discover - 2222")
+        # All of the same amount and date: only the accounts tell them apart.
+        t_amex = self.trans("amex", "amex account")
+        t_visa = self.trans("visa", "visa account")
+        t_other = self.trans("other", "discover account")
+        charges = [visa, amex, new_card]
+        instrument_accounts = {
+            "Visa - 1234": "visa account",
+            "Amex - 1111": "amex account",
+        }
+
+        partitions, rest_trans, rest_charges = tagger.partition_by_account(
+            [t_amex, t_visa, t_other], charges, instrument_accounts
+        )
+        self.assertEqual(
+            partitions,
+            {"visa account": ([t_visa], [visa]), "amex account": ([t_amex], [amex])},
+        )
+        self.assertEqual((rest_trans, rest_charges), ([t_other], [new_card]))
+
+        tagger.match_by_account(
+            [t_amex, t_visa, t_other],
+            charges,
+            parse_args(),
+            tagger.match_transactions_orig,
+            instrument_accounts,
+        )
+        self.assertEqual(t_amex.charges, [amex])
+        self.assertEqual(t_visa.charges, [visa])
+        self.assertEqual(t_other.charges, [new_card])
+        self.assertCountEqual(charges, [visa, amex, new_card])
+
+
+class CompareMatchers(unittest.TestCase):
+    def test_every_matcher_on_copies(self):
+        single = amazon.Charge([item(**{"Order ID": "A"})])
+        half_a = amazon.Charge([item(**{"Order ID": "B", "Total Owed": "5.00"})])
+        half_b = amazon.Charge([item(**{"Order ID": "B", "Total Owed": "7.50"})])
+        t_single = transaction(id="1", amount=-11.95)
+        t_combo = transaction(id="2", amount=-12.50)
+        trans = [t_single, t_combo]
+        charges = [single, half_a, half_b]
+
+        reports = tagger.compare_matchers(trans, charges, parse_args())
+
+        self.assertEqual([r.matcher for r in reports], list(tagger.MATCHERS))
+        by_name = {r.matcher: r for r in reports}
+        self.assertEqual(by_name["orig"].matched_trans, 2)
+        self.assertEqual(by_name["orig"].matched_charges, 3)
+        self.assertEqual(by_name["single_pass_singletons"].matched_trans, 1)
+        self.assertEqual(by_name["single_pass_singletons"].unmatched_charges, 2)
+        for r in reports:
+            self.assertEqual(r.conflicts, 0)
+            self.assertGreater(r.peak_bytes, 0)
+        # The inputs themselves are left as they were.
+        self.assertEqual(t_single.charges, [])
+        self.assertFalse(single.matched)
+        self.assertEqual(charges, [single, half_a, half_b])
+
+    def test_conflicts(self):
+        charge = amazon.Charge([item()])
+        t1 = transaction(id="1", amount=-11.95)
+        t2 = transaction(id="2", amount=-11.95)
+        t3 = transaction(id="3", amount=-20.00)
+        t1.match([charge])
+        t2.match([charge])
+        t3.match([amazon.Charge([item(**{"Order ID": "B"})])])
+        self.assertEqual(tagger.count_conflicts([t1, t2, t3]), 3)
+
+    def test_matcher_arg(self):
+        self.assertEqual(list(tagger.MATCHERS), list(MATCHER_NAMES))
+        self.assertEqual(parse_args().matcher, DEFAULT_MATCHER)
+        self.assertEqual(parse_args("--matcher", "orig").matcher, "orig")
+
+    def test_light_imports(self):
+        # Pool workers import tagger to run find_order_combinations; neither it
+        # nor args should pull in the Monarch Money client.
+        def imported_by(module):
+            return subprocess.check_output(
+                [
+                    sys.executable,
+                    "-c",
+                    f"import sys, {module}; print(' '.join(sys.modules))",
+                ],
+                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                text=True,
+            ).split()
+
+        args_modules = imported_by("monarchmoneyamazontagger.args")
+        self.assertNotIn("monarchmoneyamazontagger.tagger", args_modules)
+        self.assertNotIn("monarchmoneyamazontagger.mmclient", args_modules)
+        tagger_modules = imported_by("monarchmoneyamazontagger.tagger")
+        self.assertNotIn("monarchmoneyamazontagger.mmclient", tagger_modules)
+        self.assertNotIn("monarchmoney", tagger_modules)
+
+
 # from collections import Counter
 # import unittest
 
@@ -375,3 +955,7 @@
 
 # if __name__ == '__main__':
 #     unittest.main()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+
+class WorkerPool:
+    """Worker processes shared by the parallel steps of a run (see
+    tagger.create_updates), so they are started at most once.
+
+    The processes are only started when a step first asks for the executor:
+    each step checks workers_for first, and runs in this process when it has
+    too little work to spread out.
+    """
+
+    def __init__(self, num_workers=None):
+        self.max_workers = num_workers or os.cpu_count() or 1
+        self._executor = None
+
+    def workers_for(self, num_tasks):
+        """How many workers num_tasks (independent units of work) can use."""
+        return min(self.max_workers, num_tasks)
+
+    def executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()